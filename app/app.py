@@ -1,10 +1,14 @@
 import sys
 import os
+import time
 import configparser
 import oracledb
 import json
 import logging
 import mce
+import prefork
+
+from capture import RequestRecorder
 
 from ast import literal_eval
 from sqlalchemy import URL, create_engine
@@ -14,6 +18,16 @@ from waitress import serve
 from werkzeug.exceptions import HTTPException
 
 
+def get_int(cfg, option, default):
+    value = cfg['other'].get(option, '')
+    return int(value) if value.strip() != '' else default
+
+
+def get_float(cfg, option, default):
+    value = cfg['other'].get(option, '')
+    return float(value) if value.strip() != '' else default
+
+
 def start_mce(config_filename):
     cfg = configparser.RawConfigParser()
     cfg.read(config_filename, encoding='utf-8')
@@ -35,10 +49,21 @@ def start_mce(config_filename):
 
     eg = create_engine(url, **kw)
 
-    check_interval = cfg['other'].get('check_interval', '')
-    check_interval = int(check_interval) if check_interval.strip() != '' else 600
+    mce.init(eg,
+             get_int(cfg, 'check_interval', 600),
+             sql_arraysize=get_int(cfg, 'sql_arraysize', 1000),
+             sql_cache_maxsize=get_int(cfg, 'sql_cache_maxsize', 128),
+             sql_cache_ttl_seconds=get_int(cfg, 'sql_cache_ttl_seconds', 600),
+             sync_interval=get_int(cfg, 'sync_interval', 0),
+             shared_cache_bytes=get_int(cfg, 'shared_cache_bytes', 0),
+             shared_cache_entries=get_int(cfg, 'shared_cache_entries', 1024),
+             trace_sample_rate=get_float(cfg, 'trace_sample_rate', 0),
+             trace_slow_seconds=get_float(cfg, 'trace_slow_seconds', 0),
+             trace_buffer_size=get_int(cfg, 'trace_buffer_size', 100),
+             calc_timeout_seconds=get_int(cfg, 'calc_timeout_seconds', 0),
+             schedule_enabled=get_int(cfg, 'schedule_enabled', 0) > 0)
 
-    mce.init(eg, check_interval)
+    return cfg
 
 
 app = Flask(__name__)
@@ -61,7 +86,16 @@ def run_mce_api(func_name):
     if not isinstance(kwargs, dict):
         raise TypeError('参数格式错误，需要字典格式！')
 
-    return mce.exec_api(func_name, **kwargs)
+    sampled = recorder is not None and recorder.is_sampled()
+    start_time = time.time()
+
+    code, ret = mce.exec_api_with_code(func_name, **kwargs)
+
+    if sampled:
+        recorder.record(func_name, kwargs, start_time, time.time() - start_time, code)
+    if func_name == 'reload':
+        prefork.request_reload()
+    return ret
 
 
 @app.errorhandler(HTTPException)
@@ -75,7 +109,13 @@ def framework_error(e):
 
 
 root_path = os.path.dirname(os.path.realpath(sys.argv[0]))
-start_mce(os.path.join(root_path, 'boot.ini'))
+config = start_mce(os.environ.get('MCE_BOOT_INI', os.path.join(root_path, 'boot.ini')))
+
+# 请求采样录制，配置了capture_file时开启
+recorder = None
+if config['other'].get('capture_file', '').strip() != '':
+    recorder = RequestRecorder(config['other']['capture_file'].strip(),
+                               get_float(config, 'capture_rate', 1))
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
@@ -88,4 +128,20 @@ if __name__ == '__main__':
                         datefmt='%Y-%m-%d %H:%M:%S')
     logging.info('MCE web application serving at %s:%s', host, port)
 
-    serve(app, host=host, port=port)
+    workers = get_int(config, 'workers', 0)
+    threads = get_int(config, 'threads', 4)
+    if workers > 1 and prefork.is_supported():
+        def reload_and_warm_up():
+            mce.reload(notify=False)
+            mce.warm_up()
+
+        errors = mce.warm_up()
+        for co_id, error in errors.items():
+            logging.warning('calc object %s warm up failed: %s', co_id, error)
+        mce.stop_schedule_ticking()
+
+        prefork.PreforkServer(app, host, port, workers, threads,
+                              max_requests=get_int(config, 'max_requests', 0),
+                              on_reload=reload_and_warm_up).run()
+    else:
+        serve(app, host=host, port=port, threads=threads)
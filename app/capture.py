@@ -0,0 +1,46 @@
+import os
+import json
+import random
+
+
+class RequestRecorder:
+    """
+    按比例采样/run请求，每个请求一行json写入文件，供回放工具（benchmarks/replay.py）重放
+    记录内容：请求时间、函数名、参数、耗时、返回码
+    """
+
+    def __init__(self, filename, rate=1.0):
+        self.__filename = filename
+        self.__rate = rate
+
+    @property
+    def filename(self):
+        return self.__filename
+
+    @property
+    def rate(self):
+        return self.__rate
+
+    def is_sampled(self):
+        return self.__rate >= 1 or random.random() < self.__rate
+
+    def record(self, func_name, kwargs, start_time, elapsed, code):
+        line = json.dumps({
+            'time': start_time,
+            'func_name': func_name,
+            'kwargs': kwargs,
+            'elapsed': elapsed,
+            'code': code
+        }, ensure_ascii=False, default=repr) + '\n'
+
+        # 整行编码后用一次write(2)写入O_APPEND打开的文件，多个线程、工作进程的记录不会交错；
+        # 带缓冲的文本文件写长行时会分成多次write，其他进程的记录可能插在中间
+        data = line.encode('utf-8')
+        fd = os.open(self.__filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            written = os.write(fd, data)
+            # 普通文件只在磁盘满等异常情况下才会写入不全
+            while written < len(data):
+                written += os.write(fd, data[written:])
+        finally:
+            os.close(fd)
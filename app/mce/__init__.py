@@ -1,16 +1,27 @@
+import os
 import inspect
 import json
 
 from concurrent.futures import ProcessPoolExecutor
 
-from .db_models import create_tables, MceCalcObjectInfo
+from .db_models import create_tables, MceCalcObjectInfo, MceSchedule
 from .db_operator import DBOperator
-from .code_parser import CalcObjectManager
+from .code_parser import CalcObjectManager, CalcTimeoutError
+from .sql_reader import SqlReader
+from .change_feed import ChangeFeed
+from .shared_cache import SharedResultStore
+from .scheduler import Scheduler, CronRule
+from .file_ledger import FileLedger
 
 _version = '3.0.0'
 
 _db_operator: DBOperator
 _calc_object_manager: CalcObjectManager
+_sql_reader: SqlReader
+_change_feed = None
+_schedule_operator: DBOperator
+_scheduler: Scheduler
+_file_ledger: FileLedger
 _api = {}
 
 
@@ -22,23 +33,63 @@ def get_version():
     return _version
 
 
-def init(engine, cache_check_interval=60 * 10):
+def init(engine, cache_check_interval=60 * 10, sql_arraysize=1000, sql_cache_maxsize=128, sql_cache_ttl_seconds=60 * 10,
+         sync_interval=0, shared_cache_bytes=0, shared_cache_entries=1024,
+         trace_sample_rate=0.0, trace_slow_seconds=0.0, trace_buffer_size=100, calc_timeout_seconds=0,
+         schedule_enabled=False):
     """
     初始化计算引擎
     :param engine: sqlalchemy数据库引擎
     :param cache_check_interval: 缓存检查时间间隔
+    :param sql_arraysize: 内核函数read_sql每次从数据库取回的行数
+    :param sql_cache_maxsize: 内核函数read_sql结果缓存的最大数量
+    :param sql_cache_ttl_seconds: 内核函数read_sql结果缓存的最大时间，单位是-秒
+    :param sync_interval: 集群同步轮询间隔，单位是-秒，大于0时开启集群同步
+    :param shared_cache_bytes: 跨进程共享结果库的字节预算，大于0时开启，需在派生工作进程之前初始化
+    :param shared_cache_entries: 跨进程共享结果库的最大结果数
+    :param trace_sample_rate: execute调用的追踪采样比例，0-1之间
+    :param trace_slow_seconds: 慢调用阈值，单位是-秒，大于0时每次调用都记录各层耗时，超过阈值的调用连同调用树一起记录
+    :param trace_buffer_size: 追踪记录环形缓冲区大小
+    :param calc_timeout_seconds: execute的默认执行时限，单位是-秒，0表示不限时（计算对象自身设置的时限优先）
+    :param schedule_enabled: 是否开启定时预计算，开启后按计划表中的cron规则提前执行计算对象，预热缓存
     :return: None
 
     传入的engine确定了连接的数据库，若该库中没有计算对象信息表，会自动创建；若存在计算对象信息表，会把所有的计算对象加载到对象管理员实例中
     并且将外部调用函数发布到api函数列表中，供外部调用
+    开启集群同步后，本节点的增删改、清空缓存、重新加载会写入变更日志表，其他节点轮询该表并增量应用，保证各节点代码和缓存一致
     """
     create_tables(engine)
 
-    global _db_operator, _calc_object_manager
+    # fork出的子进程不能复用父进程连接池中的连接
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+    global _db_operator, _calc_object_manager, _sql_reader, _change_feed, _schedule_operator, _scheduler, _file_ledger
     _db_operator = DBOperator(engine, MceCalcObjectInfo)
     _calc_object_manager = CalcObjectManager(cache_check_interval)
 
-    reload()
+    _calc_object_manager.trace_log.configure(trace_sample_rate, trace_slow_seconds, trace_buffer_size)
+    _calc_object_manager.default_timeout_seconds = calc_timeout_seconds
+
+    # 只在隔离执行时序列化，经本进程创建的辅助进程的私有unix socket（0700的临时目录）传递，可以带上密码
+    _sql_reader = SqlReader(engine, sql_arraysize, sql_cache_maxsize, sql_cache_ttl_seconds, pickle_password=True)
+    _calc_object_manager.add_kernel_func('read_sql', _sql_reader.read_sql)
+
+    # 开启后，设置了缓存的计算对象返回DataFrame/ndarray时会存入共享内存，同一节点的各个进程零拷贝读取同一份结果
+    if shared_cache_bytes > 0:
+        _calc_object_manager.shared_store = SharedResultStore(shared_cache_bytes, shared_cache_entries)
+
+    # 先记录变更水位再加载，加载期间其他节点的变更会在下次轮询时再应用一次（应用是幂等的）
+    if sync_interval > 0:
+        _change_feed = ChangeFeed(engine, _apply_change, sync_interval)
+
+    _reload()
+
+    _schedule_operator = DBOperator(engine, MceSchedule)
+    # 开启共享结果库时一个节点执行一次，其他进程直接命中共享结果；否则每个进程各自预热
+    _scheduler = Scheduler(engine, _calc_object_manager.eval, schedule_enabled,
+                           scope='node' if shared_cache_bytes > 0 else 'process')
+    _file_ledger = FileLedger(engine)
 
     publish()
 
@@ -49,7 +100,8 @@ def _to_co_attr(params: dict):
         'py_code': 'python_code',
         'py_expr': 'python_expr',
         'lru_maxsize': 'lru_maxsize',
-        'ttl_seconds': 'ttl_seconds'
+        'ttl_seconds': 'ttl_seconds',
+        'timeout_seconds': 'timeout_seconds'
     }
     ret = {}
     for k, v in mapping.items():
@@ -73,6 +125,7 @@ def add(**kwargs):
         python_expr = Column(String(200))
         lru_maxsize = Column(Integer, default=0)
         ttl_seconds = Column(Integer, default=0)
+        timeout_seconds = Column(Integer, default=0)
         remark = Column(String(200))
         sort_number = Column(Integer, default=0)
 
@@ -84,11 +137,13 @@ def add(**kwargs):
         python_expr: python表达式，主要用于对象计算结果的返回，也可以称为返回结果表达式
         lru_maxsize: lru淘汰算法，最大缓存数量
         ttl_seconds: ttl淘汰算法，最大缓存时间，单位是-秒
+        timeout_seconds: 执行时限，单位是-秒，0表示不限时
         remark: 备注
         sort_number: 排序编号，用于显示的先后次序
     """
     _db_operator.add(**kwargs)
     _calc_object_manager.set(**_to_co_attr(kwargs))
+    _notify('object', kwargs['object_id'])
 
 
 def delete(object_id):
@@ -101,6 +156,7 @@ def delete(object_id):
     """
     ret = _db_operator.delete(MceCalcObjectInfo.object_id == object_id)
     _calc_object_manager.delete(object_id)
+    _notify('object', object_id)
     return ret
 
 
@@ -120,6 +176,7 @@ def update(object_id, **kwargs):
         python_expr = Column(String(200))
         lru_maxsize = Column(Integer, default=0)
         ttl_seconds = Column(Integer, default=0)
+        timeout_seconds = Column(Integer, default=0)
         remark = Column(String(200))
         sort_number = Column(Integer, default=0)
 
@@ -131,25 +188,49 @@ def update(object_id, **kwargs):
         python_expr: python表达式，主要用于对象计算结果的返回，也可以称为返回结果表达式
         lru_maxsize: lru淘汰算法，最大缓存数量
         ttl_seconds: ttl淘汰算法，最大缓存时间，单位是-秒
+        timeout_seconds: 执行时限，单位是-秒，0表示不限时
         remark: 备注
         sort_number: 排序编号，用于显示的先后次序
     """
     ret = _db_operator.update(MceCalcObjectInfo.object_id == object_id, **kwargs)
     if ret > 0:
-        coi = _db_operator.query(MceCalcObjectInfo.object_id == object_id)[0]
-        _calc_object_manager.set(**_to_co_attr(coi.to_dict()))
+        _sync_object(object_id)
+        _notify('object', object_id)
     return ret
 
 
-def query(**kwargs):
+def query(columns=None, order_by=None, limit=None, offset=None, after=None, updated_after=None, **kwargs):
     """
     查询计算对象
+    :param columns: 投影字段列表，如['object_id', 'object_name', 'parent_id', 'sort_number']，传入时返回字典列表
+    :param order_by: 排序字段列表，字段名前加'-'表示降序，如['sort_number', 'object_id']
+    :param limit: 返回记录数上限
+    :param offset: 跳过的记录数（偏移分页）
+    :param after: 上一页最后一条记录的排序字段值列表（键集分页），需与order_by一一对应；
+                  order_by中没有object_id时会追加object_id作为最后的排序字段，after的最后一个值为object_id
+    :param updated_after: 只返回last_updated_time晚于该时间的记录，支持iso格式字符串
     :param kwargs: 动态参数字典
     :return: 计算对象信息列表
 
     kwargs可传入相关条件，多个条件间的关系是：and，不传则返回全部记录
+    树形展示等场景建议只投影需要的字段，避免传输python_code大字段；
+    配合watermark函数可以实现条件刷新：水位没变化时无需重新查询
+    排序字段中的空值排在最后
     """
-    return _db_operator.query(*[getattr(MceCalcObjectInfo, k) == v for k, v in kwargs.items()])
+    criterion = [_db_operator.column(k) == _db_operator.coerce(k, v) for k, v in kwargs.items()]
+    if updated_after is not None:
+        criterion.append(MceCalcObjectInfo.last_updated_time > _db_operator.coerce('last_updated_time', updated_after))
+    return _db_operator.query(*criterion, header=limit, columns=columns, order_by=order_by, offset=offset, after=after)
+
+
+def watermark():
+    """
+    获得计算对象信息水位
+    :return: {'count': 记录数, 'last_updated_time': 最后修改时间}
+
+    只做一次聚合查询，开销很小；客户端保存上次的水位，水位不变则说明数据没有变化（记录数用于识别删除）
+    """
+    return _db_operator.watermark('last_updated_time')
 
 
 def get_params(object_id):
@@ -163,14 +244,41 @@ def get_params(object_id):
     return _calc_object_manager.get_params(object_id)
 
 
-def execute(object_id, **kwargs):
+def bulk_get_params(object_ids=None):
+    """
+    批量获得计算对象参数
+    :param object_ids: 计算对象编号列表，不传则返回所有计算对象的参数
+    :return: {对象编号: 参数列表}，获取失败的对象参数为None
+
+    参数来自创建计算对象时的静态分析，不执行代码块；只有代码块使用了exec、星号导入等无法静态确定的写法时才会执行代码块
+    """
+    return _calc_object_manager.bulk_get_params(object_ids)
+
+
+def get_signature(object_id):
+    """
+    获得计算对象的静态分析结果
+    :param object_id: 计算对象编号
+    :return: {'params': 参数列表, 'defined': 代码块定义的全局变量, 'imports': 整体导入的计算对象,
+              'references': 引用（import_code/from_import_code/coe）的计算对象, 'dynamic': 是否无法静态确定}
+    """
+    return _calc_object_manager.get_signature(object_id)
+
+
+def execute(object_id, timeout_seconds=None, isolate=False, **kwargs):
     """
     执行计算对象
     :param object_id: 计算对象编号
+    :param timeout_seconds: 执行时限，单位是-秒，不传则使用计算对象的timeout_seconds或全局默认时限
+    :param isolate: 是否在隔离的子进程中执行，超时后直接杀掉子进程（参数和结果需要可以pickle，不使用本进程的缓存）
     :param kwargs: 动态参数字典（不知道传什么可以调用get_params查看）
     :return: python_expr表达式的返回结果
+
+    超时抛出CalcTimeoutError；非隔离模式下是尽力而为的协作式取消，执行中的计算在下一次coe调用或调用内核函数check_timeout()时结束，
+    长时间循环的代码块可以在循环中调用check_timeout()；超时后迟迟不结束的对象之后自动改为隔离执行
+    相同对象、相同参数的并发调用只执行一次，所有调用方得到同一个结果（或同一个异常）
     """
-    return _calc_object_manager.eval(object_id, **kwargs)
+    return _calc_object_manager.eval_with_timeout(object_id, timeout_seconds, isolate, **kwargs)
 
 
 def trace(object_id, **kwargs):
@@ -183,6 +291,169 @@ def trace(object_id, **kwargs):
     return _calc_object_manager.trace(object_id, **kwargs)
 
 
+def get_traces(object_id=None, limit=None, slow_only=False):
+    """
+    获得采样追踪记录
+    :param object_id: 计算对象编号，不传则返回所有对象的记录
+    :param limit: 返回记录数上限
+    :param slow_only: 是否只返回慢调用
+    :return: 追踪记录列表，最新的在前
+
+    记录中trace_info为执行计划树形结构（同trace函数），慢调用记录的是这次慢调用本身的调用树和各层耗时
+    """
+    return _calc_object_manager.trace_log.get(object_id, limit, slow_only)
+
+
+def set_trace_sampling(sample_rate=None, slow_seconds=None, buffer_size=None):
+    """
+    调整采样追踪参数
+    :param sample_rate: 采样比例，0-1之间，0表示不采样
+    :param slow_seconds: 慢调用阈值，单位是-秒，0表示不记录慢调用
+    :param buffer_size: 追踪记录环形缓冲区大小
+    :return: None
+    """
+    _calc_object_manager.trace_log.configure(sample_rate, slow_seconds, buffer_size)
+
+
+def _to_schedule_row(params: dict):
+    if 'cron' in params:
+        CronRule(params['cron'])
+    if 'params' in params and params['params'] is not None and not isinstance(params['params'], str):
+        params = dict(params, params=json.dumps(params['params'], ensure_ascii=False))
+    return params
+
+
+def add_schedule(**kwargs):
+    """
+    添加预计算计划
+    :param kwargs: 动态参数字典
+    :return: None
+
+    字段信息：
+        schedule_id = Column(String(50), primary_key=True)
+        schedule_name = Column(String(50))
+        cron = Column(String(100))
+        object_id = Column(String(50))
+        params = Column(Text)
+        params_object_id = Column(String(50))
+        max_workers = Column(Integer, default=1)
+        enabled = Column(Integer, default=1)
+        remark = Column(String(200))
+
+        schedule_id: 计划编号，主键
+        schedule_name: 计划名称
+        cron: cron规则（本地时间），分 时 日 月 周，如'30 7 * * 1-5'表示工作日7:30
+        object_id: 预计算的计算对象编号
+        params: 参数字典或参数字典列表，如[{"a": 1}, {"a": 2}]，可以传json字符串
+        params_object_id: 生成参数字典列表的计算对象编号，设置后忽略params
+        max_workers: 并发执行数
+        enabled: 1-启用，0-停用
+        remark: 备注
+    """
+    _schedule_operator.add(**_to_schedule_row(kwargs))
+
+
+def delete_schedule(schedule_id):
+    """
+    删除预计算计划
+    :param schedule_id: 计划编号
+    :return: 影响记录数
+    """
+    return _schedule_operator.delete(MceSchedule.schedule_id == schedule_id)
+
+
+def update_schedule(schedule_id, **kwargs):
+    """
+    修改预计算计划
+    :param schedule_id: 计划编号
+    :param kwargs: 动态参数字典，需要修改的字段（同add_schedule）
+    :return: 影响记录数
+    """
+    return _schedule_operator.update(MceSchedule.schedule_id == schedule_id, **_to_schedule_row(kwargs))
+
+
+def query_schedules(**kwargs):
+    """
+    查询预计算计划
+    :param kwargs: 动态参数字典，多个条件间的关系是：and，不传则返回全部计划
+    :return: 计划字典列表
+    """
+    criterion = [_schedule_operator.column(k) == v for k, v in kwargs.items()]
+    return [s.to_dict() for s in _schedule_operator.query(*criterion, order_by=['schedule_id'])]
+
+
+def run_schedule(schedule_id, wait=True):
+    """
+    立即执行预计算计划
+    :param schedule_id: 计划编号
+    :param wait: 是否等待执行完成
+    :return: 等待时返回执行记录，否则返回是否启动（计划正在执行时不重复启动）
+    """
+    if wait:
+        return _scheduler.run(schedule_id)
+    return _scheduler.start(schedule_id)
+
+
+def get_schedule_history(schedule_id=None, limit=20):
+    """
+    获得预计算计划的执行历史
+    :param schedule_id: 计划编号，不传则返回所有计划的记录
+    :param limit: 返回记录数上限
+    :return: 执行记录列表，最新的在前
+
+    执行记录：status为running/success/failed，total为参数集合数，failed为失败数，errors为失败的参数及错误信息（json，最多20条）
+    """
+    return _scheduler.history(schedule_id, limit)
+
+
+def check_file(file_name, object_id):
+    """
+    判断文件是否需要用计算对象重新解析（增量处理）
+    :param file_name: 文件名
+    :param object_id: 解析文件的计算对象编号，其最后修改时间作为解析器版本
+    :return: {'required': 是否需要解析, 'size': 文件大小, 'mtime_ns': 修改时间, 'md5': 文件md5（大小和修改时间都没变时不计算，为None）}
+
+    上次解析成功、计算对象没有修改、文件大小和修改时间（或md5）没变时不需要解析
+    """
+    required, stat = _file_ledger.check(file_name, object_id, _file_ledger.parser_version(object_id))
+    return dict(stat, required=required)
+
+
+def record_file(file_name, object_id, md5=None, status='success', error=None, size=None, mtime_ns=None):
+    """
+    记录文件解析结果
+    :param file_name: 文件名
+    :param object_id: 解析文件的计算对象编号
+    :param md5: 文件md5（FileReader.md5）
+    :param status: success-成功，failed-失败（下次重新解析）
+    :param error: 错误信息
+    :param size: 解析前check_file返回的文件大小，不传则取当前值
+    :param mtime_ns: 解析前check_file返回的修改时间，不传则取当前值
+    :return: None
+    """
+    _file_ledger.record(file_name, object_id, _file_ledger.parser_version(object_id), md5, status, error, size,
+                        mtime_ns)
+
+
+def query_file_ledger(**kwargs):
+    """
+    查询已处理文件台账
+    :param kwargs: 动态参数字典（file_name、parser_id、status等），多个条件间的关系是：and
+    :return: 台账记录字典列表
+    """
+    return _file_ledger.query(**kwargs)
+
+
+def forget_files(file_name=None, object_id=None):
+    """
+    删除已处理文件台账记录，对应的文件下次重新解析
+    :param file_name: 文件名，不传则不限
+    :param object_id: 计算对象编号，不传则不限
+    :return: 影响记录数
+    """
+    return _file_ledger.forget(file_name, object_id)
+
+
 def _debug(py_code):
     """
     调试代码
@@ -202,24 +473,105 @@ def debug(py_code):
         return exe.submit(_debug, py_code).result()
 
 
-def reload():
+def _reload():
+    _calc_object_manager.clear()
+    for coi in _db_operator.query():
+        _calc_object_manager.set(**_to_co_attr(coi.to_dict()))
+
+
+def reload(notify=True):
     """
     重新加载计算对象
-    主要是防止有人从后台数据库直接插入计算对象信息，这样计算引擎需要重新加载
+    :param notify: 是否通知集群中的其他节点
     :return:
+
+    主要是防止有人从后台数据库直接插入计算对象信息，这样计算引擎需要重新加载
     """
-    _calc_object_manager.clear()
-    for coi in _db_operator.query():
-        _calc_object_manager.set(**_to_co_attr(coi.to_dict()))
+    _reload()
+    if notify:
+        _notify('reload')
+
 
+def warm_up():
+    """
+    预热计算对象
+    :return: 预热失败的计算对象及错误信息字典
 
-def clear_cache():
+    执行所有计算对象的代码块，使其全局变量（导入的库、定义的函数和类）提前构建好；
+    多进程模式下主进程预热后再派生工作进程，工作进程通过写时复制共享这些内容
+    """
+    return _calc_object_manager.warm_up()
+
+
+def stop_schedule_ticking():
+    """
+    本进程停止按cron规则定时预计算
+    :return: None
+
+    prefork主进程不处理请求，预热它的缓存没有意义，派生工作进程前调用；工作进程fork后各自重新开始
+    """
+    _scheduler.stop_ticking()
+
+
+def cache_stats():
+    """
+    获得缓存统计信息
+    :return: {'hits': 命中数, 'misses': 未命中数, 'coalesced': 合并的并发调用数, 'objects': 各计算对象的统计,
+              'read_sql': read_sql缓存的统计}
+
+    统计值是累计值，通过前后两次调用的差值计算一段时间内的命中率
+    """
+    objects = _calc_object_manager.cache_stats()
+    return {
+        'hits': sum(v['hits'] for v in objects.values()),
+        'misses': sum(v['misses'] for v in objects.values()),
+        'coalesced': _calc_object_manager.coalesced,
+        'objects': objects,
+        'read_sql': _sql_reader.cache.stats
+    }
+
+
+def _clear_cache(object_id=None):
+    _calc_object_manager.clear_cache(object_id)
+    if object_id is None:
+        _sql_reader.cache.clear()
+
+
+def clear_cache(object_id=None):
     """
     清空计算缓存
-    当使用的数据发生变化时（数据库中的数据发生变化时），需要掉用此函数清除计算中的缓存数据，这样才会从数据库中重新取数据
+    :param object_id: 计算对象编号，不传则清空所有计算对象及read_sql的缓存
     :return: None
+
+    当使用的数据发生变化时（数据库中的数据发生变化时），需要掉用此函数清除计算中的缓存数据，这样才会从数据库中重新取数据
+    """
+    _clear_cache(object_id)
+    _notify('clear_cache', object_id)
+
+
+def _sync_object(object_id):
+    """
+    按数据库中的最新状态同步单个计算对象：存在则设置，不存在则删除
     """
-    _calc_object_manager.clear_cache()
+    cois = _db_operator.query(MceCalcObjectInfo.object_id == object_id)
+    if len(cois) > 0:
+        _calc_object_manager.set(**_to_co_attr(cois[0].to_dict()))
+    elif _calc_object_manager.is_exist(object_id):
+        _calc_object_manager.delete(object_id)
+
+
+def _apply_change(action, object_id):
+    if action == 'object':
+        _sync_object(object_id)
+    elif action == 'clear_cache':
+        _clear_cache(object_id)
+    elif action == 'reload':
+        _reload()
+
+
+def _notify(action, object_id=None):
+    if _change_feed is not None:
+        _change_feed.publish(action, object_id)
 
 
 def publish():
@@ -233,14 +585,33 @@ def publish():
     _api['delete'] = delete
     _api['update'] = update
     _api['query'] = query
+    _api['watermark'] = watermark
 
     _api['get_params'] = get_params
+    _api['bulk_get_params'] = bulk_get_params
+    _api['get_signature'] = get_signature
     _api['execute'] = execute
     _api['trace'] = trace
+    _api['get_traces'] = get_traces
+    _api['set_trace_sampling'] = set_trace_sampling
     _api['debug'] = debug
 
+    _api['add_schedule'] = add_schedule
+    _api['delete_schedule'] = delete_schedule
+    _api['update_schedule'] = update_schedule
+    _api['query_schedules'] = query_schedules
+    _api['run_schedule'] = run_schedule
+    _api['get_schedule_history'] = get_schedule_history
+
+    _api['check_file'] = check_file
+    _api['record_file'] = record_file
+    _api['query_file_ledger'] = query_file_ledger
+    _api['forget_files'] = forget_files
+
     _api['reload'] = reload
+    _api['warm_up'] = warm_up
     _api['clear_cache'] = clear_cache
+    _api['cache_stats'] = cache_stats
 
 
 def exec_api(api_func_name, json_encoder_name='api_json_encoder', *args, **kwargs):
@@ -252,16 +623,26 @@ def exec_api(api_func_name, json_encoder_name='api_json_encoder', *args, **kwarg
     :param kwargs: 动态参数字典
     :return: json对象
     """
+    return exec_api_with_code(api_func_name, json_encoder_name, *args, **kwargs)[1]
+
+
+def exec_api_with_code(api_func_name, json_encoder_name='api_json_encoder', *args, **kwargs):
+    """
+    同exec_api，同时返回返回码，调用方（如请求录制）不用再解析json
+    :return: (返回码, json对象)，返回码0-成功，-1-失败，-3-超时
+    """
     json_encoder = None
     if _calc_object_manager.is_exist(json_encoder_name):
-        json_encoder = execute(json_encoder_name)
+        json_encoder = _calc_object_manager.get(json_encoder_name).eval()
 
     func = _api[api_func_name]
     try:
         data = func(*args, **kwargs)
-        return json.dumps({'code': 0, 'msg': None, 'data': data}, cls=json_encoder)
+        return 0, json.dumps({'code': 0, 'msg': None, 'data': data}, cls=json_encoder)
+    except CalcTimeoutError as e:
+        return -3, json.dumps({'code': -3, 'msg': repr(e), 'data': None})
     except Exception as e:
-        return json.dumps({'code': -1, 'msg': repr(e), 'data': None})
+        return -1, json.dumps({'code': -1, 'msg': repr(e), 'data': None})
 
 
 def helps():
@@ -0,0 +1,137 @@
+import os
+import time
+import uuid
+import socket
+import logging
+
+from datetime import datetime, timedelta
+from threading import RLock, Thread
+
+from sqlalchemy import func, or_
+
+from .db_models import MceChangeLog
+from .db_operator import DBOperator
+
+_logger = logging.getLogger(__name__)
+
+
+def _new_node_id():
+    return '%s:%d:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+
+class ChangeFeed:
+    """
+    集群变更通知
+    各节点把计算对象的增删改、缓存清理、重新加载写入变更日志表，同时轮询该表（按变更编号水位），把其他节点的变更应用到本节点
+    变更的应用是幂等的（对象变更统一按数据库中的最新状态同步），同一批次中同一对象的多次变更只应用一次
+    变更编号由序列生成，并发事务（以及Oracle序列缓存）下编号小的变更可能晚于编号大的变更提交，只按水位拉取会永久漏掉；
+    因此每次轮询还会重新读取最近lookback_seconds秒内创建的变更，按变更编号去重。lookback_seconds应大于最长的事务时间与各节点的时钟偏差
+    """
+
+    def __init__(self, engine, apply_func, poll_interval=3, retention_seconds=60 * 60 * 24, lookback_seconds=60):
+        self.__db_operator = DBOperator(engine, MceChangeLog)
+        self.__apply_func = apply_func
+        self.__poll_interval = poll_interval
+        self.__retention_seconds = retention_seconds
+        self.__lookback_seconds = lookback_seconds
+
+        self.__node_id = _new_node_id()
+        self.__lock = RLock()
+        self.__watermark = self.latest()
+        # 回看窗口内已处理过的变更编号 -> 创建时间，启动前的变更已体现在加载的数据中
+        self.__seen = {c.change_id: c.created_time for c in self.__db_operator.query(
+            MceChangeLog.created_time >= self.__window_start(), MceChangeLog.change_id <= self.__watermark)}
+        self.__last_prune_time = 0
+
+        self.__start_poll_thread()
+
+        # fork出的子进程是独立的节点：重新生成节点编号，重建锁并重新启动轮询线程，从父进程的水位继续追赶
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.__after_fork_in_child)
+
+    def __after_fork_in_child(self):
+        self.__node_id = _new_node_id()
+        self.__lock = RLock()
+        self.__start_poll_thread()
+
+    def __start_poll_thread(self):
+        poll_thread = Thread(target=self.__poll_forever)
+        poll_thread.daemon = True
+        poll_thread.start()
+
+    @property
+    def node_id(self):
+        return self.__node_id
+
+    @property
+    def watermark(self):
+        return self.__watermark
+
+    def __window_start(self):
+        return datetime.utcnow() - timedelta(seconds=self.__lookback_seconds)
+
+    def latest(self):
+        def _max(session):
+            return session.query(func.max(MceChangeLog.change_id)).scalar() or 0
+
+        return self.__db_operator.custom_query(_max)
+
+    def publish(self, action, object_id=None):
+        """
+        发布变更
+        :param action: object-对象增删改，clear_cache-清空缓存，reload-重新加载
+        :param object_id: 对象编号
+        """
+        self.__db_operator.add(action=action, object_id=object_id, node_id=self.__node_id)
+
+    def poll(self):
+        """
+        拉取并应用其他节点的变更
+        :return: 应用的变更数
+        """
+        with self.__lock:
+            window_start = self.__window_start()
+            changes = self.__db_operator.query(
+                or_(MceChangeLog.change_id > self.__watermark, MceChangeLog.created_time >= window_start),
+                order_by=['change_id'])
+            changes = [c for c in changes if c.change_id not in self.__seen]
+
+            # 早于窗口的编号不会再被按时间读到，且不大于水位，不用再记录
+            self.__seen = {k: v for k, v in self.__seen.items() if v is not None and v >= window_start}
+            self.__seen.update((c.change_id, c.created_time) for c in changes)
+            if len(changes) == 0:
+                return 0
+
+            self.__watermark = max(self.__watermark, changes[-1].change_id)
+
+            pending = {}
+            for c in changes:
+                if c.node_id == self.__node_id:
+                    continue
+                if c.action == 'reload':
+                    pending = {('reload', None): c}
+                elif ('reload', None) not in pending:
+                    pending.pop((c.action, c.object_id), None)
+                    pending[(c.action, c.object_id)] = c
+
+            for action, object_id in pending.keys():
+                try:
+                    self.__apply_func(action, object_id)
+                except Exception as e:
+                    _logger.error('apply change %s[%s] failed: %r', action, object_id, e)
+            return len(pending)
+
+    def prune(self):
+        expire_time = datetime.utcnow() - timedelta(seconds=self.__retention_seconds)
+        return self.__db_operator.delete(MceChangeLog.created_time < expire_time)
+
+    def __poll_forever(self):
+        while True:
+            time.sleep(self.__poll_interval)
+            try:
+                self.poll()
+                if time.time() - self.__last_prune_time > 60 * 60:
+                    self.__last_prune_time = time.time()
+                    self.prune()
+            except Exception as e:
+                _logger.error('poll change log failed: %r', e)
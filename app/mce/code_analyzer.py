@@ -0,0 +1,203 @@
+import ast
+import builtins
+
+_builtin_names = frozenset(dir(builtins))
+_import_funcs = ('import_code', 'from_import_code')
+_call_funcs = ('coe', 'calc_object_execute')
+# 代码块中出现这些名字时，定义了哪些全局变量无法静态确定
+_dynamic_names = frozenset(('exec', 'globals', 'vars', '__import__'))
+_comprehensions = (ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)
+
+
+def _target_names(target):
+    if isinstance(target, ast.Name):
+        return {target.id}
+    if isinstance(target, (ast.Tuple, ast.List)):
+        names = set()
+        for elt in target.elts:
+            names |= _target_names(elt)
+        return names
+    if isinstance(target, ast.Starred):
+        return _target_names(target.value)
+    return set()
+
+
+def _free_names(node, bound, loaded, assigned):
+    """
+    收集表达式中的自由变量，推导式的循环变量、lambda的参数只在其内部有效
+    """
+    if isinstance(node, ast.Name):
+        if isinstance(node.ctx, ast.Load) and node.id not in bound:
+            loaded.add(node.id)
+    elif isinstance(node, ast.NamedExpr):
+        assigned.add(node.target.id)
+        _free_names(node.value, bound, loaded, assigned)
+    elif isinstance(node, ast.Lambda):
+        for default in node.args.defaults + [d for d in node.args.kw_defaults if d is not None]:
+            _free_names(default, bound, loaded, assigned)
+        args = node.args
+        names = {a.arg for a in args.posonlyargs + args.args + args.kwonlyargs}
+        names |= {a.arg for a in (args.vararg, args.kwarg) if a is not None}
+        _free_names(node.body, bound | names, loaded, assigned)
+    elif isinstance(node, _comprehensions):
+        inner = set(bound)
+        for i, generator in enumerate(node.generators):
+            _free_names(generator.iter, bound if i == 0 else inner, loaded, assigned)
+            inner |= _target_names(generator.target)
+            for condition in generator.ifs:
+                _free_names(condition, inner, loaded, assigned)
+        elts = [node.key, node.value] if isinstance(node, ast.DictComp) else [node.elt]
+        for elt in elts:
+            _free_names(elt, inner, loaded, assigned)
+    else:
+        for child in ast.iter_child_nodes(node):
+            _free_names(child, bound, loaded, assigned)
+
+
+def _literal_args(call):
+    if len(call.args) == 0 or not all(isinstance(a, ast.Constant) and isinstance(a.value, str) for a in call.args):
+        return None
+    return [a.value for a in call.args]
+
+
+def _keyword_values(call):
+    return {k.arg: k.value.value for k in call.keywords if isinstance(k.value, ast.Constant)}
+
+
+class _ModuleScope(ast.NodeVisitor):
+    """
+    收集代码块在模块级定义的全局变量，不进入函数和类的内部（global声明除外）
+    """
+
+    def __init__(self):
+        self.defined = set()
+        self.imports = set()
+        self.references = set()
+        self.dynamic = False
+        self.__depth = 0
+
+    def __define(self, names):
+        if self.__depth == 0:
+            self.defined |= names
+
+    def visit_Assign(self, node):
+        for target in node.targets:
+            self.__define(_target_names(target))
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node):
+        self.__define(_target_names(node.target))
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node):
+        self.__define(_target_names(node.target))
+        self.generic_visit(node)
+
+    def visit_NamedExpr(self, node):
+        self.__define({node.target.id})
+        self.generic_visit(node)
+
+    def visit_For(self, node):
+        self.__define(_target_names(node.target))
+        self.generic_visit(node)
+
+    visit_AsyncFor = visit_For
+
+    def visit_With(self, node):
+        for item in node.items:
+            if item.optional_vars is not None:
+                self.__define(_target_names(item.optional_vars))
+        self.generic_visit(node)
+
+    visit_AsyncWith = visit_With
+
+    def visit_ExceptHandler(self, node):
+        if node.name is not None:
+            self.__define({node.name})
+        self.generic_visit(node)
+
+    def visit_Import(self, node):
+        self.__define({a.asname or a.name.split('.')[0] for a in node.names})
+
+    def visit_ImportFrom(self, node):
+        if any(a.name == '*' for a in node.names):
+            self.dynamic = True
+        self.__define({a.asname or a.name for a in node.names})
+
+    def visit_Global(self, node):
+        self.defined |= set(node.names)
+
+    def __visit_scope(self, node):
+        self.__depth += 1
+        self.generic_visit(node)
+        self.__depth -= 1
+
+    def visit_FunctionDef(self, node):
+        self.__define({node.name})
+        self.__visit_scope(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        self.__define({node.name})
+        self.__visit_scope(node)
+
+    def visit_Lambda(self, node):
+        self.__visit_scope(node)
+
+    def visit_Name(self, node):
+        if node.id in _dynamic_names:
+            self.dynamic = True
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Name) and node.func.id in _import_funcs + _call_funcs:
+            args = _literal_args(node)
+            if args is None:
+                # 导入的对象编号不是字面量时无法静态确定
+                if node.func.id in _import_funcs:
+                    self.dynamic = True
+            else:
+                self.references.add(args[0])
+                # 导入函数绑定的是对象的全局变量，在函数内部调用同样定义全局变量
+                if node.func.id == 'import_code':
+                    alias = args[1] if len(args) > 1 else _keyword_values(node).get('alias')
+                    self.defined.add(alias or args[0])
+                elif len(args) > 1 or len(node.keywords) > 0:
+                    self.defined |= set(args[1:]) | set(_keyword_values(node).values())
+                else:
+                    self.imports.add(args[0])
+        self.generic_visit(node)
+
+
+def analyze(py_code, py_expr):
+    """
+    静态分析计算对象（不执行代码）
+    :return: {'params': 返回表达式中的自由变量, 'defined': 代码块定义的全局变量, 'imports': 整体导入的计算对象,
+              'references': 引用的计算对象, 'dynamic': 是否无法静态确定（需要执行代码块）}
+    """
+    try:
+        code_tree = ast.parse(py_code or '')
+        expr_tree = ast.parse(py_expr or '')
+    except SyntaxError:
+        return {'params': [], 'defined': set(), 'imports': [], 'references': [], 'dynamic': True}
+
+    scope = _ModuleScope()
+    scope.visit(code_tree)
+
+    loaded, assigned = set(), set()
+    _free_names(expr_tree, set(), loaded, assigned)
+
+    references = set(scope.references)
+    for node in ast.walk(expr_tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _call_funcs:
+            args = _literal_args(node)
+            if args is not None:
+                references.add(args[0])
+
+    return {
+        'params': sorted(loaded - assigned - _builtin_names),
+        'defined': scope.defined,
+        'imports': sorted(scope.imports),
+        'references': sorted(references),
+        'dynamic': scope.dynamic
+    }
@@ -1,30 +1,79 @@
+import os
 import sys
 import ast
 import time
+import hashlib
 
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from functools import lru_cache, partial
 from threading import RLock, current_thread, Thread
 from contextlib import contextmanager
 from io import StringIO
 
 from .custom_cache import LRUTTLCache
+from .shared_cache import make_shared_key
+from .trace_log import TraceLog
+from .code_analyzer import analyze
+from .isolate import IsolateRunner
 
 _compile_filename = ''
 _compile_cache_size = 1024 * 10
 _std_types = (int, str, bool, float, set, tuple)
 
+# 线程模式超时后，执行线程在截止时间之后多久内结束算作协作取消，超过的对象之后改用进程模式
+_cooperative_grace_seconds = 1.0
+
 
 @lru_cache(maxsize=_compile_cache_size)
 def _compile(source, co_id, mode='exec'):
     return compile(source, '%s[%s].%s' % (_compile_filename, co_id, mode), mode)
 "mce.calc_objects[sc_file_reader].exec"
 
+class CalcTimeoutError(Exception):
+    pass
+
+
 def _make_key(*args, **kwargs):
     key = [v if type(v) in _std_types else id(v) for v in args]
     key.extend([(k, v if type(v) in _std_types else id(v)) for k, v in kwargs.items()])
     return hash(tuple(key))
 
 
+def _content_key(value):
+    """
+    按内容生成可哈希的键：标量带上类型（1、1.0、True不合并），容器递归展开，ndarray/Series/DataFrame按数据的md5；
+    其他类型（及无法按内容哈希的object数组）无法比较内容，仍按对象地址区分，内容相同的不同对象不会合并
+    """
+    if value is None or type(value) in (int, float, bool, str, bytes):
+        return type(value).__name__, value
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__, tuple(_content_key(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return 'set', frozenset(_content_key(v) for v in value)
+    if isinstance(value, dict):
+        return 'dict', frozenset((_content_key(k), _content_key(v)) for k, v in value.items())
+    if isinstance(value, np.ndarray) and value.dtype.kind in 'biufcmMSU':
+        digest = hashlib.md5(np.ascontiguousarray(value).view(np.uint8)).hexdigest()
+        return 'ndarray', value.dtype.str, value.shape, digest
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        try:
+            hashed = pd.util.hash_pandas_object(value, index=True).to_numpy()
+        except TypeError:
+            return 'id', id(value)
+        columns = tuple(value.columns) if isinstance(value, pd.DataFrame) else value.name
+        dtypes = tuple(map(str, value.dtypes)) if isinstance(value, pd.DataFrame) else str(value.dtype)
+        return type(value).__name__, _content_key(columns), dtypes, hashlib.md5(hashed).hexdigest()
+    return 'id', id(value)
+
+
+def _make_inflight_key(co_id, **kwargs):
+    # 合并执行的键按参数内容比较；领头调用持有参数直到执行结束，按地址区分的参数在此期间不会被复用
+    return co_id, frozenset((k, _content_key(v)) for k, v in kwargs.items())
+
+
 class AttrDict(dict):
     def __getattr__(self, key):
         if key in self:
@@ -43,7 +92,8 @@ def _intercept_stdout():
 
 
 class CalcObject:
-    def __init__(self, calc_object_manager, co_id, py_code='', py_expr='', lru_maxsize=0, ttl_seconds=0):
+    def __init__(self, calc_object_manager, co_id, py_code='', py_expr='', lru_maxsize=0, ttl_seconds=0,
+                 timeout_seconds=0):
         self.__calc_object_manager = calc_object_manager
 
         self.__co_id = co_id
@@ -51,6 +101,7 @@ class CalcObject:
         self.__py_expr = py_expr
         self.__lru_maxsize = lru_maxsize
         self.__ttl_seconds = ttl_seconds
+        self.__timeout_seconds = timeout_seconds or 0
 
         self.__cache = None
         if lru_maxsize > 0 and ttl_seconds > 0:
@@ -59,6 +110,9 @@ class CalcObject:
         self.__lock = RLock()
         self.__globals = None
 
+        # 创建时静态分析一次，获取参数不需要执行代码块
+        self.__signature = analyze(py_code, py_expr)
+
     @property
     def co_id(self):
         return self.__co_id
@@ -79,10 +133,18 @@ class CalcObject:
     def ttl_seconds(self):
         return self.__ttl_seconds
 
+    @property
+    def timeout_seconds(self):
+        return self.__timeout_seconds
+
     @property
     def cache(self):
         return self.__cache
 
+    @property
+    def signature(self):
+        return self.__signature
+
     @property
     def globals(self):
         with self.__lock:
@@ -109,17 +171,67 @@ class CalcObject:
 
 
 class CalcObjectManager:
-    def __init__(self, check_interval):
+    def __init__(self, check_interval, timeout_workers=16):
+        """
+        :param check_interval: 缓存过期检查间隔，单位是-秒，0表示不启动检查线程（隔离执行的辅助进程需要保持单线程）
+        :param timeout_workers: 限时执行（线程模式）的线程数上限
+        """
         self.__check_interval = check_interval
 
         self.__calc_objects = {}
         self.__lock = RLock()
+        self.__shared_store = None
+        self.__trace_log = TraceLog()
+        self.__default_timeout_seconds = 0
+
+        # 正在执行的顶层调用，相同对象和参数的并发调用合并为一次执行
+        self.__inflight = {}
+        self.__inflight_lock = RLock()
+        self.__coalesced = 0
+
+        # 限时执行：线程模式使用有界线程池；无法协作取消的对象（超时后执行线程迟迟不结束）改用隔离的进程模式
+        self.__timeout_workers = timeout_workers
+        self.__executor = None
+        self.__executor_lock = RLock()
+        self.__non_cooperative = set()
+        self.__isolate_runner = IsolateRunner()
+        # 对象定义版本，隔离执行的辅助进程据此同步
+        self.__version = 0
 
         self.__kernel_funcs = {
             'calc_object_execute': self.eval,
-            'coe': self.eval
+            'coe': self.eval,
+            'check_timeout': self.check_timeout
         }
+        self.__builtin_kernel_funcs = frozenset(self.__kernel_funcs)
+
+        self.__start_check_thread()
+
+        # fork出的子进程（预派生工作进程）中没有父进程的线程，需要重新启动
+        # fork前先拿到对象锁，等检查线程、变更同步（set/delete）等后台线程退出临界区，子进程中的对象字典和缓存是完整的
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(before=self.__before_fork, after_in_parent=self.__after_fork_in_parent,
+                                after_in_child=self.__after_fork)
+
+    def __before_fork(self):
+        self.__lock.acquire()
 
+    def __after_fork_in_parent(self):
+        self.__lock.release()
+
+    def __after_fork(self):
+        # 子进程继承的锁被fork前的线程持有，该线程在子进程中不存在，重建所有锁
+        self.__lock = RLock()
+        # 父进程中其他线程正在执行的调用不会在子进程中完成，留下的记录会让子进程中相同的调用永远等待
+        self.__inflight = {}
+        self.__inflight_lock = RLock()
+        self.__executor = None
+        self.__executor_lock = RLock()
+        self.__start_check_thread()
+
+    def __start_check_thread(self):
+        if self.__check_interval <= 0:
+            return
         check_thread = Thread(target=self.__check)
         check_thread.daemon = True
         check_thread.start()
@@ -136,9 +248,43 @@ class CalcObjectManager:
     def kernel_funcs(self):
         return self.__kernel_funcs
 
+    def add_kernel_func(self, name, func):
+        with self.__lock:
+            self.__kernel_funcs[name] = func
+            self.__version += 1
+
+    @property
+    def trace_log(self):
+        return self.__trace_log
+
+    @property
+    def shared_store(self):
+        return self.__shared_store
+
+    @shared_store.setter
+    def shared_store(self, store):
+        self.__shared_store = store
+
+    @property
+    def coalesced(self):
+        return self.__coalesced
+
+    @property
+    def default_timeout_seconds(self):
+        return self.__default_timeout_seconds
+
+    @default_timeout_seconds.setter
+    def default_timeout_seconds(self, timeout_seconds):
+        self.__default_timeout_seconds = timeout_seconds or 0
+
     def set(self, co_id, **kwargs):
         with self.__lock:
             self.__calc_objects[co_id] = CalcObject(self, co_id, **kwargs)
+            self.__version += 1
+            self.__non_cooperative.discard(co_id)
+            # 共享结果库跨进程存在，对象修改后其他进程也不能再读到旧代码的结果
+            if self.__shared_store is not None:
+                self.__shared_store.clear(co_id)
 
     def get(self, co_id) -> CalcObject:
         with self.__lock:
@@ -147,15 +293,47 @@ class CalcObjectManager:
     def delete(self, co_id):
         with self.__lock:
             del self.__calc_objects[co_id]
+            self.__version += 1
+            self.__non_cooperative.discard(co_id)
+            if self.__shared_store is not None:
+                self.__shared_store.clear(co_id)
 
     def clear(self):
         with self.__lock:
             self.__calc_objects.clear()
+            self.__version += 1
+            self.__non_cooperative.clear()
+
+    def definitions(self):
+        """
+        :return: 所有计算对象的定义，可以用set重建
+        """
+        with self.__lock:
+            return [{
+                'co_id': co.co_id,
+                'py_code': co.py_code,
+                'py_expr': co.py_expr,
+                'lru_maxsize': co.lru_maxsize,
+                'ttl_seconds': co.ttl_seconds,
+                'timeout_seconds': co.timeout_seconds
+            } for co in self.__calc_objects.values()]
 
     def is_exist(self, co_id):
         with self.__lock:
             return co_id in self.__calc_objects
 
+    def warm_up(self):
+        with self.__lock:
+            calc_objects = list(self.__calc_objects.values())
+
+        errors = {}
+        for co in calc_objects:
+            try:
+                co.globals
+            except Exception as e:
+                errors[co.co_id] = repr(e)
+        return errors
+
     def import_code(self, target_namespace, co_id, alias: str = None):
         if alias is None:
             target_namespace[co_id] = self.get(co_id).globals
@@ -172,11 +350,119 @@ class CalcObjectManager:
         if Evaluator.is_exist_current_evaluator():
             return Evaluator.get_current_evaluator().eval(co_id, **kwargs)
         else:
-            evaluator = Evaluator.new_current_evaluator(self)
+            return self.__eval(co_id, None, **kwargs)
+
+    def __eval(self, co_id, deadline, **kwargs):
+        key = _make_inflight_key(co_id, **kwargs)
+        with self.__inflight_lock:
+            future = self.__inflight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = self.__inflight[key] = Future()
+            else:
+                self.__coalesced += 1
+
+        # 已有相同的调用在执行，等待它的结果（或异常）
+        if not is_leader:
             try:
-                return evaluator.eval(co_id, **kwargs)
-            finally:
-                Evaluator.del_current_evaluator()
+                return future.result(None if deadline is None else max(deadline - time.time(), 0))
+            except FutureTimeoutError:
+                raise CalcTimeoutError('计算对象%s执行超时' % co_id)
+
+        try:
+            ret = self.__eval_top(co_id, deadline, **kwargs)
+        except BaseException as e:
+            self.__finish(key)
+            future.set_exception(e)
+            raise
+        self.__finish(key)
+        future.set_result(ret)
+        return ret
+
+    def __finish(self, key):
+        with self.__inflight_lock:
+            del self.__inflight[key]
+
+    def __eval_top(self, co_id, deadline, **kwargs):
+        is_sampled = self.__trace_log.should_sample()
+        is_trace = self.__trace_log.should_trace(is_sampled)
+        evaluator = Evaluator.new_current_evaluator(self, is_trace, deadline)
+        start_time = time.time()
+        error = None
+        try:
+            return evaluator.eval(co_id, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            Evaluator.del_current_evaluator()
+            self.__trace_log.observe(co_id, kwargs, start_time, time.time() - start_time, is_sampled,
+                                     evaluator.trace_info if is_trace else None, error)
+
+    def eval_with_timeout(self, co_id, timeout_seconds=None, isolate=False, **kwargs):
+        """
+        限时执行：未指定时限时依次使用对象自身的时限、全局默认时限，都没有则不限时
+        线程模式：在有界线程池中执行，超时后调用方立即得到CalcTimeoutError；尽力而为，执行线程只在下一次coe调用或check_timeout时
+                 检查到截止时间后退出，不调用它们的代码（如死循环、长时间的库函数）会一直占用线程直到自然结束；
+                 这样的对象超时后会被标记，之后的调用自动改用进程模式，对象被修改后清除标记
+        进程模式：在干净的辅助进程fork出的子进程中执行，超时后直接杀掉子进程，适用于死循环等无法协作取消的情况
+                 （参数和结果需要可以pickle，不使用本进程的缓存，绑定到本进程资源且无法pickle的内核函数不可用）
+        """
+        if timeout_seconds is None or timeout_seconds <= 0:
+            timeout_seconds = self.get(co_id).timeout_seconds or self.__default_timeout_seconds
+        if timeout_seconds <= 0:
+            return self.eval(co_id, **kwargs)
+
+        if hasattr(os, 'fork') and (isolate or co_id in self.__non_cooperative):
+            return self.__eval_isolated(co_id, timeout_seconds, **kwargs)
+
+        deadline = time.time() + timeout_seconds
+        future = self.__get_executor().submit(self.__eval_in_thread, co_id, deadline, **kwargs)
+        try:
+            return future.result(timeout_seconds)
+        except FutureTimeoutError:
+            # 还在排队的直接取消；已经开始执行的，截止时间后一段时间内仍未结束则认为不能协作取消
+            if not future.cancel():
+                self.__watch(co_id, deadline, future)
+            raise CalcTimeoutError('计算对象%s执行超时（%s秒）' % (co_id, timeout_seconds))
+
+    def __get_executor(self):
+        with self.__executor_lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(self.__timeout_workers, thread_name_prefix='mce-eval')
+            return self.__executor
+
+    def __eval_in_thread(self, co_id, deadline, **kwargs):
+        # 排队期间可能已经超时
+        if time.time() > deadline:
+            raise CalcTimeoutError('计算对象%s执行超时' % co_id)
+        return self.__eval(co_id, deadline, **kwargs)
+
+    def __watch(self, co_id, deadline, future):
+        with self.__lock:
+            self.__non_cooperative.add(co_id)
+
+        def done(_):
+            if time.time() - deadline <= _cooperative_grace_seconds:
+                with self.__lock:
+                    self.__non_cooperative.discard(co_id)
+
+        future.add_done_callback(done)
+
+    def __eval_isolated(self, co_id, timeout_seconds, **kwargs):
+        with self.__lock:
+            version = self.__version
+            kernel_funcs = {k: v for k, v in self.__kernel_funcs.items() if k not in self.__builtin_kernel_funcs}
+        is_timeout, ret = self.__isolate_runner.eval(version, self.definitions, kernel_funcs, co_id, timeout_seconds,
+                                                     **kwargs)
+        if is_timeout:
+            raise CalcTimeoutError('计算对象%s执行超时（%s秒）' % (co_id, timeout_seconds))
+        return ret
+
+    @staticmethod
+    def check_timeout():
+        if Evaluator.is_exist_current_evaluator():
+            Evaluator.get_current_evaluator().check_deadline()
 
     def trace(self, co_id, **kwargs):
         evaluator = Evaluator.new_current_evaluator(self, True)
@@ -197,8 +483,35 @@ class CalcObjectManager:
             except Exception as e:
                 return repr(e)
 
+    def __defined(self, co_id, visited):
+        """
+        对象代码块定义的全局变量（含整体导入的对象），无法静态确定时返回None
+        """
+        if co_id in visited:
+            return set()
+        visited.add(co_id)
+
+        signature = self.get(co_id).signature
+        if signature['dynamic']:
+            return None
+        ret = set(signature['defined'])
+        for import_id in signature['imports']:
+            if not self.is_exist(import_id):
+                return None
+            defined = self.__defined(import_id, visited)
+            if defined is None:
+                return None
+            ret |= defined
+        return ret
+
     def get_params(self, co_id):
         calc_object = self.get(co_id)
+        defined = self.__defined(co_id, set())
+        if defined is not None:
+            excluded = defined | set(self.__kernel_funcs.keys()) | {'import_code', 'from_import_code'}
+            return [p for p in calc_object.signature['params'] if p not in excluded]
+
+        # 无法静态确定时执行代码块，用实际的全局变量计算
         tree = ast.parse(calc_object.py_expr)
         defined_variables = set(calc_object.globals.keys())
         loaded_variables = set()
@@ -211,20 +524,48 @@ class CalcObjectManager:
                 loaded_variables.add(node.id)
         return list(loaded_variables - defined_variables - {'locals'})
 
-    def clear_cache(self):
+    def bulk_get_params(self, co_ids=None):
+        if co_ids is None:
+            with self.__lock:
+                co_ids = list(self.__calc_objects.keys())
+        ret = {}
+        for co_id in co_ids:
+            try:
+                ret[co_id] = self.get_params(co_id)
+            except Exception:
+                ret[co_id] = None
+        return ret
+
+    def get_signature(self, co_id):
+        signature = self.get(co_id).signature
+        return {
+            'params': self.get_params(co_id),
+            'defined': sorted(signature['defined']),
+            'imports': signature['imports'],
+            'references': signature['references'],
+            'dynamic': self.__defined(co_id, set()) is None
+        }
+
+    def cache_stats(self):
+        with self.__lock:
+            return {co.co_id: co.cache.stats for co in self.__calc_objects.values() if co.cache is not None}
+
+    def clear_cache(self, co_id=None):
         with self.__lock:
-            for co in self.__calc_objects:
+            for co in self.__calc_objects.values() if co_id is None else [self.get(co_id)]:
                 if co.cache is not None:
                     co.cache.clear()
+            if self.__shared_store is not None:
+                self.__shared_store.clear(co_id)
 
 
 class Evaluator:
     _evaluators = {}
 
     @staticmethod
-    def new_current_evaluator(calc_object_manager, is_trace=False):
+    def new_current_evaluator(calc_object_manager, is_trace=False, deadline=None):
         key = current_thread().ident
-        Evaluator._evaluators[key] = Evaluator(calc_object_manager, is_trace)
+        Evaluator._evaluators[key] = Evaluator(calc_object_manager, is_trace, deadline)
         return Evaluator._evaluators[key]
 
     @staticmethod
@@ -239,9 +580,10 @@ class Evaluator:
     def is_exist_current_evaluator():
         return current_thread().ident in Evaluator._evaluators
 
-    def __init__(self, calc_object_manager: CalcObjectManager, is_trace):
+    def __init__(self, calc_object_manager: CalcObjectManager, is_trace, deadline=None):
         self.__calc_object_manager = calc_object_manager
         self.__is_trace = is_trace
+        self.__deadline = deadline
 
         self.__temp_cache = dict()
         self.__trace_info = []
@@ -257,23 +599,65 @@ class Evaluator:
     def temp_cache(self):
         return self.__temp_cache
 
+    def check_deadline(self, co_id=None):
+        if self.__deadline is not None and time.time() > self.__deadline:
+            raise CalcTimeoutError('计算对象%s执行超时' % ('' if co_id is None else co_id))
+
     def __eval(self, cache_key, co_id, **kwargs):
         if cache_key not in self.__temp_cache:
             calc_object = self.__calc_object_manager.get(co_id)
-            if calc_object.cache is None:
-                self.__temp_cache[cache_key] = calc_object.eval(**kwargs)
+            if calc_object.timeout_seconds > 0:
+                self.__temp_cache[cache_key] = self.__compute_with_deadline(calc_object, cache_key, **kwargs)
             else:
-                self.__temp_cache[cache_key] = calc_object.cache.get(cache_key)
-                if self.__temp_cache[cache_key] is None:
-                    calc_object.cache.lock.acquire()
-                    try:
-                        self.__temp_cache[cache_key] = calc_object.eval(**kwargs)
-                        calc_object.cache.put(cache_key, self.__temp_cache[cache_key])
-                    finally:
-                        calc_object.cache.lock.release()
+                self.__temp_cache[cache_key] = self.__compute(calc_object, cache_key, **kwargs)
         return self.__temp_cache[cache_key]
 
+    def __compute(self, calc_object, cache_key, **kwargs):
+        if calc_object.cache is None:
+            return calc_object.eval(**kwargs)
+
+        # 计算期间不持有缓存锁：超时后仍在运行的执行线程不会阻塞该对象的其他调用；
+        # 相同参数的并发顶层调用已由CalcObjectManager合并，嵌套调用偶尔重复计算一次
+        ret = calc_object.cache.get(cache_key)
+        if ret is None:
+            ret = self.__eval_shared(calc_object, **kwargs)
+            # 超过截止时间的结果不会被采用，也不能存入缓存，否则下次直接命中，时限不再生效
+            self.check_deadline(calc_object.co_id)
+            calc_object.cache.put(cache_key, ret)
+        return ret
+
+    def __compute_with_deadline(self, calc_object, cache_key, **kwargs):
+        # 对象自身的时限只会收紧截止时间；执行完成后再检查一次，超过对象时限的结果不采用
+        outer_deadline = self.__deadline
+        deadline = time.time() + calc_object.timeout_seconds
+        self.__deadline = deadline if outer_deadline is None else min(deadline, outer_deadline)
+        try:
+            ret = self.__compute(calc_object, cache_key, **kwargs)
+            self.check_deadline(calc_object.co_id)
+            return ret
+        finally:
+            self.__deadline = outer_deadline
+
+    def __eval_shared(self, calc_object, **kwargs):
+        store = self.__calc_object_manager.shared_store
+        shared_key = make_shared_key(calc_object.co_id, **kwargs) if store is not None else None
+        if shared_key is None:
+            return calc_object.eval(**kwargs)
+
+        ret = store.get(shared_key)
+        if ret is None:
+            ret = calc_object.eval(**kwargs)
+            self.check_deadline(calc_object.co_id)
+            # 存入共享结果库后改用共享的只读视图，本进程计算出的副本随即释放，一个节点只保留一份；
+            # 存入后到读取前可能已被其他进程清除或淘汰（此时引用计数为0），读不到时仍返回本进程的结果
+            if store.put(shared_key, ret, calc_object.co_id, calc_object.ttl_seconds):
+                shared = store.get(shared_key)
+                if shared is not None:
+                    ret = shared
+        return ret
+
     def eval(self, co_id, **kwargs):
+        self.check_deadline(co_id)
         cache_key = _make_key(co_id, **kwargs)
 
         if self.__is_trace:
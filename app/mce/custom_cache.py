@@ -9,6 +9,8 @@ class LRUTTLCache:
         self.__ttl_seconds = ttl_seconds
         self.__cache = OrderedDict()
         self.__lock = RLock()
+        self.__hits = 0
+        self.__misses = 0
 
         # with _check_lock:
         #     _cache_list.append(self)
@@ -28,7 +30,9 @@ class LRUTTLCache:
                     del self.__cache[key]
                 else:
                     self.__cache.move_to_end(key)
+                    self.__hits += 1
                     return value
+            self.__misses += 1
         return None
 
     def put(self, key, value):
@@ -62,6 +66,11 @@ class LRUTTLCache:
         with self.__lock:
             return len(self.__cache)
 
+    @property
+    def stats(self):
+        with self.__lock:
+            return {'hits': self.__hits, 'misses': self.__misses, 'size': len(self.__cache)}
+
     @property
     def lru_maxsize(self):
         return self.__lru_maxsize
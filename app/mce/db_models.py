@@ -1,5 +1,5 @@
 # coding: utf-8
-from sqlalchemy import Column, String, Text, DateTime, Integer
+from sqlalchemy import Column, String, Text, DateTime, Integer, BigInteger, Sequence, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -9,6 +9,21 @@ metadata = Base.metadata
 
 def create_tables(engine):
     metadata.create_all(engine)
+    add_missing_columns(engine)
+
+
+def add_missing_columns(engine):
+    """
+    表已存在时create_all不会新增字段，这里把模型中新增的字段补到数据库表中（新增字段均可为空）
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            existing = {c['name'].lower() for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name.lower() not in existing:
+                    conn.execute(text('ALTER TABLE %s ADD %s %s' % (
+                        table.name, column.name, column.type.compile(engine.dialect))))
 
 
 class MceCalcObjectInfo(Base):
@@ -22,9 +37,75 @@ class MceCalcObjectInfo(Base):
     python_expr = Column(String(200))
     lru_maxsize = Column(Integer, default=0)
     ttl_seconds = Column(Integer, default=0)
+    timeout_seconds = Column(Integer, default=0)
     remark = Column(String(200))
     sort_number = Column(Integer, default=0)
     last_updated_time = Column(DateTime, default=datetime.utcnow)
 
     def to_dict(self):
         return {k: getattr(self, k, None) for k in self.__table__.c.keys()}
+
+
+class MceChangeLog(Base):
+    __tablename__ = 'mce_change_log'
+
+    change_id = Column(Integer, Sequence('mce_change_log_seq'), primary_key=True)
+    action = Column(String(20))
+    object_id = Column(String(50))
+    node_id = Column(String(100))
+    created_time = Column(DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {k: getattr(self, k, None) for k in self.__table__.c.keys()}
+
+
+class MceSchedule(Base):
+    __tablename__ = 'mce_schedule'
+
+    schedule_id = Column(String(50), primary_key=True)
+    schedule_name = Column(String(50))
+    cron = Column(String(100))
+    object_id = Column(String(50))
+    params = Column(Text)
+    params_object_id = Column(String(50))
+    max_workers = Column(Integer, default=1)
+    enabled = Column(Integer, default=1)
+    remark = Column(String(200))
+    last_updated_time = Column(DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {k: getattr(self, k, None) for k in self.__table__.c.keys()}
+
+
+class MceScheduleHistory(Base):
+    __tablename__ = 'mce_schedule_history'
+
+    run_id = Column(String(32), primary_key=True)
+    schedule_id = Column(String(50))
+    node_id = Column(String(100))
+    status = Column(String(20))
+    total = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    errors = Column(Text)
+    start_time = Column(DateTime)
+    end_time = Column(DateTime)
+
+    def to_dict(self):
+        return {k: getattr(self, k, None) for k in self.__table__.c.keys()}
+
+
+class MceFileLedger(Base):
+    __tablename__ = 'mce_file_ledger'
+
+    file_name = Column(String(500), primary_key=True)
+    parser_id = Column(String(100), primary_key=True)
+    size = Column(BigInteger)
+    mtime_ns = Column(BigInteger)
+    md5 = Column(String(32))
+    parser_version = Column(String(50))
+    status = Column(String(20))
+    error = Column(Text)
+    processed_time = Column(DateTime)
+
+    def to_dict(self):
+        return {k: getattr(self, k, None) for k in self.__table__.c.keys()}
@@ -1,8 +1,14 @@
-from sqlalchemy import MetaData
+import pandas as pd
+
+from sqlalchemy import MetaData, and_, or_, func, select, false
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.automap import automap_base
 from datetime import datetime
 from contextlib import contextmanager
+from threading import RLock
+
+_reflected_entities = {}
+_reflect_lock = RLock()
 
 
 class DBOperator:
@@ -46,12 +52,126 @@ class DBOperator:
             session.commit()
             return ret
 
-    def query(self, *criterion, header=None):
+    def column(self, name):
+        if name not in self.__entity.__table__.c:
+            raise AttributeError(f'{self.__entity.__name__}中没有【{name}】字段')
+        return getattr(self.__entity, name)
+
+    def coerce(self, name, value):
+        """
+        把外部传入的值（如json中的字符串）转换成字段对应的python类型，目前只处理日期时间
+        """
+        column = self.column(name)
+        if isinstance(value, str) and column.type.python_type is datetime:
+            return datetime.fromisoformat(value)
+        return value
+
+    def __order_by(self, order_by):
+        """
+        解析排序字段，字段名前加'-'表示降序；主键不在排序字段中时追加到最后，保证顺序唯一（键集分页不跳行、不重复）
+        :return: [(字段, 是否降序)]
+        """
+        if order_by is None:
+            return []
+        if isinstance(order_by, str):
+            order_by = [order_by]
+        orders = [(self.column(o[1:]), True) if o.startswith('-') else (self.column(o), False) for o in order_by]
+        keys = {c.key for c, _ in orders}
+        orders += [(self.column(c.key), False) for c in self.__entity.__table__.primary_key.columns if c.key not in keys]
+        return orders
+
+    @staticmethod
+    def __sort(column, desc):
+        # 可为空的字段统一把空值排在最后（各数据库默认的空值位置不同）
+        c = column.desc() if desc else column.asc()
+        return c.nullslast() if column.nullable else c
+
+    def __keyset(self, orders, after):
+        """
+        键集分页条件：(a, b) > (x, y) 展开成 a > x or (a = x and b > y)，兼容不支持行值比较的数据库
+        空值排在最后：值为空时之后只有同样为空的记录，值不为空时空值记录也在其后
+        """
+        if len(after) != len(orders):
+            raise ValueError('after的值个数必须与排序字段的个数一致，排序字段（含追加的主键）：%s' % [c.key for c, _ in orders])
+        after = [None if v is None else self.coerce(c.key, v) for (c, _), v in zip(orders, after)]
+        conditions = []
+        for i, ((column, desc), value) in enumerate(zip(orders, after)):
+            if value is None:
+                continue
+            equals = [c.is_(None) if v is None else c == v for (c, _), v in zip(orders[:i], after[:i])]
+            greater = column < value if desc else column > value
+            if column.nullable:
+                greater = or_(greater, column.is_(None))
+            conditions.append(and_(*equals, greater))
+        return or_(*conditions) if len(conditions) > 0 else false()
+
+    def query(self, *criterion, header=None, columns=None, order_by=None, offset=None, after=None):
+        """
+        查询
+        :param criterion: 过滤条件
+        :param header: 返回记录数上限
+        :param columns: 投影字段名列表，传入时返回字典列表，否则返回实体列表
+        :param order_by: 排序字段名列表，字段名前加'-'表示降序
+        :param offset: 跳过的记录数
+        :param after: 键集分页，上一页最后一条记录的排序字段值列表（与order_by一一对应，最后是追加的主键值）
+        :return: 实体列表或字典列表
+        """
+        orders = self.__order_by(order_by)
+        if after is not None:
+            criterion = criterion + (self.__keyset(orders, after),)
+
+        with self.create_session() as session:
+            if columns is None:
+                q = session.query(self.__entity)
+            else:
+                q = session.query(*[self.column(c) for c in columns])
+
+            q = q.filter(*criterion)
+            if len(orders) > 0:
+                q = q.order_by(*[self.__sort(c, desc) for c, desc in orders])
+            if offset is not None:
+                q = q.offset(offset)
+            if header is not None:
+                q = q.limit(header)
+
+            if columns is None:
+                return q.all()
+            else:
+                return [dict(r._mapping) for r in q.all()]
+
+    def stream(self, *criterion, batch_size=1000, as_dataframe=False, columns=None):
+        """
+        流式查询，按批从数据库取数，内存占用只与批大小有关，适合扫描大表
+        :param criterion: 过滤条件
+        :param batch_size: 每批取回的行数
+        :param as_dataframe: True-逐批返回DataFrame，False-逐条返回实体
+        :param columns: 返回DataFrame时的投影字段名列表，不传则返回全部字段
+        :return: 生成器
+        """
         with self.create_session() as session:
-            if header is None:
-                return session.query(self.__entity).filter(*criterion).all()
+            if as_dataframe:
+                if columns is None:
+                    stmt = select(self.__entity.__table__)
+                else:
+                    stmt = select(*[self.column(c) for c in columns])
+                stmt = stmt.where(*criterion).execution_options(yield_per=batch_size)
+                result = session.execute(stmt)
+                keys = list(result.keys())
+                for partition in result.partitions():
+                    yield pd.DataFrame.from_records(partition, columns=keys)
             else:
-                return session.query(self.__entity).filter(*criterion).limit(header).all()
+                q = session.query(self.__entity).filter(*criterion).yield_per(batch_size)
+                for entity in q:
+                    yield entity
+
+    def watermark(self, column_name='last_updated_time'):
+        """
+        获得数据水位：记录数及指定字段的最大值，用于客户端判断数据是否有变化
+        """
+        column = self.column(column_name)
+        with self.create_session() as session:
+            count, max_value = session.query(func.count(), func.max(column)).one()
+            return {'count': count, column_name: max_value}
 
     def custom_query(self, func):
         with self.create_session() as session:
@@ -62,12 +182,35 @@ class DBOperator:
 class DynamicOperator(DBOperator):
     def __init__(self, engine, table_name):
         self.__table_name = table_name.lower()
-        metadata = MetaData()
-        metadata.reflect(engine, only=[self.__table_name])
-        base = automap_base(metadata=metadata)
-        base.prepare()
-        super(DynamicOperator, self).__init__(engine, entity=base.classes[self.__table_name])
+        super(DynamicOperator, self).__init__(engine, entity=DynamicOperator.reflect(engine, self.__table_name))
 
     @property
     def table_name(self):
         return self.__table_name
+
+    @staticmethod
+    def reflect(engine, table_name):
+        """
+        反射表结构并生成实体类，按(引擎, 表名)缓存，避免每次构造都查询数据字典
+        """
+        key = (engine, table_name.lower())
+        with _reflect_lock:
+            if key not in _reflected_entities:
+                metadata = MetaData()
+                metadata.reflect(engine, only=[key[1]])
+                base = automap_base(metadata=metadata)
+                base.prepare()
+                _reflected_entities[key] = base.classes[key[1]]
+            return _reflected_entities[key]
+
+    @staticmethod
+    def invalidate(engine=None, table_name=None):
+        """
+        清除反射缓存，表结构变化后调用
+        :param engine: 数据库引擎，不传表示所有引擎
+        :param table_name: 表名，不传表示所有表
+        """
+        with _reflect_lock:
+            for key in list(_reflected_entities.keys()):
+                if (engine is None or key[0] is engine) and (table_name is None or key[1] == table_name.lower()):
+                    del _reflected_entities[key]
@@ -0,0 +1,101 @@
+import os
+import hashlib
+
+from datetime import datetime
+
+from .db_models import MceFileLedger, MceCalcObjectInfo
+from .db_operator import DBOperator
+
+_hash_chunk_size = 1024 * 1024
+
+
+def file_md5(file_name):
+    # 与sc_file_reader.FileReader的md5一致
+    md5 = hashlib.md5()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(_hash_chunk_size), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def parser_version(version):
+    if isinstance(version, datetime):
+        return version.isoformat()
+    return None if version is None else str(version)
+
+
+class FileLedger:
+    """
+    已处理文件台账，每日增量处理时跳过未变化的文件
+    每个(文件, 解析器)记录文件大小、修改时间、md5、解析器版本（计算对象的last_updated_time）和处理状态；
+    大小和修改时间都没变时直接跳过，不计算md5；变了再比较md5（文件被touch或复制过但内容没变时同样跳过）
+    只有处理成功且解析器版本未变的文件才会跳过，失败的文件下次重新处理
+    """
+
+    def __init__(self, engine):
+        self.__db_operator = DBOperator(engine, MceFileLedger)
+        self.__co_operator = DBOperator(engine, MceCalcObjectInfo)
+
+    def parser_version(self, object_id):
+        """
+        :return: 计算对象的版本（最后修改时间），计算对象不存在时返回None
+        """
+        rows = self.__co_operator.query(MceCalcObjectInfo.object_id == object_id, columns=['last_updated_time'])
+        return parser_version(rows[0]['last_updated_time']) if len(rows) > 0 else None
+
+    def get(self, file_name, parser_id):
+        rows = self.__db_operator.query(MceFileLedger.file_name == file_name, MceFileLedger.parser_id == parser_id)
+        return rows[0].to_dict() if len(rows) > 0 else None
+
+    def check(self, file_name, parser_id, version=None):
+        """
+        判断文件是否需要处理
+        :return: (是否需要处理, 文件状态{'size', 'mtime_ns', 'md5'})，md5只在大小或修改时间变化时才计算，否则为None
+        """
+        st = os.stat(file_name)
+        stat = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'md5': None}
+
+        entry = self.get(file_name, parser_id)
+        if entry is None or entry['status'] != 'success' or entry['parser_version'] != parser_version(version):
+            return True, stat
+        if entry['size'] == stat['size'] and entry['mtime_ns'] == stat['mtime_ns']:
+            return False, stat
+
+        stat['md5'] = file_md5(file_name)
+        if stat['md5'] != entry['md5']:
+            return True, stat
+
+        # 内容没变，更新大小和修改时间，下次不用再计算md5
+        self.__db_operator.update(MceFileLedger.file_name == file_name, MceFileLedger.parser_id == parser_id,
+                                  size=stat['size'], mtime_ns=stat['mtime_ns'])
+        return False, stat
+
+    def record(self, file_name, parser_id, version=None, md5=None, status='success', error=None, size=None,
+               mtime_ns=None):
+        """
+        记录处理结果；size、mtime_ns应传处理前check返回的值，处理期间文件被修改时下次会重新比较md5
+        """
+        if size is None or mtime_ns is None:
+            st = os.stat(file_name)
+            size, mtime_ns = st.st_size, st.st_mtime_ns
+
+        row = dict(size=size, mtime_ns=mtime_ns, md5=md5, parser_version=parser_version(version), status=status,
+                   error=error, processed_time=datetime.now())
+        criterion = [MceFileLedger.file_name == file_name, MceFileLedger.parser_id == parser_id]
+        if self.__db_operator.update(*criterion, **row) == 0:
+            self.__db_operator.add(file_name=file_name, parser_id=parser_id, **row)
+
+    def query(self, **kwargs):
+        criterion = [self.__db_operator.column(k) == v for k, v in kwargs.items()]
+        return [e.to_dict() for e in self.__db_operator.query(*criterion, order_by=['file_name', 'parser_id'])]
+
+    def forget(self, file_name=None, parser_id=None):
+        """
+        删除台账记录，下次重新处理
+        """
+        criterion = []
+        if file_name is not None:
+            criterion.append(MceFileLedger.file_name == file_name)
+        if parser_id is not None:
+            criterion.append(MceFileLedger.parser_id == parser_id)
+        return self.__db_operator.delete(*criterion)
@@ -0,0 +1,200 @@
+import os
+import sys
+import atexit
+import pickle
+import select
+import signal
+import shutil
+import socket
+import tempfile
+import subprocess
+
+from threading import Lock
+from multiprocessing.connection import Connection
+
+_app_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+_helper_code = 'from mce.isolate import helper_main; helper_main()'
+
+
+def _connect(address):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+    except BaseException:
+        sock.close()
+        raise
+    return Connection(sock.detach())
+
+
+def _picklable(func):
+    try:
+        pickle.dumps(func)
+        return True
+    except Exception:
+        return False
+
+
+def _serve_eval(conn, manager, co_id, kwargs):
+    conn.send(os.getpid())
+    try:
+        ret = (True, manager.eval(co_id, **kwargs))
+    except BaseException as e:
+        ret = (False, e)
+    try:
+        conn.send(ret)
+    except Exception:
+        # 结果或异常无法pickle时只传回描述
+        conn.send((False, RuntimeError(repr(ret[1]))))
+
+
+def helper_main():
+    """
+    辅助进程入口：单线程循环，收到define时重建对象管理员，收到eval时fork子进程执行并把结果直接传回调用方
+    标准输入关闭（调用方进程退出）时退出
+    """
+    from .code_parser import CalcObjectManager
+
+    address = sys.stdin.readline().strip()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(address)
+    server.listen(64)
+    # 子进程由系统自动回收
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    sys.stdout.write('ready\n')
+    sys.stdout.flush()
+
+    stdin_fd = sys.stdin.fileno()
+    manager = CalcObjectManager(0)
+    while True:
+        readable, _, _ = select.select([server, stdin_fd], [], [])
+        if stdin_fd in readable and os.read(stdin_fd, 1) == b'':
+            return
+        if server not in readable:
+            continue
+
+        sock, _ = server.accept()
+        conn = Connection(sock.detach())
+        try:
+            msg = conn.recv()
+        except EOFError:
+            conn.close()
+            continue
+
+        if msg[0] == 'define':
+            _, definitions, kernel_funcs = msg
+            manager.clear()
+            for name, func in kernel_funcs.items():
+                manager.add_kernel_func(name, func)
+            for attrs in definitions:
+                manager.set(**attrs)
+            conn.send(True)
+            conn.close()
+            continue
+
+        _, co_id, kwargs = msg
+        if os.fork() == 0:
+            try:
+                server.close()
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                _serve_eval(conn, manager, co_id, kwargs)
+            finally:
+                os._exit(0)
+        conn.close()
+
+
+class IsolateRunner:
+    """
+    隔离执行：在干净的辅助进程中fork子进程执行计算对象，超时后直接杀掉子进程，适用于死循环等无法协作取消的情况
+    服务进程有检查线程、执行线程池等多个线程，直接fork时子进程可能继承被其他线程持有的锁而死锁；
+    辅助进程通过subprocess启动，是单线程的，从它fork是安全的
+    计算对象定义（及可以pickle的内核函数）按版本同步到辅助进程，子进程继承辅助进程中的对象管理员，每次执行都不带缓存
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__pid = None
+        self.__process = None
+        self.__directory = None
+        self.__address = None
+        self.__version = None
+        atexit.register(self.close)
+
+    @property
+    def is_running(self):
+        return self.__pid == os.getpid() and self.__process is not None and self.__process.poll() is None
+
+    def __start(self):
+        # fork出的工作进程不能使用父进程的辅助进程（版本同步和进程回收都按进程区分）
+        self.__directory = tempfile.mkdtemp(prefix='mce_isolate_')
+        self.__address = os.path.join(self.__directory, 'helper.sock')
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([_app_path] + [p for p in [env.get('PYTHONPATH')] if p])
+        self.__process = subprocess.Popen([sys.executable, '-c', _helper_code], stdin=subprocess.PIPE,
+                                          stdout=subprocess.PIPE, env=env, cwd=_app_path, close_fds=True)
+        self.__process.stdin.write((self.__address + '\n').encode('utf-8'))
+        self.__process.stdin.flush()
+        if self.__process.stdout.readline().strip() != b'ready':
+            self.__process.kill()
+            self.__process.wait()
+            shutil.rmtree(self.__directory, ignore_errors=True)
+            self.__process = None
+            raise RuntimeError('隔离执行辅助进程启动失败')
+        self.__pid = os.getpid()
+        self.__version = None
+
+    def __sync(self, version, definitions, kernel_funcs):
+        with self.__lock:
+            if not self.is_running:
+                self.__start()
+            if self.__version == version:
+                return
+            kernel_funcs = {k: v for k, v in kernel_funcs.items() if _picklable(v)}
+            conn = _connect(self.__address)
+            try:
+                conn.send(('define', definitions(), kernel_funcs))
+                conn.recv()
+            finally:
+                conn.close()
+            self.__version = version
+
+    def eval(self, version, definitions, kernel_funcs, co_id, timeout_seconds, **kwargs):
+        """
+        :param version: 计算对象定义的版本，变化时重新同步
+        :param definitions: 返回计算对象定义列表的函数，只在版本变化时调用
+        :param kernel_funcs: 内核函数，无法pickle的（如绑定到本进程资源的函数）在隔离执行时不可用
+        :return: (是否超时, 结果)
+        """
+        self.__sync(version, definitions, kernel_funcs)
+
+        conn = _connect(self.__address)
+        try:
+            conn.send(('eval', co_id, kwargs))
+            pid = conn.recv()
+            if not conn.poll(timeout_seconds):
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                return True, None
+            try:
+                ok, ret = conn.recv()
+            except EOFError:
+                raise RuntimeError('计算进程异常退出') from None
+        finally:
+            conn.close()
+
+        if not ok:
+            raise ret
+        return False, ret
+
+    def close(self):
+        """
+        关闭本进程启动的辅助进程，fork出的工作进程中继承的辅助进程属于父进程，不做处理
+        """
+        with self.__lock:
+            if self.__process is not None and self.__pid == os.getpid():
+                self.__process.stdin.close()
+                self.__process.wait()
+                shutil.rmtree(self.__directory, ignore_errors=True)
+            self.__process = None
+            self.__pid = None
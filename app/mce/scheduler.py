@@ -0,0 +1,358 @@
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import logging
+
+from datetime import datetime, timedelta
+from threading import RLock, Thread, Event
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.exc import IntegrityError
+
+from .db_models import MceSchedule, MceScheduleHistory
+from .db_operator import DBOperator
+from .change_feed import _new_node_id
+
+_logger = logging.getLogger(__name__)
+
+# 分 时 日 月 周
+_cron_ranges = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+_max_errors = 20
+
+
+_scopes = ('process', 'node')
+
+
+def _fire_run_id(schedule_id, fire_time, claimant):
+    # 同一计划同一分钟的触发对同一抢占方编号相同，由执行历史表的主键保证每个抢占方只执行一次
+    key = '%s|%s|%s' % (schedule_id, fire_time.isoformat(), claimant)
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def _is_alive(node_id, stale_time, start_time):
+    """
+    执行记录所属的进程是否还在：本机的按进程号判断，其他节点的无法判断，开始时间早于stale_time的视为已中断
+    """
+    try:
+        host, pid, _ = node_id.rsplit(':', 2)
+        pid = int(pid)
+    except (AttributeError, ValueError):
+        host, pid = None, None
+
+    if host == socket.gethostname():
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+    return start_time is not None and start_time >= stale_time
+
+
+def _parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/', 1)
+            step = int(step)
+            if step <= 0:
+                raise ValueError('cron字段%s的步长必须大于0' % field)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = map(int, part.split('-', 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError('cron字段%s超出范围%d-%d' % (field, low, high))
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronRule:
+    """
+    cron规则：分 时 日 月 周（0-7，0和7都表示周日），支持*、a-b、*/n、a-b/n以及逗号分隔的列表
+    日和周都有限制时满足其一即可（同标准cron）
+    """
+
+    def __init__(self, expr):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError('cron规则需要5个字段（分 时 日 月 周）：%s' % expr)
+
+        self.__expr = expr
+        self.__minutes, self.__hours, self.__days, self.__months, weekdays = [
+            _parse_cron_field(f, low, high) for f, (low, high) in zip(fields, _cron_ranges)]
+        self.__weekdays = {d % 7 for d in weekdays}
+        self.__any_day = fields[2].startswith('*')
+        self.__any_weekday = fields[4].startswith('*')
+
+    @property
+    def expr(self):
+        return self.__expr
+
+    def match(self, dt):
+        if dt.minute not in self.__minutes or dt.hour not in self.__hours or dt.month not in self.__months:
+            return False
+        day_matched = dt.day in self.__days
+        weekday_matched = dt.isoweekday() % 7 in self.__weekdays
+        if self.__any_day or self.__any_weekday:
+            return day_matched and weekday_matched
+        return day_matched or weekday_matched
+
+
+class Scheduler:
+    """
+    定时预计算
+    按计划表中的cron规则（本地时间），用给定的参数集合提前执行计算对象，结果进入计算对象的缓存，用户请求时直接命中
+    参数集合：params为参数字典或参数字典列表（json），或者由params_object_id指定的计算对象生成（返回参数字典列表）
+    每次执行写入执行历史表，记录参数总数、失败数和失败的参数及错误信息
+    预热的是进程内的缓存，所以每次触发按(计划, 触发时间, 抢占方)在执行历史表中抢占，每个抢占方执行一次：
+    scope为process时抢占方是进程，每个处理请求的进程各自预热；为node时抢占方是节点，适用于开启了共享结果库，
+    同一节点的其他进程能直接命中执行进程结果的情况
+    prefork主进程不处理请求，派生工作进程前应调用stop_ticking，工作进程fork后各自重新开始检查cron规则
+    执行进程异常退出时留下的running记录，在启动和每小时清理时标记为失败
+    """
+
+    def __init__(self, engine, eval_func, enabled=True, retention_seconds=60 * 60 * 24 * 30,
+                 stale_seconds=60 * 60 * 6, scope='process'):
+        """
+        :param stale_seconds: 其他节点的执行记录running超过该时长视为已中断
+        :param scope: 每次触发的执行范围，process-每个进程执行一次，node-每个节点执行一次
+        """
+        if scope not in _scopes:
+            raise ValueError('scope必须是%s之一：%s' % ('、'.join(_scopes), scope))
+
+        self.__schedule_operator = DBOperator(engine, MceSchedule)
+        self.__history_operator = DBOperator(engine, MceScheduleHistory)
+        self.__eval_func = eval_func
+        self.__enabled = enabled
+        self.__retention_seconds = retention_seconds
+        self.__stale_seconds = stale_seconds
+        self.__scope = scope
+
+        self.__node_id = _new_node_id()
+        self.__lock = RLock()
+        self.__running = set()
+        self.__last_prune_time = 0
+        self.__stop_event = Event()
+
+        try:
+            self.recover()
+        except Exception as e:
+            _logger.error('schedule recover failed: %r', e)
+
+        if enabled:
+            self.__start_tick_thread()
+
+            # fork出的子进程没有父进程的线程，需要重新启动（父进程停止检查时也一样）
+            if hasattr(os, 'register_at_fork'):
+                os.register_at_fork(after_in_child=self.__after_fork_in_child)
+
+    def __after_fork_in_child(self):
+        self.__node_id = _new_node_id()
+        self.__lock = RLock()
+        self.__running = set()
+        self.__stop_event = Event()
+        self.__start_tick_thread()
+
+    def __start_tick_thread(self):
+        tick_thread = Thread(target=self.__tick_forever, args=(self.__stop_event,))
+        tick_thread.daemon = True
+        tick_thread.start()
+
+    def stop_ticking(self):
+        """
+        本进程停止检查cron规则，之后fork出的子进程仍会重新开始
+        """
+        self.__stop_event.set()
+
+    @property
+    def enabled(self):
+        return self.__enabled
+
+    @property
+    def scope(self):
+        return self.__scope
+
+    @property
+    def ticking(self):
+        return self.__enabled and not self.__stop_event.is_set()
+
+    @property
+    def running(self):
+        with self.__lock:
+            return sorted(self.__running)
+
+    def tick(self, now):
+        """
+        启动cron规则与now（精确到分钟）匹配的计划，上一次执行未结束的计划本次跳过
+        :return: 启动的计划编号列表
+        """
+        ret = []
+        for schedule in self.__schedule_operator.query(MceSchedule.enabled == 1):
+            try:
+                matched = CronRule(schedule.cron).match(now)
+            except ValueError as e:
+                _logger.error('schedule %s has invalid cron: %r', schedule.schedule_id, e)
+                continue
+            if matched and self.start(schedule.schedule_id, now):
+                ret.append(schedule.schedule_id)
+        return ret
+
+    def start(self, schedule_id, fire_time=None):
+        """
+        在后台线程中执行计划
+        :param fire_time: 定时触发的时间，传入时在执行历史表中抢占，同一抢占方（进程或节点）只执行一次
+        :return: 是否启动（计划正在执行或本次触发已被抢占时不启动）
+        """
+        with self.__lock:
+            if schedule_id in self.__running:
+                return False
+            self.__running.add(schedule_id)
+
+        run_id = uuid.uuid4().hex if fire_time is None else _fire_run_id(schedule_id, fire_time, self.__claimant())
+        claimed = False
+        try:
+            claimed = self.__claim(schedule_id, run_id)
+        finally:
+            if not claimed:
+                with self.__lock:
+                    self.__running.discard(schedule_id)
+        if not claimed:
+            return False
+
+        def run():
+            try:
+                self.__run(schedule_id, run_id)
+            except Exception as e:
+                _logger.error('schedule %s failed: %r', schedule_id, e)
+            finally:
+                with self.__lock:
+                    self.__running.discard(schedule_id)
+
+        Thread(target=run, name='mce-schedule-%s' % schedule_id, daemon=True).start()
+        return True
+
+    def run(self, schedule_id):
+        """
+        立即执行计划（同步）
+        :return: 执行记录
+        """
+        if len(self.__schedule_operator.query(MceSchedule.schedule_id == schedule_id)) == 0:
+            raise ValueError('计划%s不存在' % schedule_id)
+        run_id = uuid.uuid4().hex
+        self.__claim(schedule_id, run_id)
+        return self.__run(schedule_id, run_id)
+
+    def __claimant(self):
+        return self.__node_id if self.__scope == 'process' else socket.gethostname()
+
+    def __claim(self, schedule_id, run_id):
+        """
+        写入running状态的执行记录，返回是否成功（编号已存在说明本次触发已被抢占）
+        """
+        try:
+            self.__history_operator.add(run_id=run_id, schedule_id=schedule_id, node_id=self.__node_id,
+                                        status='running', start_time=datetime.now())
+        except IntegrityError:
+            return False
+        return True
+
+    def __run(self, schedule_id, run_id):
+        total, errors = 0, []
+        try:
+            schedules = self.__schedule_operator.query(MceSchedule.schedule_id == schedule_id)
+            if len(schedules) == 0:
+                raise ValueError('计划%s不存在' % schedule_id)
+            schedule = schedules[0]
+            params_list = self.__params_list(schedule)
+            total = len(params_list)
+            errors = self.__eval_all(schedule, params_list)
+        except Exception as e:
+            errors = [{'params': None, 'error': repr(e)}]
+
+        if len(errors) > 0:
+            _logger.warning('schedule %s: %d of %d failed', schedule_id, len(errors), total)
+
+        self.__history_operator.update(
+            MceScheduleHistory.run_id == run_id,
+            status='failed' if len(errors) > 0 else 'success',
+            total=total,
+            failed=len(errors),
+            errors=json.dumps(errors[:_max_errors], ensure_ascii=False, default=repr) if len(errors) > 0 else None,
+            end_time=datetime.now())
+        return self.__history_operator.query(MceScheduleHistory.run_id == run_id)[0].to_dict()
+
+    def __params_list(self, schedule):
+        if schedule.params_object_id:
+            params = self.__eval_func(schedule.params_object_id)
+        elif schedule.params:
+            params = json.loads(schedule.params)
+        else:
+            params = {}
+
+        if isinstance(params, dict):
+            params = [params]
+        params = list(params)
+        if not all(isinstance(p, dict) for p in params):
+            raise ValueError('参数集合必须是参数字典或参数字典列表')
+        return params
+
+    def __eval_all(self, schedule, params_list):
+        errors = []
+        with ThreadPoolExecutor(max(schedule.max_workers or 1, 1)) as exe:
+            futures = [(params, exe.submit(self.__eval_func, schedule.object_id, **params)) for params in params_list]
+            for params, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append({'params': params, 'error': repr(e)})
+        return errors
+
+    def history(self, schedule_id=None, limit=20):
+        criterion = [] if schedule_id is None else [MceScheduleHistory.schedule_id == schedule_id]
+        return [h.to_dict() for h in self.__history_operator.query(*criterion, header=limit, order_by=['-start_time'])]
+
+    def prune(self):
+        expire_time = datetime.now() - timedelta(seconds=self.__retention_seconds)
+        return self.__history_operator.delete(MceScheduleHistory.start_time < expire_time)
+
+    def recover(self):
+        """
+        把执行进程已经不存在的running记录标记为失败
+        :return: 标记的记录数
+        """
+        now = datetime.now()
+        stale_time = now - timedelta(seconds=self.__stale_seconds)
+        errors = json.dumps([{'params': None, 'error': '执行进程已退出，执行中断'}], ensure_ascii=False)
+        ret = 0
+        for h in self.__history_operator.query(MceScheduleHistory.status == 'running'):
+            if not _is_alive(h.node_id, stale_time, h.start_time):
+                ret += self.__history_operator.update(
+                    MceScheduleHistory.run_id == h.run_id, MceScheduleHistory.status == 'running',
+                    status='failed', errors=errors, end_time=now)
+        return ret
+
+    def __tick_forever(self, stop_event):
+        last_minute = None
+        # 每分钟开始时检查一次
+        while not stop_event.wait(60 - time.time() % 60 + 0.01):
+            now = datetime.now().replace(second=0, microsecond=0)
+            if now == last_minute:
+                continue
+            last_minute = now
+            try:
+                self.tick(now)
+                if time.time() - self.__last_prune_time > 60 * 60:
+                    self.__last_prune_time = time.time()
+                    self.prune()
+                    self.recover()
+            except Exception as e:
+                _logger.error('schedule tick failed: %r', e)
@@ -0,0 +1,342 @@
+import os
+import time
+import atexit
+import pickle
+import hashlib
+import weakref
+import multiprocessing
+
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+import pandas as pd
+
+_std_types = (int, str, bool, float, type(None))
+
+_name_prefix = 'mce_'
+_align = 64
+
+_FREE, _WRITING, _READY = 0, 1, 2
+
+_index_dtype = np.dtype([
+    ('key', 'S32'),
+    ('co_id', 'S50'),
+    ('name', 'S64'),
+    ('nbytes', 'i8'),
+    ('refcount', 'i4'),
+    ('state', 'i1'),
+    ('last_access', 'f8'),
+    ('expire_time', 'f8')
+])
+
+
+def make_shared_key(co_id, **kwargs):
+    """
+    跨进程稳定的缓存键，参数中含有非标准类型（按对象地址区分）时无法跨进程共享，返回None
+    """
+    if not all(type(v) in _std_types for v in kwargs.values()):
+        return None
+    return hashlib.md5(repr((co_id, sorted(kwargs.items()))).encode('utf-8')).hexdigest()
+
+
+def _create(name, size):
+    shm = shared_memory.SharedMemory(name, create=True, size=size)
+    # 生命周期由共享结果库自己管理，不能让各进程的resource_tracker在进程退出时删除
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def _open(name):
+    """
+    映射已有的共享内存段，返回mmap
+    数组直接引用mmap，mmap随最后一个数组一起释放；若使用SharedMemory.buf，对象回收时会因为仍有数组引用而报BufferError
+    """
+    shm = shared_memory.SharedMemory(name)
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    mm = shm._mmap
+    shm._buf.release()
+    shm._buf, shm._mmap = None, None
+    shm.close()
+    return mm
+
+
+def _unlink(name):
+    try:
+        shm = shared_memory.SharedMemory(name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def _cleanup_stale():
+    """
+    删除所属进程已经不存在的共享内存段（例如主进程被kill -9后遗留的）
+    """
+    if not os.path.isdir('/dev/shm'):
+        return
+    for fn in os.listdir('/dev/shm'):
+        if not fn.startswith(_name_prefix):
+            continue
+        try:
+            pid = int(fn[len(_name_prefix):].split('_')[0])
+            os.kill(pid, 0)
+        except ValueError:
+            continue
+        except ProcessLookupError:
+            _unlink(fn)
+        except PermissionError:
+            pass
+
+
+def _is_sharable(value):
+    if isinstance(value, np.ndarray):
+        return value.dtype.kind in 'biufcmM'
+    return isinstance(value, pd.DataFrame)
+
+
+def _encode(value):
+    """
+    编码为共享内存布局：[8字节头长度][pickle头][按64字节对齐的数值列缓冲区...]
+    数值列按原始字节存放，读取时零拷贝；其他列和索引放在头中
+    """
+    buffers = []
+    offset = 0
+
+    def add_buffer(array):
+        nonlocal offset
+        array = np.ascontiguousarray(array)
+        buffers.append((offset, array))
+        ret = (array.dtype.str, array.shape, offset)
+        offset += (array.nbytes + _align - 1) // _align * _align
+        return ret
+
+    if isinstance(value, np.ndarray):
+        header = {'kind': 'array', 'array': add_buffer(value)}
+    else:
+        columns = []
+        for name, col in value.items():
+            if isinstance(col.dtype, np.dtype) and col.dtype.kind in 'biufcmM':
+                columns.append((name, 'buffer', add_buffer(col.to_numpy())))
+            else:
+                columns.append((name, 'pickle', col))
+        header = {'kind': 'frame', 'columns': columns, 'index': value.index}
+
+    header = pickle.dumps(header, protocol=pickle.HIGHEST_PROTOCOL)
+    start = (8 + len(header) + _align - 1) // _align * _align
+    return header, start, buffers, start + offset
+
+
+def _decode(buf):
+    size = int.from_bytes(buf[:8], 'little')
+    header = pickle.loads(buf[8:8 + size])
+    start = (8 + size + _align - 1) // _align * _align
+
+    def to_array(spec):
+        dtype, shape, offset = spec
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=buf, offset=start + offset)
+        array.setflags(write=False)
+        return array
+
+    if header['kind'] == 'array':
+        return to_array(header['array'])
+
+    data = {}
+    for name, kind, col in header['columns']:
+        data[name] = to_array(col) if kind == 'buffer' else col.to_numpy()
+    return pd.DataFrame(data, index=header['index'], columns=[c[0] for c in header['columns']], copy=False)
+
+
+class SharedResultStore:
+    """
+    跨进程共享结果库
+    基于共享内存存放DataFrame/ndarray结果，一个结果只占一份内存，其他进程零拷贝读取（只读）
+    需要在派生工作进程之前创建，索引段和锁通过fork继承
+    引用计数：读取时加1，返回的对象被回收时减1；淘汰时按最近访问时间淘汰引用计数为0的结果，保证总字节数不超过预算
+    过期：存放时记录过期时间（计算对象缓存的ttl），过期的结果不再返回；计算对象修改或删除时由CalcObjectManager清除其结果
+    """
+
+    def __init__(self, max_bytes, max_entries=1024, stale_seconds=60 * 60):
+        _cleanup_stale()
+
+        self.__owner_pid = os.getpid()
+        self.__prefix = '%s%d_' % (_name_prefix, self.__owner_pid)
+        self.__max_bytes = max_bytes
+        self.__stale_seconds = stale_seconds
+        self.__lock = multiprocessing.Lock()
+
+        self.__index_shm = _create(self.__prefix + 'index', _index_dtype.itemsize * max_entries)
+        self.__index = np.ndarray((max_entries,), dtype=_index_dtype, buffer=self.__index_shm.buf)
+        self.__index[:] = np.zeros(max_entries, dtype=_index_dtype)
+
+        atexit.register(self.close)
+
+    @property
+    def max_bytes(self):
+        return self.__max_bytes
+
+    @property
+    def used_bytes(self):
+        with self.__lock:
+            return int(self.__index['nbytes'][self.__index['state'] != _FREE].sum())
+
+    @property
+    def size(self):
+        with self.__lock:
+            return int((self.__index['state'] == _READY).sum())
+
+    def __find(self, key, state=None):
+        hits = np.flatnonzero(self.__index['key'] == key.encode())
+        for i in hits:
+            if self.__index[i]['state'] != _FREE and (state is None or self.__index[i]['state'] == state):
+                return i
+        return None
+
+    def __owns(self, i, name):
+        return self.__index[i]['state'] == _WRITING and self.__index[i]['name'].decode() == name
+
+    def __free(self, i):
+        name = self.__index[i]['name'].decode()
+        self.__index[i] = np.zeros(1, dtype=_index_dtype)[0]
+        _unlink(name)
+
+    def __expired(self, now):
+        expire_time = self.__index['expire_time']
+        return (self.__index['state'] == _READY) & (expire_time > 0) & (expire_time <= now)
+
+    def __evict_for(self, nbytes):
+        """
+        淘汰直到能放下nbytes，返回是否成功；正在被引用的结果只有超过stale_seconds未访问（如引用进程异常退出）才会被淘汰
+        已过期且没有被引用的结果先释放
+        """
+        now = time.time()
+        for i in np.flatnonzero(self.__expired(now) & (self.__index['refcount'] <= 0)):
+            self.__free(i)
+
+        used = self.__index['nbytes'][self.__index['state'] != _FREE].sum()
+        if used + nbytes <= self.__max_bytes and (self.__index['state'] == _FREE).any():
+            return True
+
+        candidates = np.flatnonzero((self.__index['state'] == _READY) & (
+                (self.__index['refcount'] <= 0) | (now - self.__index['last_access'] > self.__stale_seconds)))
+        for i in candidates[np.argsort(self.__index['last_access'][candidates])]:
+            used -= self.__index[i]['nbytes']
+            self.__free(i)
+            if used + nbytes <= self.__max_bytes:
+                return True
+        return False
+
+    def get(self, key):
+        with self.__lock:
+            i = self.__find(key, _READY)
+            if i is None:
+                return None
+            expire_time = self.__index[i]['expire_time']
+            if 0 < expire_time <= time.time():
+                # 过期的结果不再返回；仍被引用时保留到引用释放后再由淘汰回收
+                if self.__index[i]['refcount'] <= 0:
+                    self.__free(i)
+                return None
+            self.__index['refcount'][i] += 1
+            self.__index['last_access'][i] = time.time()
+            name = self.__index[i]['name'].decode()
+
+        try:
+            value = _decode(_open(name))
+        except Exception:
+            self.release(key, name)
+            raise
+        weakref.finalize(value, self.release, key, name)
+        return value
+
+    def release(self, key, name=None):
+        """
+        :param name: 读取时的共享内存段名，结果已被清除并以相同键重新存放时，不会误减新结果的引用计数
+        """
+        with self.__lock:
+            i = self.__find(key, _READY)
+            if i is not None and (name is None or self.__index[i]['name'].decode() == name) \
+                    and self.__index[i]['refcount'] > 0:
+                self.__index['refcount'][i] -= 1
+
+    def put(self, key, value, co_id='', ttl_seconds=None):
+        """
+        存放结果，返回是否成功（类型不支持、已存在、超出预算时不存放）
+        :param ttl_seconds: 存活时间，None或0表示不过期
+        """
+        if not _is_sharable(value):
+            return False
+
+        header, start, buffers, nbytes = _encode(value)
+        # 段名带上时间戳，同一个键清除后重新存放时使用新的段
+        name = '%s%s_%x' % (self.__prefix, key[:20], time.time_ns())
+
+        with self.__lock:
+            now = time.time()
+            i = self.__find(key)
+            if i is not None and self.__expired(now)[i] and self.__index[i]['refcount'] <= 0:
+                self.__free(i)
+                i = None
+            if i is not None or nbytes > self.__max_bytes or not self.__evict_for(nbytes):
+                return False
+            i = np.flatnonzero(self.__index['state'] == _FREE)[0]
+            expire_time = now + ttl_seconds if ttl_seconds else 0
+            self.__index[i] = (key.encode(), co_id.encode()[:50], name.encode(), nbytes, 0, _WRITING, now, expire_time)
+
+        # 写入数据时不持有锁，其他进程的读取不受影响
+        try:
+            try:
+                shm = _create(name, nbytes)
+            except FileExistsError:
+                _unlink(name)
+                shm = _create(name, nbytes)
+            shm.buf[:8] = len(header).to_bytes(8, 'little')
+            shm.buf[8:8 + len(header)] = header
+            for offset, array in buffers:
+                target = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=start + offset)
+                target[...] = array
+                del target
+            shm.close()
+        except Exception:
+            with self.__lock:
+                if self.__owns(i, name):
+                    self.__free(i)
+                else:
+                    _unlink(name)
+            raise
+
+        with self.__lock:
+            # 写入期间被clear清除（计算对象已修改），结果作废
+            if not self.__owns(i, name):
+                _unlink(name)
+                return False
+            self.__index['state'][i] = _READY
+        return True
+
+    def delete(self, key):
+        with self.__lock:
+            i = self.__find(key)
+            if i is not None:
+                self.__free(i)
+
+    def clear(self, co_id=None):
+        """
+        清除结果，包括正在写入的（写入完成时发现已被清除会作废）
+        """
+        with self.__lock:
+            for i in np.flatnonzero(self.__index['state'] != _FREE):
+                if co_id is None or self.__index[i]['co_id'].decode() == co_id:
+                    self.__free(i)
+
+    def close(self):
+        """
+        创建者进程退出时删除所有共享内存段
+        """
+        if os.getpid() != self.__owner_pid or self.__index is None:
+            return
+        with self.__lock:
+            for i in np.flatnonzero(self.__index['state'] != _FREE):
+                _unlink(self.__index[i]['name'].decode())
+            self.__index = None
+        self.__index_shm.close()
+        _unlink(self.__prefix + 'index')
@@ -0,0 +1,99 @@
+import pandas as pd
+
+from sqlalchemy import text, create_engine
+
+from .custom_cache import LRUTTLCache
+
+_std_types = (int, str, bool, float, tuple, type(None))
+
+
+def _make_sql_key(sql, params, dtype, parse_dates):
+    items = [(k, v if type(v) in _std_types else repr(v)) for k, v in sorted((params or {}).items())]
+    return hash((sql, tuple(items), repr(dtype), repr(parse_dates)))
+
+
+def _to_frame(rows, columns, dtype=None, parse_dates=None) -> pd.DataFrame:
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    if dtype is not None:
+        df = df.astype(dtype)
+    for c in parse_dates or []:
+        df[c] = pd.to_datetime(df[c])
+    return df
+
+
+def _restore_sql_reader(url, arraysize, cache_maxsize, cache_ttl_seconds, pickle_password):
+    return SqlReader(create_engine(url), arraysize, cache_maxsize, cache_ttl_seconds, pickle_password)
+
+
+class SqlReader:
+    def __init__(self, engine, arraysize=1000, cache_maxsize=128, cache_ttl_seconds=60 * 10, pickle_password=False):
+        """
+        :param pickle_password: 序列化（传给隔离执行的辅助进程）时是否带上连接串中的明文密码；
+                                为False时连接串含密码的读取器不能序列化，隔离执行中不能使用read_sql
+        """
+        self.__engine = engine
+        self.__arraysize = arraysize
+        self.__cache = LRUTTLCache(cache_maxsize, cache_ttl_seconds)
+        self.__pickle_password = pickle_password
+
+    def __reduce__(self):
+        # 隔离执行的子进程中按连接串重建引擎（连接池不能跨进程传递）
+        url = self.__engine.url
+        if url.password is not None and not self.__pickle_password:
+            raise TypeError('连接串含密码的SqlReader不能序列化，需要时初始化时传入pickle_password=True')
+        return _restore_sql_reader, (url.render_as_string(hide_password=False), self.__arraysize,
+                                     self.__cache.lru_maxsize, self.__cache.ttl_seconds, self.__pickle_password)
+
+    @property
+    def engine(self):
+        return self.__engine
+
+    @property
+    def cache(self):
+        return self.__cache
+
+    def __execute(self, conn, sql, params, arraysize):
+        # yield_per会开启服务端游标，并作为oracle驱动的arraysize（每次网络往返取回的行数）
+        return conn.execution_options(yield_per=arraysize or self.__arraysize).execute(text(sql), params or {})
+
+    def __read(self, sql, params, arraysize, dtype, parse_dates):
+        with self.__engine.connect() as conn:
+            result = self.__execute(conn, sql, params, arraysize)
+            columns = list(result.keys())
+            rows = [r for p in result.partitions() for r in p]
+        return _to_frame(rows, columns, dtype, parse_dates)
+
+    def __read_chunks(self, sql, params, chunksize, arraysize, dtype, parse_dates):
+        with self.__engine.connect() as conn:
+            result = self.__execute(conn, sql, params, arraysize or chunksize)
+            columns = list(result.keys())
+            for p in result.partitions(chunksize):
+                yield _to_frame(p, columns, dtype, parse_dates)
+
+    def read_sql(self, sql, params=None, chunksize=None, arraysize=None, dtype=None, parse_dates=None, cache=False):
+        """
+        执行参数化sql，返回DataFrame
+        :param sql: sql语句，参数使用:name形式绑定，如select * from t where d = :d
+        :param params: 绑定参数字典
+        :param chunksize: 分块大小，传入时返回DataFrame生成器，流式读取，内存占用只与块大小有关
+        :param arraysize: 每次从数据库取回的行数，默认使用初始化时的配置
+        :param dtype: 列类型，同DataFrame.astype的参数
+        :param parse_dates: 需要转换为日期的列名列表
+        :param cache: 是否缓存结果，缓存键为sql及绑定参数，分块读取时不缓存
+        :return: DataFrame或DataFrame生成器
+
+        使用计算引擎初始化时的数据库引擎（连接池），计算对象中无需再自行创建引擎或连接
+        缓存的DataFrame是共享的，使用方不要就地修改
+        """
+        if chunksize is not None:
+            return self.__read_chunks(sql, params, chunksize, arraysize, dtype, parse_dates)
+
+        if not cache:
+            return self.__read(sql, params, arraysize, dtype, parse_dates)
+
+        key = _make_sql_key(sql, params, dtype, parse_dates)
+        ret = self.__cache.get(key)
+        if ret is None:
+            ret = self.__read(sql, params, arraysize, dtype, parse_dates)
+            self.__cache.put(key, ret)
+        return ret
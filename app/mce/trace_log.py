@@ -0,0 +1,85 @@
+import time
+import random
+
+from threading import Lock
+from collections import deque
+
+
+class TraceLog:
+    """
+    生产环境采样追踪
+    按比例采样的调用完整追踪（父子调用树同trace函数）；设置了慢调用阈值时每次调用都记录各层耗时，
+    超过阈值的调用连同本次的调用树一起记录（下一次调用通常命中缓存，重新追踪拿不到慢的原因）
+    记录保存在有界环形缓冲区中；未设置慢调用阈值时未采样的调用只多一次随机数和两次取时间的开销，
+    设置后每层调用多两次取时间和一条调用记录
+    """
+
+    def __init__(self, sample_rate=0.0, slow_seconds=0.0, buffer_size=100):
+        self.__sample_rate = sample_rate
+        self.__slow_seconds = slow_seconds
+        self.__records = deque(maxlen=buffer_size)
+        self.__lock = Lock()
+        self.__serial_number = 0
+
+    @property
+    def sample_rate(self):
+        return self.__sample_rate
+
+    @property
+    def slow_seconds(self):
+        return self.__slow_seconds
+
+    @property
+    def buffer_size(self):
+        return self.__records.maxlen
+
+    def configure(self, sample_rate=None, slow_seconds=None, buffer_size=None):
+        with self.__lock:
+            if sample_rate is not None:
+                self.__sample_rate = sample_rate
+            if slow_seconds is not None:
+                self.__slow_seconds = slow_seconds
+            if buffer_size is not None and buffer_size != self.__records.maxlen:
+                self.__records = deque(self.__records, maxlen=buffer_size)
+
+    def should_sample(self):
+        return self.__sample_rate > 0 and random.random() < self.__sample_rate
+
+    def should_trace(self, is_sampled):
+        """
+        是否需要记录调用树：采样的调用，或设置了慢调用阈值（事先不知道哪次调用会慢）
+        """
+        return is_sampled or self.__slow_seconds > 0
+
+    def observe(self, co_id, params, start_time, spend_time, is_sampled, trace_info=None, error=None):
+        """
+        :param trace_info: 本次调用的调用树，只在采样或超过慢调用阈值时保存
+        """
+        is_slow = 0 < self.__slow_seconds <= spend_time
+        if not is_sampled and not is_slow:
+            return
+
+        with self.__lock:
+            self.__serial_number += 1
+            self.__records.append({
+                'id': self.__serial_number,
+                'co_id': co_id,
+                'params': params,
+                'start_time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start_time)),
+                'spend_time': spend_time,
+                'is_slow': is_slow,
+                'is_sampled': is_sampled,
+                'error': None if error is None else repr(error),
+                'trace_info': trace_info
+            })
+
+    def get(self, co_id=None, limit=None, slow_only=False):
+        with self.__lock:
+            records = [r for r in self.__records if (co_id is None or r['co_id'] == co_id) and
+                       (not slow_only or r['is_slow'])]
+        records.reverse()
+        return records if limit is None else records[:limit]
+
+    def clear(self):
+        with self.__lock:
+            self.__records.clear()
@@ -0,0 +1,167 @@
+import os
+import gc
+import sys
+import time
+import random
+import signal
+import socket
+import logging
+
+from threading import Lock
+from waitress.server import create_server
+
+_logger = logging.getLogger(__name__)
+
+_is_worker = False
+
+
+def is_supported():
+    return hasattr(os, 'fork')
+
+
+def is_worker():
+    return _is_worker
+
+
+def request_reload():
+    """
+    工作进程请求主进程协调重新加载：主进程重新加载、预热后滚动替换所有工作进程
+    """
+    if _is_worker:
+        os.kill(os.getppid(), signal.SIGHUP)
+
+
+class _RequestCounter:
+    """
+    统计工作进程处理的请求数，达到上限后优雅退出，由主进程重新派生（回收内存碎片、泄漏）
+    """
+
+    def __init__(self, app, max_requests):
+        self.__app = app
+        self.__max_requests = max_requests
+        self.__count = 0
+        self.__lock = Lock()
+
+    def __call__(self, environ, start_response):
+        # waitress多个线程同时处理请求
+        with self.__lock:
+            self.__count += 1
+            reached = self.__count == self.__max_requests
+        if reached:
+            os.kill(os.getpid(), signal.SIGTERM)
+        return self.__app(environ, start_response)
+
+
+class PreforkServer:
+    """
+    预派生多进程服务
+    主进程完成计算引擎初始化和预热后派生多个工作进程，工作进程共享监听端口，并通过写时复制共享主进程中已导入的库和计算对象
+    信号：SIGHUP-重新加载并滚动替换工作进程，SIGTERM/SIGINT-停止所有工作进程后退出
+    """
+
+    def __init__(self, app, host, port, workers, threads=4, max_requests=0, on_reload=None):
+        self.__app = app
+        self.__host = host
+        self.__port = int(port)
+        self.__workers = workers
+        self.__threads = threads
+        self.__max_requests = max_requests
+        self.__on_reload = on_reload
+
+        self.__socket = None
+        self.__pids = set()
+        self.__running = True
+        self.__reload_requested = False
+
+    def __spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.__serve()
+            finally:
+                os._exit(0)
+        self.__pids.add(pid)
+        _logger.info('worker %d spawned', pid)
+
+    def __serve(self):
+        global _is_worker
+        _is_worker = True
+
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        app = self.__app
+        if self.__max_requests > 0:
+            # 加随机抖动，避免所有工作进程同时回收
+            app = _RequestCounter(app, self.__max_requests + random.randint(0, self.__max_requests // 10))
+
+        # waitress捕获SystemExit后停止接收新请求，等待处理中的请求完成后退出
+        create_server(app, sockets=[self.__socket], threads=self.__threads).run()
+
+    def __reap(self):
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.__pids:
+                self.__pids.discard(pid)
+                _logger.info('worker %d exited', pid)
+
+    def __terminate(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def __reload(self):
+        self.__reload_requested = False
+        if self.__on_reload is not None:
+            self.__on_reload()
+        # 先解冻并回收，重新加载前的旧模块、计算对象及其循环引用才能被释放，再冻结当前对象
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+
+        # 滚动替换：先派生新工作进程再停止旧的，保证服务不中断
+        for pid in list(self.__pids):
+            self.__spawn()
+            self.__terminate([pid])
+        _logger.info('workers reloaded')
+
+    def __handle_stop(self, signum, frame):
+        self.__running = False
+
+    def __handle_reload(self, signum, frame):
+        self.__reload_requested = True
+
+    def run(self):
+        self.__socket = socket.create_server((self.__host, self.__port), backlog=2048)
+
+        signal.signal(signal.SIGTERM, self.__handle_stop)
+        signal.signal(signal.SIGINT, self.__handle_stop)
+        signal.signal(signal.SIGHUP, self.__handle_reload)
+
+        # 冻结当前所有对象，避免工作进程中的垃圾回收改写对象头导致共享内存页被复制
+        gc.freeze()
+
+        _logger.info('MCE master %d serving with %d workers', os.getpid(), self.__workers)
+        try:
+            while self.__running:
+                self.__reap()
+                if self.__reload_requested:
+                    self.__reload()
+                while self.__running and len(self.__pids) < self.__workers:
+                    self.__spawn()
+                time.sleep(0.5)
+        finally:
+            self.__terminate(self.__pids)
+            deadline = time.time() + 10
+            while len(self.__pids) > 0 and time.time() < deadline:
+                self.__reap()
+                time.sleep(0.1)
+            self.__socket.close()
@@ -0,0 +1,306 @@
+"""
+批量解析券商文件
+目录结构：根目录/券商/邮箱/报告目录/文件，按(券商, 后缀)把文件路由到解析函数，在进程池中并行解析，
+每个文件解析完成就输出一条记录（不等整批结束）
+
+用法：
+    python batch_parse.py /home/fam2/光大解析文件/光大全量文件-树形结构 --workers 4 -o result.jsonl
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+import sc_file_reader
+
+_app_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+
+_readers = {
+    '.xlsx': sc_file_reader.ExcelReader,
+    '.xlsm': sc_file_reader.ExcelReader,
+    '.xls': sc_file_reader.ExcelReader,
+    '.docx': sc_file_reader.DocxReader,
+    '.pdf': sc_file_reader.PdfReader,
+    '.txt': sc_file_reader.TxtReader
+}
+
+
+def open_reader(fn, md5=None):
+    suffix = os.path.splitext(fn)[1].lower()
+    if suffix not in _readers:
+        raise ValueError(f'不支持的文件类型：{fn}')
+    return _readers[suffix](fn, md5=md5)
+
+
+def _init_worker(cache_directory, cache_max_bytes, cache_secret):
+    # 子进程不继承父进程运行时开启的解析缓存
+    if cache_directory is not None:
+        sc_file_reader.set_parse_cache(cache_directory, cache_max_bytes, cache_secret)
+
+
+def parse_file(parse_func, fn, stat=None):
+    """
+    打开文件并调用解析函数，异常转为错误信息返回（异常对象不一定能在进程间传递）
+    :param stat: 台账检查时的文件状态{'size', 'mtime_ns', 'md5'}，其中有md5且文件大小和修改时间没变时直接使用，不再计算
+    :return: {'results': 解析结果列表, 'error': 错误信息, 'md5': 文件md5, 'spend_time': 耗时}
+    """
+    start = time.perf_counter()
+    ret = {'results': None, 'error': None, 'md5': None}
+    try:
+        md5 = None
+        if stat is not None and stat.get('md5') is not None:
+            st = os.stat(fn)
+            if (st.st_size, st.st_mtime_ns) == (stat['size'], stat['mtime_ns']):
+                md5 = stat['md5']
+        with open_reader(fn, md5) as reader:
+            ret['md5'] = reader.md5
+            ret['results'] = parse_func(reader)
+    except Exception:
+        ret['error'] = traceback.format_exc()
+    ret['spend_time'] = time.perf_counter() - start
+    return ret
+
+
+class BatchParser:
+    """
+    :param processes: 进程数，0表示在当前进程中逐个解析
+    :param max_tasks_per_child: 每个子进程解析多少个文件后重启，释放解析库残留的内存
+    :param max_pending: 同时提交到进程池的文件数上限（默认进程数的2倍），结果没有取走时不再提交，内存占用有界
+    :param ledger: 已处理文件台账（mce.file_ledger.FileLedger），传入时跳过上次解析成功且文件和解析器都没变的文件
+    """
+
+    def __init__(self, processes=None, max_tasks_per_child=20, max_pending=None, ledger=None):
+        self.__processes = os.cpu_count() if processes is None else processes
+        self.__max_tasks_per_child = max_tasks_per_child
+        self.__max_pending = max_pending or max(self.__processes, 1) * 2
+        self.__ledger = ledger
+        self.__routes = {}
+        self.__stats = {}
+
+    @property
+    def processes(self):
+        return self.__processes
+
+    @property
+    def ledger(self):
+        return self.__ledger
+
+    @property
+    def routes(self):
+        return dict(self.__routes)
+
+    def register(self, provider, suffix, parse_func, parser_id=None, parser_version=None):
+        """
+        注册解析函数，provider为None时匹配所有券商；parse_func接收文件读取器，返回解析结果列表，必须是模块级函数（子进程按名字导入）
+        :param parser_id: 台账中的解析器编号（如计算对象编号），默认为模块名.函数名
+        :param parser_version: 解析器版本（如计算对象的last_updated_time），版本变化后所有文件重新解析
+        """
+        if parser_id is None:
+            parser_id = f'{parse_func.__module__}.{parse_func.__qualname__}'
+        self.__routes[(provider, suffix.lower())] = (parse_func, parser_id, parser_version)
+
+    def route(self, provider, suffix):
+        """
+        :return: (解析函数, 解析器编号, 解析器版本)，没有匹配的解析函数时返回None
+        """
+        suffix = suffix.lower()
+        return self.__routes.get((provider, suffix)) or self.__routes.get((None, suffix))
+
+    def scan(self, root):
+        """
+        :return: (券商, 文件名)的迭代器，券商为根目录下的第一级目录名
+        """
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            rel = os.path.relpath(dirpath, root)
+            provider = None if rel == '.' else rel.split(os.sep)[0]
+            for filename in sorted(filenames):
+                # 跳过excel打开文件时生成的临时文件
+                if filename.startswith('~$'):
+                    continue
+                yield provider, os.path.join(dirpath, filename)
+
+    def run(self, root):
+        """
+        解析目录树下的所有文件，每个文件完成后立即输出
+        :return: {'file_name', 'provider', 'parser', 'status', 'results', 'error', 'md5', 'spend_time'}的迭代器，
+                 status为success、failed、skipped（没有匹配的解析函数）、unchanged（台账中已解析且没有变化）
+        """
+        return self.run_files(self.scan(root))
+
+    def run_files(self, files):
+        """
+        :param files: (券商, 文件名)的可迭代对象
+        """
+        tasks = self.__tasks(files)
+        if self.__processes <= 0:
+            for record, parse_func in tasks:
+                if parse_func is None:
+                    yield record
+                else:
+                    yield self.__finish(record, parse_file(parse_func, record['file_name'],
+                                                           self.__stats.get(record['file_name'])))
+            return
+
+        cache = sc_file_reader.get_parse_cache()
+        initargs = (None, None, None) if cache is None else (cache.directory, cache.max_bytes, cache.secret)
+
+        def new_executor():
+            return ProcessPoolExecutor(self.__processes, initializer=_init_worker, initargs=initargs,
+                                       max_tasks_per_child=self.__max_tasks_per_child)
+
+        executor = new_executor()
+        pending = {}
+        retries = deque()
+
+        def submit(record, parse_func, isolated=False):
+            nonlocal executor
+            args = (parse_func, record['file_name'], self.__stats.get(record['file_name']))
+            try:
+                future = executor.submit(parse_file, *args)
+            except BrokenProcessPool:
+                # 子进程异常退出后进程池不可用，换新的进程池
+                executor.shutdown(wait=False)
+                executor = new_executor()
+                future = executor.submit(parse_file, *args)
+            pending[future] = (record, parse_func, isolated)
+
+        def collect():
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record, parse_func, isolated = pending.pop(future)
+                try:
+                    ret = future.result()
+                except BrokenProcessPool as e:
+                    if not isolated:
+                        retries.append((record, parse_func))
+                        continue
+                    ret = {'results': None, 'error': repr(e), 'md5': None, 'spend_time': 0.0}
+                yield self.__finish(record, ret)
+
+        def retry():
+            # 子进程异常退出（如内存不足被杀）时不知道是哪个文件导致的，当时未完成的文件在新进程池中逐个单独重新解析，
+            # 单独解析仍然崩溃的才记为失败
+            if len(retries) == 0:
+                return
+            while len(retries) > 0:
+                while len(pending) > 0:
+                    yield from collect()
+                submit(*retries.popleft(), isolated=True)
+            while len(pending) > 0:
+                yield from collect()
+
+        try:
+            for record, parse_func in tasks:
+                if parse_func is None:
+                    yield record
+                    continue
+
+                while len(pending) >= self.__max_pending:
+                    yield from collect()
+                yield from retry()
+                submit(record, parse_func)
+
+            while len(pending) > 0 or len(retries) > 0:
+                yield from collect() if len(retries) == 0 else retry()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def __tasks(self, files):
+        """
+        :return: (记录, 解析函数)的迭代器，不需要解析的文件解析函数为None
+        """
+        for provider, fn in files:
+            suffix = os.path.splitext(fn)[1].lower()
+            route = self.route(provider, suffix)
+            record = {
+                'file_name': fn,
+                'provider': provider,
+                'parser': None if route is None else route[1],
+                'status': 'skipped',
+                'results': None,
+                'error': None,
+                'md5': None,
+                'spend_time': 0.0
+            }
+            if route is None:
+                yield record, None
+                continue
+
+            parse_func, parser_id, parser_version = route
+            if self.__ledger is not None:
+                required, stat = self.__ledger.check(fn, parser_id, parser_version)
+                if not required:
+                    record.update(status='unchanged', md5=stat['md5'])
+                    yield record, None
+                    continue
+                # 记录解析前的文件状态，解析期间文件被修改时下次会重新比较md5
+                self.__stats[fn] = stat
+            yield record, parse_func
+
+    def __finish(self, record, ret):
+        record.update(ret)
+        record['status'] = 'failed' if ret['error'] is not None else 'success'
+        if self.__ledger is not None:
+            stat = self.__stats.pop(record['file_name'], {})
+            _, parser_id, parser_version = self.route(record['provider'], os.path.splitext(record['file_name'])[1])
+            self.__ledger.record(record['file_name'], parser_id, parser_version, record['md5'], record['status'],
+                                 record['error'], stat.get('size'), stat.get('mtime_ns'))
+        return record
+
+
+def main():
+    import file_analyze
+
+    parser = argparse.ArgumentParser(description='批量解析券商文件')
+    parser.add_argument('root', help='根目录（券商/邮箱/报告目录/文件）')
+    parser.add_argument('--workers', type=int, default=None, help='进程数，0表示在当前进程中解析')
+    parser.add_argument('--max-tasks-per-child', type=int, default=20, help='每个子进程解析多少个文件后重启')
+    parser.add_argument('--cache', help='解析结果缓存目录')
+    parser.add_argument('--ledger', help='已处理文件台账所在的mce数据库（sqlalchemy连接串），传入时只解析新增或变化的文件')
+    parser.add_argument('--object-id', default='file_analyze', help='解析文件的计算对象编号，其最后修改时间作为解析器版本')
+    parser.add_argument('-o', '--output', help='结果文件（每行一个json），不传则输出到标准输出')
+    args = parser.parse_args()
+
+    if args.cache is not None:
+        sc_file_reader.set_parse_cache(args.cache)
+
+    ledger, parser_version = None, None
+    if args.ledger is not None:
+        sys.path.insert(0, _app_path)
+        from sqlalchemy import create_engine
+        from mce.db_models import create_tables
+        from mce.file_ledger import FileLedger
+
+        engine = create_engine(args.ledger)
+        create_tables(engine)
+        ledger = FileLedger(engine)
+        # 计算对象不在库中时，用解析模块文件的修改时间作为版本
+        parser_version = ledger.parser_version(args.object_id) or str(os.stat(file_analyze.__file__).st_mtime_ns)
+
+    batch = BatchParser(args.workers, args.max_tasks_per_child, ledger=ledger)
+    batch.register('兴业证券', '.xlsx', file_analyze.parse, args.object_id, parser_version)
+
+    out = sys.stdout if args.output is None else open(args.output, 'w', encoding='utf-8')
+    counts = {}
+    try:
+        for record in batch.run(args.root):
+            counts[record['status']] = counts.get(record['status'], 0) + 1
+            out.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(counts, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
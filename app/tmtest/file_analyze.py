@@ -7,8 +7,8 @@ import uc_fam_fp_result
 
 
 def parse(fn):
-    # 第一步，读取文件
-    fr = sc_file_reader.ExcelReader(fn)
+    # 第一步，读取文件（fn为文件名或已打开的读取器）
+    fr = fn if isinstance(fn, sc_file_reader.FileReader) else sc_file_reader.ExcelReader(fn)
 
     # 第二步，构造待用表格
     tables = {}
@@ -25,7 +25,8 @@ def parse(fn):
     # print(column_names)
 
     # 第三步，给返回对象赋值
-    ret_list = [uc_fam_fp_result.OptionBaseInfo(fr, '兴业证券'), uc_fam_fp_result.OptionSettlementInfo(fr, '兴业证券')]
+    ret_list = [uc_fam_fp_result.OptionBaseInfo(fr, '兴业证券', columnar=True),
+                uc_fam_fp_result.OptionSettlementInfo(fr, '兴业证券', columnar=True)]
 
     # 创建一个列表params，其中每个元素是一个字典，字典的键为返回对象的表格结构中的表格名，值为空字典。
     params = [
@@ -46,26 +47,24 @@ def parse(fn):
 
     df = tables['场外期权']
     if not df.empty:
-        def _do(x):
-            ret_list[0].tables_append('名义本金流水', {
-                '合约编号': x['合约编号\nTrade ID'],
-                '起始日': pd.to_datetime(x['合约起始日\nTrade Date'], format='%Y-%m-%d'),
-                '到期日': pd.to_datetime(x['合约到期日\nExpiry Date'], format='%Y-%m-%d'),
-                '余额': sc_mce_math.mce_round(x['名义本金\nNotional Amount'], 2)
-            })
-            ret_list[0].tables_append('合约累计盈亏', {
-                '合约编号': x['合约编号\nTrade ID'],
-                '估值日期': params[0]['汇总信息']['估值日期'],
-                '累计盈亏': sc_mce_math.mce_round(x['合约估值\nValuation'], 2)
-            })
-            ret_list[0].tables_append('期权费调整流水', {
-                '合约编号': x['合约编号\nTrade ID'],
-                '日期': params[0]['汇总信息']['估值日期'],
-                '发生额': None,
-                '余额': sc_mce_math.mce_round(x['期权费\nPremium'], 2)
-            })
-
-        df.apply(_do, axis=1)
+        trade_id = df['合约编号\nTrade ID']
+        ret_list[0].tables_extend('名义本金流水', {
+            '合约编号': trade_id,
+            '起始日': pd.to_datetime(df['合约起始日\nTrade Date'], format='%Y-%m-%d'),
+            '到期日': pd.to_datetime(df['合约到期日\nExpiry Date'], format='%Y-%m-%d'),
+            '余额': sc_mce_math.mce_round_array(df['名义本金\nNotional Amount'], 2)
+        })
+        ret_list[0].tables_extend('合约累计盈亏', {
+            '合约编号': trade_id,
+            '估值日期': params[0]['汇总信息']['估值日期'],
+            '累计盈亏': sc_mce_math.mce_round_array(df['合约估值\nValuation'], 2)
+        })
+        ret_list[0].tables_extend('期权费调整流水', {
+            '合约编号': trade_id,
+            '日期': params[0]['汇总信息']['估值日期'],
+            '发生额': None,
+            '余额': sc_mce_math.mce_round_array(df['期权费\nPremium'], 2)
+        })
     params[0]['汇总信息']['名义本金_余额'] = sc_mce_math.mce_round(df['名义本金\nNotional Amount'].sum(), 2)
     params[0]['汇总信息']['期权费_余额'] = sc_mce_math.mce_round(df['期权费\nPremium'].sum(), 2)
     params[0]['汇总信息']['累计盈亏'] = sc_mce_math.mce_round(df['合约估值\nValuation'].sum(),
@@ -85,9 +84,10 @@ def parse(fn):
     return [ret.result for ret in ret_list]
 
 
-file_name = 'XXX证券-私募证券投资基金-场外交易估值报告-2024-02-28.xlsx'
-for r in parse(file_name):
-    uc_fam_fp_result.data_print(r)
+if __name__ == '__main__':
+    file_name = 'XXX证券-私募证券投资基金-场外交易估值报告-2024-02-28.xlsx'
+    for r in parse(file_name):
+        uc_fam_fp_result.data_print(r)
 
 
 
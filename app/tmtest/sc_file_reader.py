@@ -1,16 +1,43 @@
 import os
+import re
+import time
+import codecs
 import chardet
+import numpy as np
 import pandas as pd
 import docx
 import pdfplumber
 import hashlib
+import hmac
 import io
+import mmap
+import pickle
+import tempfile
+import multiprocessing
+import zipfile
+
+from threading import RLock
+from collections.abc import MutableMapping
+from operator import itemgetter
+from itertools import accumulate
+from bisect import bisect_left, bisect_right
+from lxml import etree
+
+
+_non_whitespace = re.compile(r'\S')
+_whitespace = re.compile(r'\s')
 
 
 class TextReader:
+    # 查找索引：记录每个key首次出现的位置、每个参数所在的行号，同一文本多次查找时不再重复扫描全文
+    index_enabled = True
+
     def __init__(self, s: str):
         self.__text = s
-        self.__text_lines = s.splitlines()
+        self.__text_lines = None
+        self.__key_positions = {}
+        self.__line_offsets = None
+        self.__arg_lines = {}
 
     @property
     def text(self):
@@ -18,29 +45,423 @@ class TextReader:
 
     @property
     def text_lines(self):
+        if self.__text_lines is None:
+            self.__text_lines = self.text.splitlines()
         return self.__text_lines
 
+    def __find(self, key):
+        if key not in self.__key_positions:
+            self.__key_positions[key] = self.text.find(key)
+        return self.__key_positions[key]
+
     def get_value(self, key, sep=None):
-        index = self.__text.find(key)
-        if index >= 0:
-            return self.__text[index + len(key):].lstrip().split(sep)[0].strip()
+        if not self.index_enabled:
+            index = self.text.find(key)
+            if index >= 0:
+                return self.text[index + len(key):].lstrip().split(sep)[0].strip()
+            return None
+
+        index = self.__find(key)
+        if index < 0:
+            return None
+        # 只截取值所在的一小段，不复制key之后的全部文本，结果同text[index + len(key):].lstrip().split(sep)[0].strip()
+        text = self.text
+        m = _non_whitespace.search(text, index + len(key))
+        if m is None:
+            return ''.split(sep)[0].strip()
+        start = m.start()
+        if sep is None:
+            m = _whitespace.search(text, start)
+            end = m.start() if m is not None else len(text)
+        elif sep == '':
+            raise ValueError('empty separator')
+        else:
+            end = text.find(sep, start)
+            end = end if end >= 0 else len(text)
+        return text[start:end].strip()
+
+    def get_values(self, keys, sep=None):
+        """
+        批量查找，结果同对每个key调用get_value
+        没有查找过的key用一个正则（所有key的零宽前瞻）扫描一遍全文，在候选位置上确认是哪些key，所有key都找到后提前结束
+        :return: {key: 值}
+        """
+        keys = list(keys)
+        if self.index_enabled:
+            self.__find_all([key for key in keys if key not in self.__key_positions])
+        return {key: self.get_value(key, sep) for key in keys}
+
+    def __find_all(self, keys):
+        """
+        一遍扫描记录多个key首次出现的位置，结果同对每个key调用text.find
+        """
+        remaining = {}
+        for key in set(keys):
+            if key == '':
+                self.__key_positions[key] = 0
+            else:
+                remaining.setdefault(key[0], []).append(key)
+        if len(remaining) == 0:
+            return
+
+        text = self.text
+        pos = 0
+        while len(remaining) > 0:
+            # 前瞻是零宽的，每个位置都会尝试，重叠的key（如abc和bc）不会漏掉；找到的key从正则中去掉
+            pattern = re.compile('(?=%s)' % '|'.join(re.escape(key) for keys in remaining.values() for key in keys))
+            m = pattern.search(text, pos)
+            if m is None:
+                break
+            pos = m.start()
+            candidates = remaining[text[pos]]
+            for key in [key for key in candidates if text.startswith(key, pos)]:
+                self.__key_positions[key] = pos
+                candidates.remove(key)
+            if len(candidates) == 0:
+                del remaining[text[pos]]
+        for candidates in remaining.values():
+            for key in candidates:
+                self.__key_positions[key] = -1
+
+    def __next_line(self, arg, line):
+        """
+        包含arg且行号不小于line的第一行，没有时返回None
+        按需向后查找，已经找到的行号和查找位置保存在__arg_lines中，后续查找从上次停下的位置继续
+        """
+        lines = self.text_lines
+        if arg == '':
+            return line if line < len(lines) else None
+        if self.__line_offsets is None:
+            self.__line_offsets = list(accumulate((len(line) for line in self.text.splitlines(True)), initial=0))
+
+        text, offsets = self.text, self.__line_offsets
+        found, pos = self.__arg_lines.get(arg, ([], 0))
+        i = bisect_left(found, line)
+        while i == len(found) and pos >= 0:
+            pos = text.find(arg, pos)
+            if pos < 0:
+                break
+            k = bisect_right(offsets, pos) - 1
+            # 跨越换行符的匹配不算在任何一行中
+            if pos + len(arg) <= offsets[k] + len(lines[k]):
+                found.append(k)
+                pos = offsets[k + 1]
+            else:
+                pos += 1
+        self.__arg_lines[arg] = (found, pos)
+        return found[i] if i < len(found) else None
 
     def index_of(self, *args, bool_func=all):
-        for i in range(len(self.text_lines)):
-            if bool_func([arg in self.text_lines[i] for arg in args]):
-                return i
-        return -1
+        if not self.index_enabled or bool_func not in (all, any) or len(args) == 0:
+            for i in range(len(self.text_lines)):
+                if bool_func([arg in self.text_lines[i] for arg in args]):
+                    return i
+            return -1
+
+        if bool_func is any:
+            firsts = [i for i in (self.__next_line(arg, 0) for arg in args) if i is not None]
+            return min(firsts) if len(firsts) > 0 else -1
+
+        # 每个参数跳到不小于当前行的下一个所在行，取最大的作为新的当前行，直到所有参数都在同一行
+        line = 0
+        while True:
+            candidates = [self.__next_line(arg, line) for arg in args]
+            if None in candidates:
+                return -1
+            if min(candidates) == max(candidates):
+                return candidates[0]
+            line = max(candidates)
+
+
+_cache_key_file = os.path.join(os.path.expanduser('~'), '.sc_parse_cache_key')
+_digest_size = hashlib.sha256().digest_size
+
+
+def _cache_secret():
+    """
+    缓存签名密钥：环境变量SC_PARSE_CACHE_KEY，否则为当前用户主目录下的密钥文件（不存在时生成，权限0600）
+    """
+    secret = os.environ.get('SC_PARSE_CACHE_KEY')
+    if secret:
+        return secret.encode('utf-8')
+    try:
+        with open(_cache_key_file, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+
+    # 先写临时文件再硬链接，多个进程同时生成时只有一个成功，其他进程读取它的密钥
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(_cache_key_file))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(32))
+        os.chmod(tmp, 0o600)
+        try:
+            os.link(tmp, _cache_key_file)
+        except FileExistsError:
+            pass
+    finally:
+        os.remove(tmp)
+    with open(_cache_key_file, 'rb') as f:
+        return f.read()
+
+
+class ParseCache:
+    """
+    解析结果磁盘缓存，按文件md5、读取器类型和解析选项寻址，同一个文件重复解析只需计算md5和加载缓存
+    DataFrame以pickle保存（按列块存储，加载很快）；总大小超过上限时按最近使用时间（文件修改时间）淘汰
+    缓存目录可能被多个用户共享，每个条目带HMAC-SHA256签名，签名不对的条目（被他人写入或篡改）不会被反序列化；
+    多个用户共享同一个缓存时需要设置相同的环境变量SC_PARSE_CACHE_KEY，否则各自的条目互不命中
+    """
+    version = 3
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024, secret=None):
+        """
+        :param secret: 签名密钥（bytes），默认见_cache_secret
+        """
+        self.__directory = directory
+        self.__max_bytes = max_bytes
+        self.__secret = secret if secret is not None else _cache_secret()
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def secret(self):
+        return self.__secret
+
+    @property
+    def directory(self):
+        return self.__directory
+
+    @property
+    def max_bytes(self):
+        return self.__max_bytes
+
+    def key(self, md5, reader_type, **options):
+        return hashlib.md5(repr((self.version, md5, reader_type, sorted(options.items()))).encode('utf-8')).hexdigest()
+
+    def __path(self, key):
+        return os.path.join(self.__directory, key + '.pkl')
+
+    def __sign(self, data):
+        return hmac.new(self.__secret, data, hashlib.sha256).digest()
+
+    def get(self, key):
+        path = self.__path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        # 先验证签名再反序列化
+        if len(data) < _digest_size or not hmac.compare_digest(data[:_digest_size], self.__sign(data[_digest_size:])):
+            return None
+        try:
+            ret = pickle.loads(data[_digest_size:])
+        except (EOFError, pickle.UnpicklingError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return ret
+
+    def put(self, key, value):
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return False
+        if len(data) > self.__max_bytes:
+            return False
+
+        # 先写临时文件再改名，并发读取不会读到写了一半的文件
+        fd, tmp = tempfile.mkstemp(dir=self.__directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.__sign(data))
+            f.write(data)
+        os.replace(tmp, self.__path(key))
+        self.evict()
+        return True
+
+    def evict(self):
+        entries = []
+        for fn in os.listdir(self.__directory):
+            if fn.endswith('.pkl'):
+                try:
+                    st = os.stat(os.path.join(self.__directory, fn))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, fn))
+
+        total = sum(e[1] for e in entries)
+        for _, size, fn in sorted(entries):
+            if total <= self.__max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.__directory, fn))
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for fn in os.listdir(self.__directory):
+            if fn.endswith('.pkl'):
+                os.remove(os.path.join(self.__directory, fn))
+
+
+_parse_cache = None
+
+
+def set_parse_cache(directory, max_bytes=1024 * 1024 * 1024, secret=None):
+    """
+    开启解析结果磁盘缓存，directory为None时关闭
+    """
+    global _parse_cache
+    _parse_cache = None if directory is None else ParseCache(directory, max_bytes, secret)
+    return _parse_cache
+
+
+def get_parse_cache():
+    return _parse_cache
+
+
+def cached_parse(reader, reader_type, parse_func, **options):
+    """
+    带缓存的解析：命中直接返回缓存结果，否则调用parse_func解析并存入缓存
+    """
+    cache = _parse_cache
+    if cache is None:
+        return parse_func()
+    key = cache.key(reader.md5, reader_type, **options)
+    ret = cache.get(key)
+    if ret is None:
+        ret = parse_func()
+        cache.put(key, ret)
+    return ret
+
+
+class MemoryStream(io.RawIOBase):
+    """
+    内存只读流，直接读取底层缓冲区（如文件的内存映射），每个流有自己的读取位置，不复制整个文件
+    """
+
+    def __init__(self, view):
+        super().__init__()
+        self.__view = memoryview(view).cast('B')
+        self.__pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), len(self.__view) - self.__pos)
+        if n <= 0:
+            return 0
+        b[:n] = self.__view[self.__pos:self.__pos + n]
+        self.__pos += n
+        return n
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self.__view) - self.__pos
+        ret = bytes(self.__view[self.__pos:self.__pos + size])
+        self.__pos += len(ret)
+        return ret
+
+    def readall(self):
+        return self.read()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self.__pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self.__view) + offset
+        else:
+            raise ValueError('invalid whence (%r)' % whence)
+        if pos < 0:
+            raise ValueError('negative seek position %d' % pos)
+        self.__pos = pos
+        return pos
+
+    def tell(self):
+        return self.__pos
+
+    def close(self):
+        if not self.closed:
+            self.__view.release()
+        super().close()
 
 
 class FileReader:
-    def __init__(self, fn):
+    _hash_chunk_size = 1024 * 1024
+    # 不小于该字节数的文件使用内存映射，更小的文件直接读入内存
+    mmap_threshold = 16 * 1024 * 1024
+    # 最后修改时间距今不足该秒数的文件可能还在写入，不使用内存映射
+    mmap_stable_seconds = 2.0
+
+    def __init__(self, fn, md5=None):
+        """
+        :param md5: 已知的文件md5（如批量解析时台账检查已经计算过），传入时不再计算；调用方需保证文件在此之后没有变化
+        """
         self._filename = fn
         self._basename = os.path.basename(self._filename)
         self._dirname = os.path.dirname(self._filename)
         self._clear_name, self._suffix = os.path.splitext(self._basename)
-        with open(self.filename,  'rb') as f:
-            self._buffer = f.read()
-        self._md5 = hashlib.md5(self._buffer).hexdigest()
+
+        # 内存映射文件，文件内容由操作系统按需读入页缓存，不占用进程内存
+        # 映射后文件被截断时，访问超出新长度的页会触发SIGBUS使进程崩溃，因此只映射大文件，
+        # 并且要求映射前文件已经一段时间没有修改、计算md5前后大小和修改时间不变，否则改为读入内存
+        self._mmap = None
+        with open(self.filename, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if st.st_size >= self.mmap_threshold and time.time() - st.st_mtime >= self.mmap_stable_seconds:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._md5 = md5 or self.__hash(memoryview(self._mmap))
+                changed = os.fstat(f.fileno())
+                if (changed.st_size, changed.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+                    self._mmap.close()
+                    self._mmap = None
+                    f.seek(0)
+            if self._mmap is None:
+                data = f.read()
+                self._md5 = md5 or self.__hash(memoryview(data))
+        self._view = memoryview(self._mmap) if self._mmap is not None else memoryview(data)
+        self._buffer = None if self._mmap is not None else data
+
+    def __hash(self, view):
+        md5 = hashlib.md5()
+        for i in range(0, len(view), self._hash_chunk_size):
+            md5.update(view[i:i + self._hash_chunk_size])
+        view.release()
+        return md5.hexdigest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        释放内存映射；仍有读取流引用时，由垃圾回收释放
+        """
+        self._buffer = None
+        try:
+            self._view.release()
+            if self._mmap is not None:
+                self._mmap.close()
+        except BufferError:
+            pass
+
+    def stream(self):
+        """
+        文件内容的只读流（零拷贝），供各解析库读取
+        """
+        return MemoryStream(self._view)
 
     @property
     def filename(self):
@@ -66,15 +487,56 @@ class FileReader:
     def md5(self):
         return self._md5
 
+    @property
+    def view(self):
+        """
+        文件内容的只读内存视图（零拷贝）
+        """
+        return self._view
+
     @property
     def buffer(self):
+        """
+        文件内容的bytes副本，首次访问时才复制，新代码请使用view或stream()
+        """
+        if self._buffer is None:
+            self._buffer = self._view.tobytes()
         return self._buffer
 
 
+def num_to_letters(num):
+    letters = []
+    while num:
+        num, remainder = divmod(num - 1, 26)
+        letters.append(chr(remainder + ord('A')))
+    return ''.join(reversed(letters))
+
+
+def letters_to_num(letters):
+    num = 0
+    for c in letters.upper():
+        num = num * 26 + ord(c) - ord('A') + 1
+    return num
+
+
+def _excel_engine(engine):
+    """
+    engine为auto时，安装了python-calamine则使用calamine（速度快很多），否则使用pandas默认的引擎
+    """
+    if engine != 'auto':
+        return engine
+    try:
+        import python_calamine  # noqa: F401
+        return 'calamine'
+    except ImportError:
+        return None
+
+
 class ExcelReader(FileReader):
-    def __init__(self, fn):
-        super().__init__(fn)
-        self._excel_file = pd.ExcelFile(io.BytesIO(self.buffer))
+    def __init__(self, fn, engine=None, md5=None):
+        super().__init__(fn, md5)
+        self._engine = _excel_engine(engine)
+        self._excel_file = None
 
         class Item:
             def __init__(self, item_func):
@@ -86,88 +548,767 @@ class ExcelReader(FileReader):
         self.sheet = Item(self.__get_sheet)
         self.__sheets = {}
 
+    @property
+    def excel_file(self):
+        if self._excel_file is None:
+            self._excel_file = pd.ExcelFile(self.stream(), engine=self._engine)
+        return self._excel_file
+
+    @property
+    def engine(self):
+        return self.excel_file.engine
+
     def __get_sheet(self, sheet_name):
         if sheet_name not in self.__sheets:
             self.__sheets[sheet_name] = self.open(sheet_name)
         return self.__sheets[sheet_name]
 
-    def open(self, sheet_name, header=None) -> pd.DataFrame:
-        ret = self._excel_file.parse(sheet_name, header)
+    def open(self, sheet_name, header=None, skiprows=None, nrows=None, dtype=None) -> pd.DataFrame:
+        # 不同引擎解析的类型、空值不完全一致（如日期、整数），缓存按引擎区分
+        return cached_parse(self, 'excel', lambda: self.__parse(sheet_name, header, skiprows, nrows, dtype),
+                            engine=self._engine, sheet_name=sheet_name, header=header, skiprows=skiprows,
+                            nrows=nrows, dtype=dtype)
 
-        def num_to_letters(num):
-            letters = []
-            while num:
-                num, remainder = divmod(num - 1, 26)
-                letters.append(chr(remainder + ord('A')))
-            return ''.join(reversed(letters))
+    def __parse(self, sheet_name, header, skiprows, nrows, dtype):
+        ret = self.excel_file.parse(sheet_name, header, skiprows=skiprows, nrows=nrows, dtype=dtype)
 
         if header is None:
             ret.columns = [num_to_letters(int(c) + 1) for c in ret.columns]
-            ret.index = ret.index + 1
+            ret.index = ret.index + 1 + (skiprows or 0)
 
         return ret
 
+    def read_range(self, sheet_name, rect=pd.IndexSlice[:, :]):
+        """
+        读取矩形区域，单元格值同self.sheet[sheet_name].loc[rect]，但所有列都是object类型，整数单元格保持为整数
+        （整表解析时，同一列其他行的空值或小数会让整列推断为float）；列切片有结束列时，区域内末尾的全空列也会返回（值为空）
+        行范围下推到解析器（skiprows/nrows），读到结束行就停止解析，区域外的行不参与解析
+        列在解析后切片：openpyxl/calamine都按整行读取单元格，usecols并不能减少解析量
+        行不是整数切片时（如布尔索引）按整表切片，列类型为整表推断的类型
+        :param rect: 行号（从1开始）和列字母的切片，如pd.IndexSlice[2:100, 'A':'O']
+        """
+        rows, cols = rect if isinstance(rect, tuple) else (rect, slice(None))
+        if not isinstance(rows, slice) or rows.step is not None or not all(
+                v is None or isinstance(v, int) for v in (rows.start, rows.stop)):
+            return self.sheet[sheet_name].loc[rect]
+
+        skiprows = max(rows.start - 1, 0) if rows.start is not None else None
+        nrows = rows.stop - (skiprows or 0) if rows.stop is not None else None
+        if nrows is not None and nrows <= 0:
+            ret = pd.DataFrame(dtype=object)
+        else:
+            ret = self.open(sheet_name, skiprows=skiprows, nrows=nrows, dtype=object).loc[rows]
+
+        if isinstance(cols, slice) and cols.step is None and isinstance(cols.stop, str) and (
+                cols.start is None or isinstance(cols.start, str)):
+            start = 1 if cols.start is None else letters_to_num(cols.start)
+            span = [num_to_letters(i) for i in range(start, letters_to_num(cols.stop) + 1)]
+            return ret.reindex(columns=span).astype(object)
+        return ret.loc[:, cols]
+
     def cut(self, sheet_name, rect=pd.IndexSlice[:, :]):
-        ret = self.sheet[sheet_name].loc[rect]
+        ret = self.read_range(sheet_name, rect)
         ret.columns = ret.iloc[0]
         ret = ret.iloc[1:]
         ret = ret.dropna(axis=0, how='all')
         return ret
 
+    def iter_rows(self, sheet_name, min_row=None, max_row=None, min_col=None, max_col=None):
+        """
+        只读流式逐行读取（仅支持xlsx），不构建DataFrame，适用于很大的工作表
+        :return: 单元格值元组的生成器
+        """
+        import openpyxl
+
+        wb = openpyxl.load_workbook(self.stream(), read_only=True, data_only=True)
+        try:
+            yield from wb[sheet_name].iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col,
+                                                values_only=True)
+        finally:
+            wb.close()
+
     @property
     def sheet_names(self):
-        return self._excel_file.sheet_names
+        return self.excel_file.sheet_names
+
+
+_boms = ((codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'), (codecs.BOM_UTF8, 'utf-8-sig'),
+         (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+
+
+def _nul_encoding(sample, final):
+    """
+    没有BOM的utf-16/utf-32文本（以ASCII字符为主时）也能通过utf-8检查，按NUL字节所在的位置判断
+    :return: 编码，NUL字节很少或分布不符合时返回None
+    """
+    if len(sample) < 4 or sample.count(0) * 4 < len(sample):
+        return None
+    # 按字节位置统计NUL的比例：utf-32每4字节有3个高位0，utf-16每2字节有1个高位0
+    ratios = [sample[i::4].count(0) / len(sample[i::4]) for i in range(4)]
+    candidates = []
+    if min(ratios[1:]) > 0.9 and ratios[0] < 0.5:
+        candidates.append('utf-32-le')
+    if min(ratios[:3]) > 0.9 and ratios[3] < 0.5:
+        candidates.append('utf-32-be')
+    even, odd = (ratios[0] + ratios[2]) / 2, (ratios[1] + ratios[3]) / 2
+    if odd > 0.5 and odd > even * 2:
+        candidates.append('utf-16-le')
+    if even > 0.5 and even > odd * 2:
+        candidates.append('utf-16-be')
+    for encoding in candidates:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=final)
+            return encoding
+        except UnicodeDecodeError:
+            pass
+    return None
+
+
+def detect_encoding(data, sample_size=64 * 1024):
+    """
+    检测编码：先看BOM，再按NUL字节的分布识别没有BOM的utf-16/utf-32，
+    然后用样本依次尝试utf-8、gb18030（兼容gbk/gb2312），都不行才用chardet检测样本
+    """
+    sample = bytes(data[:sample_size])
+    for bom, encoding in _boms:
+        if sample.startswith(bom):
+            return encoding
+    encoding = _nul_encoding(sample, len(data) <= sample_size)
+    if encoding is not None:
+        return encoding
+    for encoding in ('utf-8', 'gb18030'):
+        try:
+            # 样本末尾可能截断多字节字符，用增量解码器忽略末尾不完整的字符
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=len(data) <= sample_size)
+            return encoding
+        except UnicodeDecodeError:
+            pass
+    return chardet.detect(sample)['encoding'] or 'utf-8'
+
+
+def _fallback_encodings(data, encoding):
+    """
+    样本检测出的编码解码全文失败时依次尝试的编码
+    """
+    yield encoding
+    if encoding != 'gb18030':
+        yield 'gb18030'
+    yield chardet.detect(bytes(data))['encoding'] or 'utf-8'
+
+
+def decode_text(data, encoding):
+    """
+    解码全文，返回(文本, 实际使用的编码)，所有编码都失败时用替换字符解码
+    """
+    for enc in _fallback_encodings(data, encoding):
+        try:
+            return str(data, enc), enc
+        except (UnicodeDecodeError, LookupError):
+            pass
+    return str(data, encoding, errors='replace'), encoding
 
 
 class TxtReader(FileReader, TextReader):
-    def __init__(self, fn):
-        super().__init__(fn)
-        # with open(fn, 'rb') as f:
-        #     data = f.read()
-        TextReader.__init__(self, self.buffer.decode(chardet.detect(self.buffer)['encoding']))
+    _chunk_size = 64 * 1024
+
+    def __init__(self, fn, stream=False, sample_size=64 * 1024, cache_size=32 * 1024 * 1024, md5=None):
+        """
+        :param stream: 流式模式，不保存解码后的全文和行列表，get_value/index_of边解码边查找，适用于很大的文本文件
+        :param sample_size: 编码检测的样本字节数
+        :param cache_size: 流式模式下缓存解码结果的字符数上限，完整解码过一遍且不超过上限时，
+                           后续访问text、逐行读取、查找都直接使用缓存的分块，不再重新解码；0表示不缓存
+        """
+        super().__init__(fn, md5)
+        self._stream = stream
+        self.__cache_size = cache_size
+        self.__chunks = None
+        self._encoding = detect_encoding(self.view, sample_size)
+        if stream:
+            TextReader.__init__(self, None)
+            self._encoding = self.__validate(self._encoding)
+        else:
+            text, self._encoding = decode_text(self.view, self._encoding)
+            TextReader.__init__(self, text)
+
+    def __validate(self, encoding):
+        """
+        增量解码一遍全文（不保存结果）确认编码可用
+        """
+        for enc in _fallback_encodings(self.view, encoding):
+            try:
+                decoder = codecs.getincrementaldecoder(enc)()
+                for i in range(0, len(self.view), self._chunk_size):
+                    decoder.decode(self.view[i:i + self._chunk_size])
+                decoder.decode(b'', final=True)
+                return enc
+            except (UnicodeDecodeError, LookupError):
+                pass
+        return encoding
+
+    @property
+    def encoding(self):
+        return self._encoding
+
+    @property
+    def stream_mode(self):
+        return self._stream
+
+    def __open_text(self):
+        errors = 'replace' if self._stream else 'strict'
+        return io.TextIOWrapper(io.BufferedReader(self.stream()), encoding=self._encoding, errors=errors, newline='')
+
+    def __iter_chunks(self):
+        if self.__chunks is not None:
+            yield from self.__chunks
+            return
+
+        # 完整读完一遍且不超过上限时才保存（中途停止的查找不保存）
+        chunks, size = [], 0
+        with self.__open_text() as f:
+            while True:
+                chunk = f.read(self._chunk_size)
+                if chunk == '':
+                    break
+                if chunks is not None:
+                    size += len(chunk)
+                    if size > self.__cache_size:
+                        chunks = None
+                    else:
+                        chunks.append(chunk)
+                yield chunk
+        if chunks is not None:
+            self.__chunks = chunks
+
+    def iter_lines(self):
+        """
+        逐行读取，结果同text_lines（按str.splitlines的规则分行）
+        """
+        if not self._stream:
+            yield from self.text_lines
+            return
+        tail = ''
+        for chunk in self.__iter_chunks():
+            lines = (tail + chunk).splitlines(keepends=True)
+            # 最后一行可能不完整（或是\r\n中间断开），留到下一块
+            tail = lines.pop() if len(lines) > 0 else ''
+            for line in lines:
+                yield line.splitlines()[0]
+        yield from tail.splitlines()
+
+    @property
+    def text(self):
+        if self._stream:
+            # 流式模式下不保存全文，拼接缓存的分块（没有缓存时重新解码）
+            return ''.join(self.__iter_chunks())
+        return TextReader.text.fget(self)
+
+    @property
+    def text_lines(self):
+        if self._stream:
+            return list(self.iter_lines())
+        return TextReader.text_lines.fget(self)
+
+    def get_value(self, key, sep=None):
+        if not self._stream:
+            return TextReader.get_value(self, key, sep)
+
+        chunks = self.__iter_chunks()
+        tail = ''
+        for chunk in chunks:
+            buf = tail + chunk
+            index = buf.find(key)
+            if index < 0:
+                tail = buf[max(len(buf) - len(key) + 1, 0):] if len(key) > 1 else ''
+                continue
+
+            # 找到key后继续读取，直到值的结束位置（分隔符或空白）
+            rest = buf[index + len(key):].lstrip()
+            while rest == '':
+                rest = next(chunks, None)
+                if rest is None:
+                    return ''.split(sep)[0].strip()
+                rest = rest.lstrip()
+            searched = 0
+            while True:
+                if sep is None:
+                    m = _whitespace.search(rest, searched)
+                    end = m.start() if m is not None else -1
+                else:
+                    end = rest.find(sep, searched)
+                if end >= 0:
+                    return rest[:end].strip()
+                searched = max(len(rest) - (0 if sep is None else len(sep) - 1), 0)
+                chunk = next(chunks, None)
+                if chunk is None:
+                    return rest.split(sep)[0].strip()
+                rest += chunk
+        return None
+
+    def index_of(self, *args, bool_func=all):
+        if not self._stream:
+            return TextReader.index_of(self, *args, bool_func=bool_func)
+        for i, line in enumerate(self.iter_lines()):
+            if bool_func([arg in line for arg in args]):
+                return i
+        return -1
+
+
+_w = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_office_document = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+
+
+def _run_text(r):
+    # 同python-docx的Run.text：w:t为文本，w:tab、w:ptab为制表符，w:cr和换行类型的w:br为换行，w:noBreakHyphen为-
+    parts = []
+    for e in r:
+        tag = e.tag
+        if tag == _w + 't':
+            parts.append(e.text or '')
+        elif tag == _w + 'tab' or tag == _w + 'ptab':
+            parts.append('\t')
+        elif tag == _w + 'cr':
+            parts.append('\n')
+        elif tag == _w + 'br':
+            if e.get(_w + 'type', 'textWrapping') == 'textWrapping':
+                parts.append('\n')
+        elif tag == _w + 'noBreakHyphen':
+            parts.append('-')
+    return ''.join(parts)
+
+
+def _paragraph_text(p):
+    parts = []
+    for e in p:
+        if e.tag == _w + 'r':
+            parts.append(_run_text(e))
+        elif e.tag == _w + 'hyperlink':
+            parts.extend(_run_text(r) for r in e.iterchildren(_w + 'r'))
+    return ''.join(parts)
+
+
+def _property_value(e, pr_tag, tag, default=None):
+    pr = e.find(pr_tag)
+    prop = pr.find(tag) if pr is not None else None
+    if prop is None:
+        return default
+    return prop.get(_w + 'val')
+
+
+def _table_rows(tbl):
+    """
+    表格转为单元格文本列表，同python-docx的[[c.text for c in r.cells] for r in table.rows]：
+    横向合并（gridSpan）的单元格重复span次，纵向合并（vMerge=continue）的单元格取上一行同一网格位置的单元格
+    """
+    rows = []
+    above = {}
+    for tr in tbl.iterchildren(_w + 'tr'):
+        offset = int(_property_value(tr, _w + 'trPr', _w + 'gridBefore', 0))
+        row, current = [], {}
+        for tc in tr.iterchildren(_w + 'tc'):
+            span = int(_property_value(tc, _w + 'tcPr', _w + 'gridSpan', 1))
+            v_merge = _property_value(tc, _w + 'tcPr', _w + 'vMerge', 'restart')
+            if v_merge is None:
+                v_merge = 'continue'
+            if v_merge == 'continue' and offset in above:
+                cell = above[offset]
+            else:
+                cell = ('\n'.join(_paragraph_text(p) for p in tc.iterchildren(_w + 'p')), span)
+            current[offset] = cell
+            row.extend([cell[0]] * cell[1])
+            offset += span
+        rows.append(row)
+        above = current
+    return rows
 
 
 class DocxReader(FileReader, TextReader):
-    def __init__(self, fn):
-        super().__init__(fn)
-        self.__document = docx.Document(io.BytesIO(self.buffer))
-        TextReader.__init__(self, '\n'.join([p.text for p in self.__document.paragraphs]))
-        self.__tables = []
-        for t in self.__document.tables:
+    """
+    word文档，段落和表格在首次访问时才解析
+    fast为True时直接流式解析文档xml（不构建python-docx对象模型），结果与python-docx相同，内存和耗时更少
+    """
+
+    def __init__(self, fn, fast=True, md5=None):
+        super().__init__(fn, md5)
+        TextReader.__init__(self, None)
+        self.__fast = fast
+        self.__document = None
+        self.__paragraphs = None
+        self.__text = None
+        self.__tables = None
+
+    @property
+    def fast(self):
+        return self.__fast
+
+    @property
+    def document(self):
+        if self.__document is None:
+            self.__document = docx.Document(self.stream())
+        return self.__document
+
+    def __document_part(self, zf):
+        try:
+            rels = etree.fromstring(zf.read('_rels/.rels'), etree.XMLParser(resolve_entities=False, no_network=True))
+        except KeyError:
+            return 'word/document.xml'
+        for rel in rels:
+            if rel.get('Type') == _office_document:
+                return rel.get('Target').lstrip('/')
+        return 'word/document.xml'
+
+    def iter_blocks(self, tables=True):
+        """
+        按文档顺序逐个解析正文的段落和表格（不含表格中的段落和嵌套表格），解析完的元素立即释放
+        :param tables: 是否转换表格，为False时表格返回None
+        :return: ('p', 段落文本)或('tbl', 表格)的迭代器
+        """
+        # 同python-docx的解析器，不展开实体、不访问网络，文档中的外部实体不会读取本地文件或发起请求
+        with zipfile.ZipFile(self.stream()) as zf, zf.open(self.__document_part(zf)) as f:
+            for _, e in etree.iterparse(f, events=('end',), tag=(_w + 'p', _w + 'tbl'), resolve_entities=False,
+                                        no_network=True):
+                parent = e.getparent()
+                # 表格中的段落和嵌套表格随所在的正文表格一起处理
+                if parent is None or parent.tag != _w + 'body':
+                    continue
+                if e.tag == _w + 'p':
+                    yield 'p', _paragraph_text(e)
+                else:
+                    yield 'tbl', _table_rows(e) if tables else None
+                e.clear()
+                while e.getprevious() is not None:
+                    del parent[0]
+
+    def __parse_paragraphs(self):
+        if self.__fast:
+            return [text for tag, text in self.iter_blocks(tables=False) if tag == 'p']
+        return [p.text for p in self.document.paragraphs]
+
+    def __parse_tables(self):
+        if self.__fast:
+            return list(self.iter_tables())
+        tables = []
+        for t in self.document.tables:
             table = []
             for r in t.rows:
                 table.append([c.text for c in r.cells])
-            self.__tables.append(table)
+            tables.append(table)
+        return tables
 
     @property
-    def document(self):
-        return self.__document
+    def paragraphs(self):
+        if self.__paragraphs is None:
+            self.__paragraphs = cached_parse(self, 'docx_paragraphs', self.__parse_paragraphs)
+        return self.__paragraphs
+
+    @property
+    def text(self):
+        if self.__text is None:
+            self.__text = '\n'.join(self.paragraphs)
+        return self.__text
 
     @property
     def tables(self):
+        if self.__tables is None:
+            self.__tables = cached_parse(self, 'docx_tables', self.__parse_tables)
         return self.__tables
 
+    def iter_tables(self):
+        for tag, table in self.iter_blocks():
+            if tag == 'tbl':
+                yield table
+
+    def __parse_table(self, index):
+        if self.__fast and index >= 0:
+            for i, table in enumerate(self.iter_tables()):
+                if i == index:
+                    return table
+            raise IndexError('table index out of range')
+        return self.tables[index]
+
+    def table(self, index):
+        """
+        只解析第index个表格（从0开始），表格已全部解析时直接返回
+        """
+        if self.__tables is not None:
+            return self.__tables[index]
+        return cached_parse(self, 'docx_table', lambda: self.__parse_table(index), index=index)
+
+
+def _extract_page(page, part):
+    if part == 'tables':
+        return page.extract_tables()
+    return merge_lines([tl['chars'] for tl in page.extract_text_lines()])
+
+
+def _extract_and_close(page, *parts):
+    """
+    提取后释放页面缓存的版面对象（字符、线条等），否则整个文档的版面对象会一直留在内存中直到关闭文档
+    """
+    try:
+        return tuple(_extract_page(page, part) for part in parts)
+    finally:
+        page.close()
+
+
+class PdfPage(TextReader):
+    """
+    pdf页面，表格和文本行在首次访问时才分别提取
+    """
+
+    def __init__(self, reader, page_number, tables=None, words_lines=None):
+        super().__init__(None)
+        self.__reader = reader
+        self.__page_number = page_number
+        self.__tables = tables
+        self.__words_lines = words_lines
+        self.__text = None
+        self.__text_lines = None
+
+    @property
+    def page_number(self):
+        return self.__page_number
+
+    @property
+    def tables(self):
+        if self.__tables is None:
+            self.__tables = self.__reader.extract(self.__page_number, 'tables')
+        return self.__tables
+
+    @property
+    def words_lines(self):
+        if self.__words_lines is None:
+            self.__words_lines = self.__reader.extract(self.__page_number, 'words')
+        return self.__words_lines
+
+    @property
+    def text(self):
+        if self.__text is None:
+            self.__text = '\n'.join([' '.join([w.text for w in wl]) for wl in self.words_lines])
+        return self.__text
+
+    @property
+    def text_lines(self):
+        if self.__text_lines is None:
+            self.__text_lines = self.text.splitlines()
+        return self.__text_lines
+
 
 class PdfReader(FileReader):
-    def __init__(self, fn):
-        super().__init__(fn)
+    def __init__(self, fn, pages=None, processes=0, md5=None):
+        """
+        :param pages: 需要的页码列表（从1开始），不传则为全部页面
+        :param processes: 大于1时用多个子进程并行提取所有页面（不超过cpu核数），按页码顺序合并结果；否则在访问时逐页提取
+        每个页面提取后释放其版面对象，close（或with语句结束）时关闭文档
+        """
+        super().__init__(fn, md5)
+        self.__lock = RLock()
+        self.__pdf = None
+
+        if pages is None:
+            pages = range(1, cached_parse(self, 'pdf_page_count', lambda: len(self.pdf.pages)) + 1)
+        page_numbers = list(pages)
 
-        class Page(TextReader):
-            def __init__(self, _p):
-                # super().__init__(_p.extract_text())
-                self.tables = _p.extract_tables()
-                self.words_lines = [merge_chars(tl['chars']) for tl in _p.extract_text_lines()]
-                super().__init__('\n'.join([' '.join([w['text'] for w in wl]) for wl in self.words_lines]))
+        extracted = {}
+        processes = min(processes, os.cpu_count() or 1, len(page_numbers))
+        if processes > 1 and hasattr(os, 'fork'):
+            extracted = self.__extract_parallel(page_numbers, processes)
+        self.__pages = [PdfPage(self, n, *extracted.get(n, (None, None))) for n in page_numbers]
 
-        self.__pages = []
-        with pdfplumber.open(io.BytesIO(self.buffer)) as f:
-            for p in f.pages:
-                self.__pages.append(Page(p))
+    @property
+    def pdf(self):
+        with self.__lock:
+            if self.__pdf is None:
+                self.__pdf = pdfplumber.open(self.stream())
+            return self.__pdf
 
     @property
     def pages(self):
         return self.__pages
 
+    def extract(self, page_number, part):
+        """
+        提取单个页面的表格（part='tables'）或文本行（part='words'）
+        """
+        def parse():
+            with self.__lock:
+                return _extract_and_close(self.pdf.pages[page_number - 1], part)[0]
+
+        return cached_parse(self, 'pdf_page', parse, page=page_number, part=part)
+
+    def __extract_parallel(self, page_numbers, processes):
+        cache = get_parse_cache()
+        if cache is not None:
+            keys = {(n, part): cache.key(self.md5, 'pdf_page', page=n, part=part)
+                    for n in page_numbers for part in ('tables', 'words')}
+            ret = {}
+            for n in page_numbers:
+                tables, words_lines = cache.get(keys[(n, 'tables')]), cache.get(keys[(n, 'words')])
+                if tables is not None and words_lines is not None:
+                    ret[n] = (tables, words_lines)
+            page_numbers = [n for n in page_numbers if n not in ret]
+        else:
+            ret = {}
+
+        # fork的子进程继承文件的内存映射，各自打开pdf提取一部分页面，结果只包含基本类型，通过管道传回
+        ctx = multiprocessing.get_context('fork')
+        workers = []
+        for chunk in [page_numbers[i::processes] for i in range(processes)]:
+            if len(chunk) == 0:
+                continue
+            recv_conn, send_conn = ctx.Pipe(duplex=False)
+
+            def target(chunk=chunk, send_conn=send_conn):
+                try:
+                    with pdfplumber.open(self.stream()) as pdf:
+                        result = {n: _extract_and_close(pdf.pages[n - 1], 'tables', 'words') for n in chunk}
+                    send_conn.send((True, result))
+                except BaseException as e:
+                    send_conn.send((False, repr(e)))
+                send_conn.close()
+
+            process = ctx.Process(target=target, daemon=True)
+            process.start()
+            send_conn.close()
+            workers.append((process, recv_conn))
+
+        errors = []
+        for process, recv_conn in workers:
+            try:
+                ok, result = recv_conn.recv()
+            except EOFError:
+                ok, result = False, '提取进程异常退出，退出码%s' % process.exitcode
+            recv_conn.close()
+            process.join()
+            if ok:
+                ret.update(result)
+            else:
+                errors.append(result)
+        if len(errors) > 0:
+            raise RuntimeError('pdf页面提取失败：%s' % '; '.join(errors))
+
+        if cache is not None:
+            for n in page_numbers:
+                cache.put(keys[(n, 'tables')], ret[n][0])
+                cache.put(keys[(n, 'words')], ret[n][1])
+        return ret
+
+    def close(self):
+        with self.__lock:
+            if self.__pdf is not None:
+                self.__pdf.close()
+                self.__pdf = None
+        super().close()
+
+
+_primitive_types = (str, int, float, bool, type(None))
+
+
+class Word(MutableMapping):
+    """
+    单词：文本加第一个字符（其他属性取第一个字符的属性），支持word['x0']、word.x0两种访问方式
+    只引用第一个字符，不复制字符字典；修改属性时才复制（不影响原字符）；序列化时只保留基本类型的属性
+    兼容原来的单词字典（第一个字符的副本，text为整个单词）：支持取值、keys/items/values/get、in、len、迭代、修改、与dict比较相等；
+    不兼容之处：不是dict的子类，isinstance(word, dict)为False，json序列化等需要dict的地方要先dict(word)
+    """
+    __slots__ = ('text', 'char', 'owned')
+
+    def __init__(self, text, char):
+        self.text = text
+        self.char = char
+        self.owned = False
+
+    def __getitem__(self, key):
+        return self.text if key == 'text' else self.char[key]
+
+    def __setitem__(self, key, value):
+        if key == 'text':
+            self.text = value
+            return
+        if not self.owned:
+            self.char, self.owned = dict(self.char), True
+        self.char[key] = value
+
+    def __delitem__(self, key):
+        if key == 'text':
+            raise TypeError('单词的text不能删除')
+        if not self.owned:
+            self.char, self.owned = dict(self.char), True
+        del self.char[key]
+
+    def __iter__(self):
+        yield from self.char
+        if 'text' not in self.char:
+            yield 'text'
+
+    def __len__(self):
+        return len(self.char) + ('text' not in self.char)
+
+    def __getattr__(self, key):
+        # 反序列化时槽位还没有赋值，不能再去访问char
+        if key in Word.__slots__:
+            raise AttributeError(key)
+        try:
+            return self.char[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    def __contains__(self, key):
+        return key == 'text' or key in self.char
+
+    def get(self, key, default=None):
+        return self.text if key == 'text' else self.char.get(key, default)
+
+    def copy(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return 'Word(%r, x0=%r, top=%r)' % (self.text, self.char.get('x0'), self.char.get('top'))
+
+    def __copy__(self):
+        # 浅复制保留所有属性（序列化时才去掉非基本类型的属性）
+        word = Word(self.text, dict(self.char))
+        word.owned = True
+        return word
+
+    def __getstate__(self):
+        return self.text, {k: v for k, v in self.char.items() if isinstance(v, _primitive_types) or (
+                isinstance(v, tuple) and all(isinstance(x, (int, float)) for x in v))}
+
+    def __setstate__(self, state):
+        self.text, self.char = state
+        self.owned = True
+
+
+def merge_lines(lines):
+    """
+    合并多行字符变成单词，整页一次向量化计算分词位置
+    后一个字符与前一个字符的x0之差大于前一个字符的宽度+1时断开（同merge_chars）
+    :param lines: 每行的字符列表
+    :return: 每行的单词列表
+    """
+    chars = [c for line in lines for c in line]
+    if len(chars) == 0:
+        return [[] for _ in lines]
+
+    x0 = np.fromiter(map(itemgetter('x0'), chars), dtype=np.float64, count=len(chars))
+    width = np.fromiter(map(itemgetter('width'), chars), dtype=np.float64, count=len(chars))
+
+    starts = np.empty(len(chars), dtype=bool)
+    starts[0] = True
+    starts[1:] = x0[1:] - x0[:-1] > width[:-1] + 1
+    line_starts = np.cumsum([0] + [len(line) for line in lines[:-1]])
+    starts[line_starts[line_starts < len(chars)]] = True
+
+    word_starts = np.flatnonzero(starts)
+    word_ends = np.append(word_starts[1:], len(chars))
+    word_lines = np.searchsorted(line_starts, word_starts, side='right') - 1
+
+    texts = list(map(itemgetter('text'), chars))
+    ret = [[] for _ in lines]
+    for start, end, line in zip(word_starts.tolist(), word_ends.tolist(), word_lines.tolist()):
+        ret[line].append(Word(''.join(texts[start:end]), chars[start]))
+    return ret
+
 
 def merge_chars(chars):
     """
@@ -175,15 +1316,4 @@ def merge_chars(chars):
     :param chars: 字符列表
     :return: 单词列表
     """
-    ret = []
-    word = chars[0].copy()
-    for i in range(1, len(chars)):
-        char_a = chars[i - 1]
-        char_b = chars[i]
-        if char_b['x0'] - char_a['x0'] > char_a['width'] + 1:
-            ret.append(word)
-            word = chars[i].copy()
-        else:
-            word['text'] += chars[i]['text']
-    ret.append(word)
-    return ret
+    return merge_lines([chars])[0]
@@ -1,5 +1,34 @@
+import numpy as np
+import pandas as pd
+
 from decimal import Decimal, ROUND_HALF_UP
 
 
 def mce_round(value, n_digits):
-    return float(Decimal(str(value)).quantize(Decimal(f'0.{"0" * n_digits}'), rounding=ROUND_HALF_UP))
\ No newline at end of file
+    return float(Decimal(str(value)).quantize(Decimal(f'0.{"0" * n_digits}'), rounding=ROUND_HALF_UP))
+
+
+def mce_round_array(values, n_digits):
+    """
+    按列四舍五入，结果与逐个调用mce_round相同
+    远离.5的值直接按数组计算；接近.5（二进制表示可能有误差）、绝对值很大或非有限的值逐个调用mce_round
+    :return: 传入Series时返回Series（保留索引），否则返回ndarray
+    """
+    index = values.index if isinstance(values, pd.Series) else None
+    arr = np.asarray(values)
+
+    if arr.dtype.kind not in 'iuf' or n_digits < 0:
+        ret = np.array([mce_round(v, n_digits) for v in arr.ravel()], dtype=float).reshape(arr.shape)
+    else:
+        arr = arr.astype(float)
+        scale = 10.0 ** n_digits
+        with np.errstate(invalid='ignore', over='ignore'):
+            scaled = np.abs(arr) * scale
+            fraction = scaled - np.floor(scaled)
+            exact = np.isfinite(scaled) & (scaled < 1e9) & (np.abs(fraction - 0.5) > 1e-6)
+        ret = np.empty(arr.shape, dtype=float)
+        # 整数除以10的幂是正确舍入的，与float(Decimal(...))完全相同
+        ret[exact] = np.copysign(np.floor(scaled[exact] + 0.5), arr[exact]) / scale
+        ret[~exact] = [mce_round(v, n_digits) for v in arr[~exact].tolist()]
+
+    return ret if index is None else pd.Series(ret, index=index)
@@ -1,9 +1,146 @@
 import time
 from typing import Union
+import numpy as np
 import pandas as pd
 
 import sc_file_reader
 
+_date_format = '%Y-%m-%d'
+
+
+def _format_column(column: pd.Series, date_format=_date_format):
+    """
+    整列转换成列表，日期转换成字符串（NaT保持不变，同逐行转换）
+    """
+    if column.dtype.kind == 'M':
+        ret = column.dt.strftime(date_format).astype(object)
+        ret[column.isna()] = pd.NaT
+        return ret.tolist()
+    if column.dtype == object:
+        return [v.strftime(date_format) if isinstance(v, pd.Timestamp) else v for v in column.tolist()]
+    return column.tolist()
+
+
+def _positional_columns(data):
+    """
+    tables_extend的列数据按位置对应：Series丢弃索引，标量扩展为整列
+    :return: ({列名: 列数据（Series、数组或列表）}, 行数)
+    """
+    if isinstance(data, pd.DataFrame):
+        return {c: data[c].reset_index(drop=True) for c in data.columns}, len(data)
+
+    columns, length = {}, None
+    for name, value in data.items():
+        if isinstance(value, pd.Series):
+            value = value.reset_index(drop=True)
+        elif isinstance(value, (np.ndarray, pd.Index)):
+            value = np.asarray(value)
+        elif isinstance(value, (list, tuple, range)):
+            value = list(value)
+        else:
+            continue
+        if length is not None and len(value) != length:
+            raise Exception(f'列【{name}】的长度{len(value)}与其他列的长度{length}不一致')
+        columns[name], length = value, len(value)
+
+    if length is None:
+        length = 1 if len(data) > 0 else 0
+    for name, value in data.items():
+        if name not in columns:
+            columns[name] = [value] * length
+    return columns, length
+
+
+class ColumnTable:
+    """
+    按列存储的结果表，每个字段是一组有类型的数组（pandas Series），比逐行字典省内存；
+    日期格式化等按列进行，迭代或按下标取值时才生成行字典，可以当作行字典列表使用
+    """
+
+    def __init__(self, fields):
+        self.__fields = list(fields)
+        self.__chunks = {field_name: [] for field_name in self.__fields}
+        self.__pending = []
+        self.__length = 0
+
+    @property
+    def fields(self):
+        return list(self.__fields)
+
+    def __len__(self):
+        return self.__length
+
+    def append(self, row: dict):
+        # 逐行追加的数据先暂存，取列时再整体转成数组
+        self.__pending.append(row)
+        self.__length += 1
+
+    def extend(self, columns: dict):
+        """
+        :param columns: {字段名: 列数据（Series、数组或列表，长度相同）}
+        """
+        self.__flush()
+        length = None
+        for field_name in self.__fields:
+            column = columns[field_name]
+            if not isinstance(column, pd.Series):
+                column = pd.Series(column, dtype=None if isinstance(column, np.ndarray) else object)
+            if length is not None and len(column) != length:
+                raise Exception(f'字段【{field_name}】的长度与其他字段不一致')
+            length = len(column)
+            self.__chunks[field_name].append(column.reset_index(drop=True))
+        self.__length += length or 0
+
+    def __flush(self):
+        if len(self.__pending) == 0:
+            return
+        for field_name in self.__fields:
+            self.__chunks[field_name].append(pd.Series([row[field_name] for row in self.__pending], dtype=object))
+        self.__pending = []
+
+    def column(self, field_name) -> pd.Series:
+        self.__flush()
+        chunks = self.__chunks[field_name]
+        if len(chunks) == 0:
+            return pd.Series([], dtype=object)
+        if len(chunks) > 1:
+            # 合并后只保留一块；dtype不同的块先各自转为object再合并，否则pandas会统一成公共类型改变取值
+            # （如int64和float64合并后整数变成1.0、2.0），与逐行存储的值不一致
+            if len({chunk.dtype for chunk in chunks}) > 1:
+                chunks[:] = [chunk.astype(object) for chunk in chunks]
+            chunks[:] = [pd.concat(chunks, ignore_index=True)]
+        return chunks[0]
+
+    def columns(self, date_format=None):
+        """
+        :param date_format: 日期转换成字符串的格式，为None时保持原值
+        :return: {字段名: 值列表}
+        """
+        if date_format is None:
+            return {field_name: self.column(field_name).tolist() for field_name in self.__fields}
+        return {field_name: _format_column(self.column(field_name), date_format) for field_name in self.__fields}
+
+    def to_rows(self, date_format=None):
+        columns = self.columns(date_format)
+        return [dict(zip(self.__fields, row)) for row in zip(*[columns[f] for f in self.__fields])]
+
+    def to_dataframe(self):
+        return pd.DataFrame({field_name: self.column(field_name) for field_name in self.__fields})
+
+    def __iter__(self):
+        return iter(self.to_rows())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.to_rows()[index]
+        if index < 0:
+            index += self.__length
+        if not 0 <= index < self.__length:
+            raise IndexError('row index out of range')
+        return {field_name: self.column(field_name).iloc[[index]].tolist()[0] for field_name in self.__fields}
+
+    def __repr__(self):
+        return f'ColumnTable({self.__fields}, rows={self.__length})'
 
 
 class ResultData:
@@ -47,16 +184,29 @@ class ResultData:
             else:
                 raise Exception('设置解析结果属性时，传入数据类型错误！')
 
-    def to_dict(self):
+    def to_dict(self, columnar=False):
+        """
+        :param columnar: 为True时按列存储的表输出为{字段名: 值列表}，否则输出为行字典列表
+        """
         # self.parseTime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
         self.parseTime = float(time.strftime('%Y%m%d.%H%M%S', time.localtime()))
+        if any(isinstance(t, ColumnTable) for t in self.extractTables.values()):
+            # 按列存储的表在这里才按列格式化日期、生成输出，不修改表本身
+            return dict(self.__dict__, extractTables={
+                table_name: (t.columns(_date_format) if columnar else t.to_rows(_date_format))
+                if isinstance(t, ColumnTable) else t
+                for table_name, t in self.extractTables.items()})
         return self.__dict__
 
 
 class BusinessData:
-    def __init__(self, source: Union[sc_file_reader.FileReader, dict] = None, provider=None):
+    def __init__(self, source: Union[sc_file_reader.FileReader, dict] = None, provider=None, columnar=False):
+        """
+        :param columnar: 为True时结果表按列存储（ColumnTable），result输出的行字典与逐行存储相同
+        """
         self.data = ResultData(source, provider)
         self.tables_structure = None
+        self.columnar = columnar
         self.personalization()
 
     def personalization(self):
@@ -65,6 +215,8 @@ class BusinessData:
     @property
     def result(self):
         for table_name in self.data.extractTables.keys():
+            if isinstance(self.data.extractTables[table_name], ColumnTable):
+                continue
             for row in self.data.extractTables[table_name]:
                 for key in row.keys():
                     if isinstance(row[key], pd.Timestamp):
@@ -72,12 +224,19 @@ class BusinessData:
 
         return self.data.to_dict()
 
+    @property
+    def column_result(self):
+        """
+        按列输出的结果，extractTables中按列存储的表为{字段名: 值列表}
+        """
+        return self.data.to_dict(columnar=True)
+
     def tables(self, table_name):
         if table_name not in self.tables_structure:
             raise Exception(f'业务数据中没有【{table_name}】表')
 
         if table_name not in self.data.extractTables:
-            self.data.extractTables[table_name] = []
+            self.data.extractTables[table_name] = ColumnTable(self.tables_structure[table_name]) if self.columnar else []
 
         return self.data.extractTables[table_name]
 
@@ -87,6 +246,35 @@ class BusinessData:
              for field_name in self.tables_structure[table_name]}
         )
 
+    def tables_extend(self, table_name, data, mapping: dict = None, match_fields=True):
+        """
+        批量追加行，字段只校验一次，按列整体转换成行，结果同逐行调用tables_append
+        :param data: DataFrame，或{列名: 列数据（数组、Series、列表或标量，标量对所有行相同）}；
+                     列数据按位置对应（不按Series的索引对齐），长度必须相同，全部为标量时为一行
+        :param mapping: {字段名: data中的列名}，没有映射的字段取同名列
+        :param match_fields: 为True时data中缺少字段抛出异常，否则缺少的字段为None
+        """
+        data, length = _positional_columns(data)
+        if length == 0:
+            return
+
+        rows = self.tables(table_name)
+        fields = self.tables_structure[table_name]
+        mapping = mapping or {}
+        columns = [mapping.get(field_name, field_name) for field_name in fields]
+        missing = [field_name for field_name, c in zip(fields, columns) if c not in data]
+        if match_fields and len(missing) > 0:
+            raise Exception(f'【{table_name}】表缺少字段：{missing}')
+
+        if isinstance(rows, ColumnTable):
+            rows.extend({field_name: [None] * length if field_name in missing else data[c]
+                         for field_name, c in zip(fields, columns)})
+            return
+
+        values = [[None] * length if field_name in missing else list(data[c])
+                  for field_name, c in zip(fields, columns)]
+        rows.extend(dict(zip(fields, row)) for row in zip(*values))
+
 
 class OptionBaseInfo(BusinessData):
     def personalization(self):
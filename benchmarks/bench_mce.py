@@ -0,0 +1,283 @@
+"""
+计算引擎核心性能基准
+使用临时sqlite库中的合成计算对象，覆盖：Evaluator.eval（冷/热全局变量、有/无缓存、深层coe调用链）、_make_key、
+LRUTTLCache并发读写及过期检查、_compile命中率、exec_api的json编码；结果以json格式输出，便于不同版本间对比
+
+用法：
+    python benchmarks/bench_mce.py -o result.json
+    python benchmarks/bench_mce.py -o new.json --compare old.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+from threading import Thread, Barrier
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app'))
+
+import mce  # noqa: E402
+from mce import code_parser  # noqa: E402
+from mce.custom_cache import LRUTTLCache  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+
+_json_encoder_code = '''import json
+import datetime
+import pandas as pd
+
+
+class APIJSONEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        if isinstance(o, pd.DataFrame):
+            return json.loads(o.to_json(orient='table'))
+        return super(APIJSONEncoder, self).default(o)
+'''
+
+_module_code = '''import math
+import decimal
+import datetime
+
+
+def add(a, b):
+    return a + b
+
+
+def area(r):
+    return round(math.pi * r * r, 6)
+
+
+RATES = {str(i): i / 100 for i in range(1000)}
+'''
+
+
+def measure(func, number=1000, repeat=5):
+    """
+    多轮计时，返回单次调用耗时统计（微秒）
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number * 1e6)
+    return {
+        'number': number,
+        'repeat': repeat,
+        'min_us': min(samples),
+        'median_us': statistics.median(samples),
+        'mean_us': statistics.mean(samples)
+    }
+
+
+def setup_objects(chain_depths):
+    mce.add(object_id='api_json_encoder', python_code=_json_encoder_code, python_expr='APIJSONEncoder')
+    mce.add(object_id='bm_module', python_code=_module_code, python_expr='add(a, b)')
+    mce.add(object_id='bm_cached', python_code=_module_code, python_expr='area(r)',
+            lru_maxsize=1024, ttl_seconds=3600)
+    mce.add(object_id='bm_import', python_code="import_code('bm_module')", python_expr='bm_module.add(a, b)')
+    mce.add(object_id='bm_rows', python_code='', python_expr='[{"k": i, "v": i * 1.5, "s": str(i)} for i in range(n)]')
+    mce.add(object_id='bm_frame', python_code='import pandas as pd',
+            python_expr='pd.DataFrame({"k": range(n), "v": [i * 1.5 for i in range(n)]})')
+
+    for depth in chain_depths:
+        for i in range(depth):
+            expr = 'x + 1' if i == depth - 1 else "coe('bm_chain%d_%d', x=x) + 1" % (depth, i + 1)
+            mce.add(object_id='bm_chain%d_%d' % (depth, i), python_code='', python_expr=expr)
+
+
+def bench_eval(quick):
+    n = 200 if quick else 2000
+    ret = {}
+
+    def cold():
+        # 每次重建计算对象，全局变量需要重新执行代码块（编译结果由_compile缓存）
+        mce._calc_object_manager.set('bm_cold', py_code=_module_code, py_expr='add(a, b)')
+        mce.execute('bm_cold', a=1, b=2)
+
+    ret['eval_cold_globals'] = measure(cold, n // 10)
+    ret['eval_warm_globals'] = measure(lambda: mce.execute('bm_module', a=1, b=2), n)
+    ret['eval_import_code'] = measure(lambda: mce.execute('bm_import', a=1, b=2), n)
+
+    ret['eval_uncached'] = measure(lambda: mce.execute('bm_module', a=random.random(), b=1), n)
+    mce.execute('bm_cached', r=3)
+    ret['eval_cached_hit'] = measure(lambda: mce.execute('bm_cached', r=3), n)
+    ret['eval_cached_miss'] = measure(lambda: mce.execute('bm_cached', r=random.random()), n)
+
+    for depth in (10, 50):
+        ret['eval_coe_chain_%d' % depth] = measure(lambda: mce.execute('bm_chain%d_0' % depth, x=1), n // 10)
+    return ret
+
+
+class _Opaque:
+    pass
+
+
+def bench_make_key(quick):
+    n = 5000 if quick else 50000
+    obj = _Opaque()
+    shapes = {
+        'make_key_no_args': (('co',), {}),
+        'make_key_3_scalars': (('co',), {'a': 1, 'b': 'x', 'c': 1.5}),
+        'make_key_20_scalars': (('co',), {'k%d' % i: i for i in range(20)}),
+        'make_key_tuple': (('co',), {'t': tuple(range(50))}),
+        'make_key_objects': (('co',), {'o': obj, 'l': [1, 2, 3], 'd': {'a': 1}})
+    }
+    return {name: measure(lambda: code_parser._make_key(*args, **kwargs), n) for name, (args, kwargs) in
+            shapes.items()}
+
+
+def bench_cache(quick):
+    ops = 2000 if quick else 20000
+    ret = {}
+
+    cache = LRUTTLCache(1024, 3600)
+    for i in range(1024):
+        cache.put(i, i)
+    ret['cache_get_hit'] = measure(lambda: cache.get(500), ops)
+    ret['cache_get_miss'] = measure(lambda: cache.get(-1), ops)
+    ret['cache_put_evict'] = measure(lambda: cache.put(random.random(), 1), ops)
+
+    for threads in (1, 4, 8):
+        cache = LRUTTLCache(1024, 3600)
+        barrier = Barrier(threads)
+
+        def worker():
+            rnd = random.Random()
+            barrier.wait()
+            for _ in range(ops):
+                k = rnd.randrange(2048)
+                if cache.get(k) is None:
+                    cache.put(k, k)
+
+        ts = [Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+        elapsed = time.perf_counter() - start
+        ret['cache_contention_%d_threads' % threads] = {
+            'number': ops * threads,
+            'ops_per_second': ops * threads / elapsed,
+            'mean_us': elapsed / (ops * threads) * 1e6
+        }
+
+    cache = LRUTTLCache(10000, 0)
+
+    def expire():
+        for i in range(10000):
+            cache.put(i, i)
+        cache.timeout_check()
+
+    ret['cache_timeout_check_10000'] = measure(expire, 1, 3 if quick else 10)
+    return ret
+
+
+def bench_compile(quick):
+    n = 200 if quick else 2000
+    code_parser._compile.cache_clear()
+    for _ in range(n):
+        mce.execute('bm_module', a=1, b=2)
+        mce.execute('bm_cached', r=random.randrange(100))
+        mce.execute('bm_chain10_0', x=1)
+    info = code_parser._compile.cache_info()
+
+    code_parser._compile('x + 1', 'bm_compile_hit', 'eval')
+    ret = {
+        'compile_hit_ratio': {
+            'hits': info.hits,
+            'misses': info.misses,
+            'ratio': info.hits / max(info.hits + info.misses, 1)
+        },
+        'compile_hit': measure(lambda: code_parser._compile('x + 1', 'bm_compile_hit', 'eval'), n * 10),
+        'compile_miss': measure(lambda: code_parser._compile(_module_code, str(random.random())), n // 10)
+    }
+    return ret
+
+
+def bench_exec_api(quick):
+    n = 50 if quick else 500
+    ret = {}
+    for rows in (10, 1000):
+        ret['exec_api_rows_%d' % rows] = measure(lambda: mce.exec_api('execute', object_id='bm_rows', n=rows), n)
+        ret['exec_api_frame_%d' % rows] = measure(lambda: mce.exec_api('execute', object_id='bm_frame', n=rows), n)
+    ret['exec_api_no_encoder'] = measure(
+        lambda: mce.exec_api('execute', json_encoder_name='', object_id='bm_rows', n=10), n)
+    return ret
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.realpath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(result, baseline):
+    """
+    打印与基准结果的对比，比值大于1表示变慢
+    """
+    print('%-32s %14s %14s %8s' % ('benchmark', 'baseline_us', 'current_us', 'ratio'))
+    for name, current in result['benchmarks'].items():
+        old = baseline['benchmarks'].get(name)
+        if old is None or 'median_us' not in current or 'median_us' not in old:
+            continue
+        print('%-32s %14.3f %14.3f %8.2f' % (name, old['median_us'], current['median_us'],
+                                             current['median_us'] / old['median_us']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='mce evaluation core benchmarks')
+    parser.add_argument('-o', '--output', help='结果文件（json），不传则输出到标准输出')
+    parser.add_argument('--compare', help='对比的基准结果文件（json）')
+    parser.add_argument('--quick', action='store_true', help='减少迭代次数，快速运行')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mce.init(create_engine('sqlite:///' + os.path.join(tmp, 'bench.db')), 60 * 10)
+        setup_objects((10, 50))
+
+        benchmarks = {}
+        for bench in (bench_eval, bench_make_key, bench_cache, bench_compile, bench_exec_api):
+            benchmarks.update(bench(args.quick))
+
+    result = {
+        'meta': {
+            'mce_version': mce.get_version(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'quick': args.quick,
+            'seed': args.seed
+        },
+        'benchmarks': benchmarks
+    }
+
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    if args.compare is not None:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(result, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+
+# app目录下的mce包、tmtest目录下按文件名互相导入的模块、benchmarks下的工具脚本
+sys.path.insert(0, os.path.join(_root, 'app'))
+sys.path.insert(0, os.path.join(_root, 'app', 'tmtest'))
+sys.path.insert(0, os.path.join(_root, 'benchmarks'))
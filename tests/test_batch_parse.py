@@ -0,0 +1,90 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+
+import batch_parse
+import sc_file_reader
+from mce import file_ledger
+from mce.db_models import create_tables
+from mce.file_ledger import FileLedger
+
+
+def read_text(reader):
+    # 文件内容为crash时子进程直接退出（模拟内存不足被杀）
+    if reader.text.strip() == 'crash':
+        os._exit(1)
+    return [reader.text.strip()]
+
+
+def make_files(tmp_path, names):
+    files = []
+    for name in names:
+        fn = tmp_path / (name + '.txt')
+        fn.write_text(name.split('_')[0])
+        files.append((None, str(fn)))
+    return files
+
+
+def run(files, **kwargs):
+    batch = batch_parse.BatchParser(**kwargs)
+    batch.register(None, '.txt', read_text)
+    return {os.path.basename(r['file_name']): r for r in batch.run_files(files)}
+
+
+def test_parse_in_processes(tmp_path):
+    files = make_files(tmp_path, ['a', 'b', 'c', 'd', 'e'])
+    records = run(files + [(None, str(tmp_path / 'x.bin'))], processes=2)
+    assert {k: r['status'] for k, r in records.items()} == {
+        'a.txt': 'success', 'b.txt': 'success', 'c.txt': 'success', 'd.txt': 'success', 'e.txt': 'success',
+        'x.bin': 'skipped'}
+    assert records['c.txt']['results'] == ['c']
+
+
+def test_broken_pool_fails_only_the_crashing_file(tmp_path):
+    names = ['a', 'b', 'crash_1', 'c', 'd', 'e', 'f', 'crash_2', 'g', 'h']
+    records = run(make_files(tmp_path, names), processes=2, max_pending=4)
+
+    assert len(records) == len(names)
+    for name in names:
+        record = records[name + '.txt']
+        if name.startswith('crash'):
+            assert record['status'] == 'failed' and 'BrokenProcessPool' in record['error']
+        else:
+            assert record['status'] == 'success' and record['results'] == [name]
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    engine = create_engine('sqlite:///' + str(tmp_path / 'mce.db'))
+    create_tables(engine)
+    return FileLedger(engine)
+
+
+def test_ledger_md5_is_hashed_once(tmp_path, ledger, monkeypatch):
+    fn = tmp_path / 'a.txt'
+    fn.write_text('a')
+    files = [(None, str(fn))]
+    assert run(files, processes=0, ledger=ledger)['a.txt']['status'] == 'success'
+
+    hashed = []
+    file_md5 = file_ledger.file_md5
+    monkeypatch.setattr(file_ledger, 'file_md5', lambda name: hashed.append('ledger') or file_md5(name))
+    reader_hash = sc_file_reader.FileReader._FileReader__hash
+    monkeypatch.setattr(sc_file_reader.FileReader, '_FileReader__hash',
+                        lambda self, view: hashed.append('reader') or reader_hash(self, view))
+
+    # 内容变化：台账检查时计算md5，解析时直接使用
+    fn.write_text('ab')
+    record = run(files, processes=0, ledger=ledger)['a.txt']
+    assert record['status'] == 'success' and record['results'] == ['ab']
+    assert record['md5'] == file_md5(str(fn)) and hashed == ['ledger']
+    assert ledger.get(str(fn), record['parser'])['md5'] == record['md5']
+
+    # 检查之后文件又被修改时解析进程重新计算
+    hashed.clear()
+    fn.write_text('abc')
+    os.utime(fn, ns=(0, 0))
+    stat = {'size': 2, 'mtime_ns': 1, 'md5': 'stale'}
+    ret = batch_parse.parse_file(read_text, str(fn), stat)
+    assert ret['md5'] == file_md5(str(fn)) and hashed == ['reader']
@@ -0,0 +1,28 @@
+import json
+import multiprocessing
+
+from capture import RequestRecorder
+
+
+def _write(filename, worker, count):
+    recorder = RequestRecorder(filename)
+    for i in range(count):
+        # 远大于文本文件缓冲区（8KB）的长行
+        recorder.record('execute', {'worker': worker, 'i': i, 'pad': str(worker) * 50000}, 0.0, 0.1, 0)
+
+
+def test_long_lines_from_processes_do_not_interleave(tmp_path):
+    filename = str(tmp_path / 'capture.jsonl')
+    ctx = multiprocessing.get_context('fork')
+    processes = [ctx.Process(target=_write, args=(filename, w, 30)) for w in range(4)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join(30)
+        assert p.exitcode == 0
+
+    with open(filename, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert sorted((r['kwargs']['worker'], r['kwargs']['i']) for r in records) == \
+        [(w, i) for w in range(4) for i in range(30)]
+    assert all(r['kwargs']['pad'] == str(r['kwargs']['worker']) * 50000 for r in records)
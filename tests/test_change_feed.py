@@ -0,0 +1,145 @@
+import multiprocessing
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+
+from mce.db_models import create_tables, MceChangeLog, MceCalcObjectInfo
+from mce.db_operator import DBOperator
+from mce.change_feed import ChangeFeed
+
+
+@pytest.fixture
+def feed(tmp_path):
+    engine = create_engine('sqlite:///' + str(tmp_path / 'mce.db'))
+    create_tables(engine)
+    log = DBOperator(engine, MceChangeLog)
+    log.add(change_id=1, action='object', object_id='old', node_id='other')
+    applied = []
+    # 轮询线程在测试期间不会醒来，由测试直接调用poll
+    cf = ChangeFeed(engine, lambda action, object_id: applied.append((action, object_id)), poll_interval=3600)
+    return cf, log, applied
+
+
+def test_startup_changes_are_not_reapplied(feed):
+    cf, log, applied = feed
+    assert cf.watermark == 1
+    assert cf.poll() == 0
+    assert applied == []
+
+
+def test_late_commit_below_watermark_is_applied_once(feed):
+    cf, log, applied = feed
+    log.add(change_id=10, action='object', object_id='a', node_id='other')
+    assert cf.poll() == 1
+    assert cf.watermark == 10
+
+    # 编号更小的变更在编号10之后才提交
+    log.add(change_id=5, action='object', object_id='b', node_id='other')
+    assert cf.poll() == 1
+    assert applied == [('object', 'a'), ('object', 'b')]
+    assert cf.watermark == 10
+
+    assert cf.poll() == 0
+    assert applied == [('object', 'a'), ('object', 'b')]
+
+
+def test_own_changes_are_skipped_and_outside_window_ignored(feed):
+    cf, log, applied = feed
+    cf.publish('clear_cache', 'x')
+    log.add(change_id=0, action='object', object_id='stale', node_id='other',
+            created_time=datetime.utcnow() - timedelta(hours=1))
+    assert cf.poll() == 0
+    assert applied == []
+
+
+def _node_main(db_file, conn):
+    # 另一个进程中的节点：按父进程的命令修改计算对象、发布变更、轮询，返回应用过的变更
+    engine = create_engine('sqlite:///' + db_file)
+    node = _Node(engine)
+    conn.send(node.feed.node_id)
+    while True:
+        command, args = conn.recv()
+        if command == 'exit':
+            return
+        try:
+            conn.send(getattr(node, command)(*args))
+        except Exception as e:
+            conn.send(e)
+
+
+class _Node:
+    def __init__(self, engine):
+        self.objects = DBOperator(engine, MceCalcObjectInfo)
+        self.log = DBOperator(engine, MceChangeLog)
+        self.applied = []
+        self.feed = ChangeFeed(engine, self.apply, poll_interval=3600)
+
+    def apply(self, action, object_id):
+        # 同mce._sync_object：按数据库中的最新状态区分设置和删除
+        exists = len(self.objects.query(MceCalcObjectInfo.object_id == object_id)) > 0
+        self.applied.append(('set' if exists else 'delete', object_id))
+
+    def set(self, object_id):
+        self.objects.add(object_id=object_id, object_name=object_id)
+        self.feed.publish('object', object_id)
+
+    def delete(self, object_id):
+        self.objects.delete(MceCalcObjectInfo.object_id == object_id)
+        self.feed.publish('object', object_id)
+
+    def late_set(self, change_id, object_id):
+        # 编号小于其他节点水位、晚提交的变更（仍在回看窗口内）
+        self.objects.add(object_id=object_id, object_name=object_id)
+        self.log.add(change_id=change_id, action='object', object_id=object_id, node_id=self.feed.node_id)
+
+    def poll(self, times=3):
+        for _ in range(times):
+            self.feed.poll()
+        return list(self.applied)
+
+
+def test_two_processes_see_each_others_changes_once(tmp_path):
+    db_file = str(tmp_path / 'shared.db')
+    engine = create_engine('sqlite:///' + db_file)
+    create_tables(engine)
+    # 启动前的变更，之后的变更编号从11开始，留出更小的编号模拟晚提交
+    DBOperator(engine, MceChangeLog).add(change_id=10, action='reload', node_id='other')
+
+    ctx = multiprocessing.get_context('fork')
+    parent_conn, child_conn = ctx.Pipe()
+    process = ctx.Process(target=_node_main, args=(db_file, child_conn), daemon=True)
+    process.start()
+
+    def remote(command, *args):
+        parent_conn.send((command, args))
+        ret = parent_conn.recv()
+        if isinstance(ret, Exception):
+            raise ret
+        return ret
+
+    try:
+        remote_node_id = parent_conn.recv()
+        node = _Node(engine)
+        assert node.feed.node_id != remote_node_id
+
+        node.set('a')
+        remote('set', 'b')
+        assert remote('poll') == [('set', 'a')]
+        assert node.poll() == [('set', 'b')]
+
+        node.delete('a')
+        remote('delete', 'b')
+        remote('set', 'c')
+        assert remote('poll') == [('set', 'a'), ('delete', 'a')]
+        assert node.poll() == [('set', 'b'), ('delete', 'b'), ('set', 'c')]
+
+        # 远端节点的变更编号小于本节点水位，只能靠回看窗口读到
+        assert node.feed.watermark == 15
+        remote('late_set', 5, 'late')
+        assert node.poll() == [('set', 'b'), ('delete', 'b'), ('set', 'c'), ('set', 'late')]
+        assert remote('poll') == [('set', 'a'), ('delete', 'a')]
+    finally:
+        parent_conn.send(('exit', ()))
+        process.join(10)
@@ -0,0 +1,111 @@
+import os
+import time
+
+from threading import Event, Thread
+
+import numpy as np
+import pandas as pd
+
+from mce.code_parser import CalcObjectManager, _content_key
+
+_slow = '''
+import time
+
+def slow(x):
+    calls.append(1)
+    time.sleep(0.3)
+    return len(x)
+
+calls = []
+'''
+
+
+def run_concurrently(manager, *kwargs_list):
+    results = [None] * len(kwargs_list)
+
+    def run(i, kwargs):
+        results[i] = manager.eval('slow', **kwargs)
+
+    threads = [Thread(target=run, args=(i, kw)) for i, kw in enumerate(kwargs_list)]
+    for t in threads:
+        t.start()
+        time.sleep(0.05)
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_equal_content_is_coalesced():
+    manager = CalcObjectManager(3600)
+    manager.set('slow', py_code=_slow, py_expr='slow(x)')
+    assert run_concurrently(manager, {'x': [1, 2, 3]}, {'x': [1, 2, 3]}, {'x': [1, 2]}) == [3, 3, 2]
+    assert manager.coalesced == 1
+    assert len(manager.get('slow').globals['calls']) == 2
+
+
+def test_content_key():
+    df = pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']})
+    assert _content_key(df) == _content_key(df.copy())
+    assert _content_key(df) != _content_key(df.assign(a=[1, 3]))
+    assert _content_key(np.arange(3)) == _content_key(np.arange(3))
+    assert _content_key(np.arange(3)) != _content_key(np.arange(3.0))
+    assert _content_key({'a': [1], 'b': {2}}) == _content_key({'b': {2}, 'a': [1]})
+    assert _content_key(1) != _content_key(True)
+    obj = object()
+    assert _content_key(obj) == ('id', id(obj))
+
+
+def test_forked_child_does_not_wait_for_parent_inflight_call():
+    manager = CalcObjectManager(3600)
+    manager.set('slow', py_code=_slow, py_expr='slow(x)')
+    leader = Thread(target=manager.eval, args=('slow',), kwargs={'x': [1]})
+    leader.start()
+    time.sleep(0.1)
+
+    pid = os.fork()
+    if pid == 0:
+        # 父进程的领头线程不在子进程中，相同的调用需要自己执行
+        code = 0 if manager.eval('slow', x=[1]) == 1 else 1
+        os._exit(code)
+    leader.join()
+    assert wait_child(pid), '子进程等待父进程的调用'
+
+
+def wait_child(pid, timeout=5):
+    """
+    :return: 子进程是否在超时前正常退出，超时则杀掉子进程
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            return os.waitstatus_to_exitcode(status) == 0
+        time.sleep(0.05)
+    os.kill(pid, 9)
+    os.waitpid(pid, 0)
+    return False
+
+
+def test_fork_while_background_thread_holds_lock():
+    manager = CalcObjectManager(3600)
+    manager.set('slow', py_code=_slow, py_expr='slow(x)')
+    lock = manager._CalcObjectManager__lock
+    held = Event()
+
+    def hold():
+        # 模拟检查线程或变更同步正在临界区中
+        with lock:
+            held.set()
+            time.sleep(0.3)
+
+    holder = Thread(target=hold)
+    holder.start()
+    held.wait()
+
+    pid = os.fork()
+    if pid == 0:
+        manager.set('other', py_code='', py_expr='x + 1')
+        code = 0 if manager.get('other').co_id == 'other' and manager.eval('other', x=1) == 2 else 1
+        os._exit(code)
+    holder.join()
+    assert wait_child(pid), '子进程继承了被持有的锁'
@@ -0,0 +1,108 @@
+import ast
+
+import pytest
+
+from mce.code_analyzer import analyze
+from mce.code_parser import CalcObjectManager
+
+_nested = '''
+def outer(v):
+    scale = 2
+
+    def inner(w):
+        return w * scale
+    return inner(v)
+'''
+
+
+def exec_params(manager, co_id):
+    """
+    静态分析之前的get_params：执行代码块，用实际的全局变量计算
+    """
+    calc_object = manager.get(co_id)
+    tree = ast.parse(calc_object.py_expr)
+    defined_variables = set(calc_object.globals.keys())
+    loaded_variables = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    defined_variables.add(target.id)
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            loaded_variables.add(node.id)
+    return set(loaded_variables - defined_variables - {'locals'})
+
+
+@pytest.fixture
+def manager():
+    m = CalcObjectManager(0)
+    m.add_kernel_func('read_sql', lambda sql: sql)
+    m.set('globals', py_code='rate = 0.1\nlimit: int = 5\nfor i in range(3):\n    pass',
+          py_expr='(x + rate) * limit + i')
+    m.set('kernel', py_expr='read_sql(sql) + n')
+    m.set('nested', py_code=_nested, py_expr='outer(a) + inner(b)')
+    m.set('base', py_code='k = 2')
+    m.set('child', py_code="from_import_code('base')", py_expr='k * x')
+    m.set('alias', py_code="import_code('base', 'b')", py_expr='b.k * x')
+    m.set('dynamic', py_code="exec('z = 1')", py_expr='z + x')
+    return m
+
+
+@pytest.mark.parametrize('co_id', ['globals', 'kernel', 'nested', 'child', 'alias', 'dynamic'])
+def test_params_match_exec(manager, co_id):
+    assert set(manager.get_params(co_id)) == exec_params(manager, co_id)
+
+
+def test_comprehension_variables_are_not_params(manager):
+    manager.set('comp', py_code='k = 3', py_expr='[v * k * m for v in values if v] + list(map(lambda w: w, ws))')
+    # 执行代码块的旧算法把推导式的循环变量和lambda参数也算作参数
+    assert exec_params(manager, 'comp') == {'v', 'm', 'values', 'w', 'ws', 'list', 'map'}
+    assert sorted(manager.get_params('comp')) == ['m', 'values', 'ws']
+
+
+def test_failing_import_is_not_executed(manager):
+    manager.set('broken', py_code='import not_installed_module', py_expr='not_installed_module.f(x) + y')
+    assert sorted(manager.get_params('broken')) == ['x', 'y']
+    # 旧算法需要执行代码块，导入失败时拿不到参数
+    with pytest.raises(ImportError):
+        exec_params(manager, 'broken')
+
+
+def test_analyze():
+    signature = analyze("from_import_code('base')\nimport_code('lib', 'l')\nimport os.path\n"
+                        "def f():\n    global g\n    g = 1\n",
+                        "coe('other', x=x) + f() + l.y + [n for n in range(z)][0]")
+    # 返回表达式的自由变量，去掉代码块定义的名字和内核函数由get_params完成
+    assert signature['params'] == ['coe', 'f', 'l', 'x', 'z']
+    assert signature['defined'] == {'f', 'g', 'l', 'os'}
+    assert signature['imports'] == ['base']
+    assert signature['references'] == ['base', 'lib', 'other']
+    assert not signature['dynamic']
+
+    assert analyze('from os import *', 'x')['dynamic']
+    assert analyze("import_code(name)", 'x')['dynamic']
+    assert analyze('def f(:', 'x')['dynamic']
+
+
+def test_bulk_get_params(manager):
+    ret = manager.bulk_get_params(['globals', 'kernel', 'missing'])
+    assert list(ret.keys()) == ['globals', 'kernel', 'missing']
+    assert sorted(ret['globals']) == ['x']
+    assert sorted(ret['kernel']) == ['n', 'sql']
+    # 不存在的对象也有一项，参数为None
+    assert ret['missing'] is None
+
+    ret = manager.bulk_get_params()
+    assert sorted(ret.keys()) == ['alias', 'base', 'child', 'dynamic', 'globals', 'kernel', 'nested']
+    assert ret['base'] == []
+
+
+def test_get_signature(manager):
+    signature = manager.get_signature('child')
+    assert signature == {'params': ['x'], 'defined': [], 'imports': ['base'], 'references': ['base'],
+                         'dynamic': False}
+    assert manager.get_signature('dynamic')['dynamic']
+
+    # 导入的对象不存在时无法静态确定，执行代码块也失败，批量获取时该对象的参数为None
+    manager.set('orphan', py_code="from_import_code('gone')", py_expr='x')
+    assert manager.bulk_get_params(['orphan', 'child']) == {'orphan': None, 'child': ['x']}
@@ -0,0 +1,107 @@
+import random
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+
+from mce.db_models import create_tables, MceCalcObjectInfo
+from mce import db_operator
+from mce.db_operator import DBOperator, DynamicOperator
+
+
+@pytest.fixture
+def operator(tmp_path):
+    engine = create_engine('sqlite:///' + str(tmp_path / 'mce.db'))
+    create_tables(engine)
+    op = DBOperator(engine, MceCalcObjectInfo)
+    rnd = random.Random(0)
+    for i in range(60):
+        # 排序字段大量重复且有空值
+        op.add(object_id='co%02d' % i, object_name='n', custom_tag=rnd.choice([None, 'a', 'b', 'c']))
+    return op
+
+
+def _pages(op, order_by, columns, size):
+    rows, after = [], None
+    while True:
+        page = op.query(order_by=order_by, columns=columns, header=size, after=after)
+        rows += page
+        if len(page) < size:
+            return rows
+        after = [page[-1][c] for c in columns]
+
+
+@pytest.mark.parametrize('order_by', [['custom_tag'], ['-custom_tag'], ['-custom_tag', 'object_id']])
+def test_keyset_pages_match_full_query(operator, order_by):
+    columns = [o.lstrip('-') for o in order_by]
+    if 'object_id' not in columns:
+        columns.append('object_id')
+    full = operator.query(order_by=order_by, columns=columns)
+    for size in (1, 7, 60):
+        assert _pages(operator, order_by, columns, size) == full
+    assert len(full) == 60
+    # 空值排在最后
+    values = [r['custom_tag'] for r in full]
+    assert values[values.index(None):] == [None] * values.count(None)
+
+
+def test_keyset_requires_primary_key_value(operator):
+    with pytest.raises(ValueError):
+        operator.query(order_by=['custom_tag'], after=['a'])
+
+
+@pytest.mark.parametrize('batch_size', [1, 7, 60, 1000])
+def test_stream_matches_query(operator, batch_size):
+    criterion = [MceCalcObjectInfo.custom_tag.isnot(None)]
+    full = operator.query(*criterion, order_by=['object_id'], columns=['object_id', 'custom_tag'])
+
+    entities = sorted(operator.stream(*criterion, batch_size=batch_size), key=lambda e: e.object_id)
+    assert [{'object_id': e.object_id, 'custom_tag': e.custom_tag} for e in entities] == full
+
+    frames = list(operator.stream(*criterion, batch_size=batch_size, as_dataframe=True,
+                                  columns=['object_id', 'custom_tag']))
+    assert all(len(f) <= batch_size for f in frames)
+    rows = pd.concat(frames, ignore_index=True).sort_values('object_id').to_dict('records')
+    assert rows == full
+
+
+@pytest.fixture
+def dynamic_engine(tmp_path):
+    engine = create_engine('sqlite:///' + str(tmp_path / 'dyn.db'))
+    with engine.begin() as conn:
+        conn.execute(text('create table t_dyn (id integer primary key, name text)'))
+        conn.execute(text("insert into t_dyn values (1, 'a')"))
+    yield engine
+    DynamicOperator.invalidate(engine)
+    engine.dispose()
+
+
+def test_reflect_is_cached(dynamic_engine, monkeypatch):
+    reflected = []
+    reflect = db_operator.MetaData.reflect
+
+    def counting_reflect(self, *args, **kwargs):
+        reflected.append(kwargs.get('only'))
+        return reflect(self, *args, **kwargs)
+
+    monkeypatch.setattr(db_operator.MetaData, 'reflect', counting_reflect)
+
+    entity = DynamicOperator(dynamic_engine, 'T_DYN').entity
+    assert DynamicOperator(dynamic_engine, 't_dyn').entity is entity
+    assert DynamicOperator.reflect(dynamic_engine, 't_dyn') is entity
+    assert reflected == [['t_dyn']]
+    assert [e.name for e in DynamicOperator(dynamic_engine, 't_dyn').query()] == ['a']
+
+
+def test_invalidate_sees_altered_table(dynamic_engine):
+    operator = DynamicOperator(dynamic_engine, 't_dyn')
+    with dynamic_engine.begin() as conn:
+        conn.execute(text('alter table t_dyn add column amount integer'))
+        conn.execute(text('update t_dyn set amount = 5'))
+
+    # 缓存的实体还是旧的表结构
+    assert 'amount' not in DynamicOperator(dynamic_engine, 't_dyn').entity.__table__.c
+    DynamicOperator.invalidate(dynamic_engine, 'T_DYN')
+    operator = DynamicOperator(dynamic_engine, 't_dyn')
+    assert 'amount' in operator.entity.__table__.c
+    assert operator.query(columns=['id', 'amount']) == [{'id': 1, 'amount': 5}]
@@ -0,0 +1,37 @@
+import zipfile
+
+import sc_file_reader
+
+_ns = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+
+def make_docx(fn, body, doctype=''):
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>%s'
+                '<w:document xmlns:w="%s"><w:body>%s</w:body></w:document>' % (doctype, _ns, body))
+    rels = ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="%s" Target="word/document.xml"/></Relationships>'
+            % sc_file_reader._office_document)
+    with zipfile.ZipFile(fn, 'w') as zf:
+        zf.writestr('_rels/.rels', rels)
+        zf.writestr('word/document.xml', document)
+
+
+def test_iter_blocks(tmp_path):
+    fn = str(tmp_path / 'a.docx')
+    make_docx(fn, '<w:p><w:r><w:t>账户</w:t><w:tab/><w:t>12345</w:t></w:r></w:p>'
+                  '<w:tbl><w:tr><w:tc><w:p><w:r><w:t>a</w:t></w:r></w:p></w:tc>'
+                  '<w:tc><w:p><w:r><w:t>b</w:t></w:r></w:p></w:tc></w:tr></w:tbl>')
+    with sc_file_reader.DocxReader(fn) as reader:
+        assert list(reader.iter_blocks()) == [('p', '账户\t12345'), ('tbl', [['a', 'b']])]
+
+
+def test_external_entities_are_not_resolved(tmp_path):
+    secret = tmp_path / 'secret.txt'
+    secret.write_text('top-secret')
+    fn = str(tmp_path / 'b.docx')
+    doctype = '<!DOCTYPE w:document [<!ENTITY xxe SYSTEM "%s">]>' % secret.as_uri()
+    make_docx(fn, '<w:p><w:r><w:t>x&xxe;</w:t></w:r></w:p>', doctype)
+    with sc_file_reader.DocxReader(fn) as reader:
+        blocks = list(reader.iter_blocks())
+    assert len(blocks) == 1 and 'top-secret' not in blocks[0][1]
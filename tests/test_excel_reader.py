@@ -0,0 +1,75 @@
+import openpyxl
+import pandas as pd
+import pytest
+
+import sc_file_reader
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    fn = str(tmp_path / 'book.xlsx')
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 's'
+    ws.append(['a', 1, 1.5])
+    ws.append(['b', 2, 2.5])
+    ws.append(['c', None, 3.5])
+    # 区域外的行让整列推断为float，并把工作表扩展到E列
+    ws.append(['d', 0.5, None, None, 'x'])
+    wb.save(fn)
+    return fn
+
+
+def test_read_range_keeps_integer_cells(workbook):
+    reader = sc_file_reader.ExcelReader(workbook)
+    df = reader.read_range('s', pd.IndexSlice[1:2, 'A':'C'])
+    assert df.loc[1, 'B'] == 1 and type(df.loc[1, 'B']) is int
+    assert df['B'].tolist() == [1, 2]
+    assert (df.dtypes == object).all()
+
+    # 单元格值与整表切片相同，只是类型没有被整列推断改变
+    sheet = reader.sheet['s'].loc[1:2, 'A':'C']
+    assert sheet['B'].dtype == float
+    assert df['A'].tolist() == sheet['A'].tolist()
+    assert df[['B', 'C']].astype(float).equals(sheet[['B', 'C']])
+
+
+def test_read_range_returns_trailing_empty_columns(workbook):
+    reader = sc_file_reader.ExcelReader(workbook)
+    df = reader.read_range('s', pd.IndexSlice[1:3, 'B':'E'])
+    assert df.columns.tolist() == ['B', 'C', 'D', 'E']
+    assert df.index.tolist() == [1, 2, 3]
+    assert df[['D', 'E']].isna().all().all()
+    assert df.loc[1, 'B'] == 1
+
+
+def test_read_range_after_sheet_is_parsed(workbook):
+    reader = sc_file_reader.ExcelReader(workbook)
+    reader.sheet['s']
+    df = reader.read_range('s', pd.IndexSlice[1:3, 'A':'B'])
+    assert df['B'].tolist()[:2] == [1, 2] and pd.isna(df.loc[3, 'B'])
+
+
+def test_parse_cache_is_keyed_by_engine(workbook, tmp_path, monkeypatch):
+    monkeypatch.setattr(sc_file_reader, '_parse_cache', sc_file_reader.ParseCache(str(tmp_path / 'cache'), secret=b'k'))
+    engines = []
+    parse = sc_file_reader.ExcelReader._ExcelReader__parse
+
+    def spy(reader, *args):
+        engines.append(reader._engine)
+        return parse(reader, *args)
+
+    monkeypatch.setattr(sc_file_reader.ExcelReader, '_ExcelReader__parse', spy)
+
+    # read_range、cut和sheet都经过open，共用同一份缓存
+    expected = sc_file_reader.ExcelReader(workbook, engine='openpyxl').read_range('s', pd.IndexSlice[1:2, 'A':'C'])
+    df = sc_file_reader.ExcelReader(workbook, engine='openpyxl').cut('s', pd.IndexSlice[1:2, 'A':'C'])
+    assert engines == ['openpyxl']
+    assert df.values.tolist() == expected.iloc[1:].values.tolist()
+
+    # 其他引擎的读取器不能拿到openpyxl的解析结果
+    sc_file_reader.ExcelReader(workbook, engine=None).read_range('s', pd.IndexSlice[1:2, 'A':'C'])
+    assert engines == ['openpyxl', None]
+    sc_file_reader.ExcelReader(workbook, engine=None).sheet['s']
+    sc_file_reader.ExcelReader(workbook, engine='openpyxl').sheet['s']
+    assert engines == ['openpyxl', None, None, 'openpyxl']
@@ -0,0 +1,70 @@
+import os
+import hashlib
+
+import pytest
+
+from sc_file_reader import FileReader
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    fn = str(tmp_path / 'a.bin')
+    data = os.urandom(4096)
+    with open(fn, 'wb') as f:
+        f.write(data)
+    # 修改时间设为一小时前，视为已经写完
+    old = os.stat(fn).st_mtime - 3600
+    os.utime(fn, (old, old))
+    return fn, data
+
+
+def test_small_file_is_read_into_memory(data_file):
+    fn, data = data_file
+    with FileReader(fn) as reader:
+        assert reader._mmap is None
+        assert reader.md5 == hashlib.md5(data).hexdigest()
+        assert reader.stream().read() == data
+
+
+def test_large_stable_file_is_mapped(data_file, monkeypatch):
+    fn, data = data_file
+    monkeypatch.setattr(FileReader, 'mmap_threshold', 1024)
+    with FileReader(fn) as reader:
+        assert reader._mmap is not None
+        assert reader.md5 == hashlib.md5(data).hexdigest()
+        assert reader.view.tobytes() == data
+
+
+def test_recently_modified_file_is_not_mapped(data_file, monkeypatch):
+    fn, data = data_file
+    monkeypatch.setattr(FileReader, 'mmap_threshold', 1024)
+    os.utime(fn)
+    with FileReader(fn) as reader:
+        assert reader._mmap is None
+
+
+def test_file_changed_while_hashing_falls_back_to_read(data_file, monkeypatch):
+    fn, data = data_file
+    monkeypatch.setattr(FileReader, 'mmap_threshold', 1024)
+    original = FileReader._FileReader__hash
+    appended = []
+
+    def hash_and_append(self, view):
+        if not appended:
+            appended.append(True)
+            with open(fn, 'ab') as f:
+                f.write(b'tail')
+        return original(self, view)
+
+    monkeypatch.setattr(FileReader, '_FileReader__hash', hash_and_append)
+    with FileReader(fn) as reader:
+        assert reader._mmap is None
+        assert reader.md5 == hashlib.md5(data + b'tail').hexdigest()
+
+
+def test_empty_file(tmp_path):
+    fn = str(tmp_path / 'empty.txt')
+    open(fn, 'wb').close()
+    with FileReader(fn) as reader:
+        assert reader.md5 == hashlib.md5(b'').hexdigest()
+        assert len(reader.view) == 0
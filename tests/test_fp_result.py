@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import uc_fam_fp_result
+
+
+def append_rows(data):
+    # 逐行调用tables_append作为对照
+    info = uc_fam_fp_result.OptionBaseInfo()
+    for row in data:
+        info.tables_append('名义本金流水', row)
+    return info.result['extractTables']
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_tables_extend_uses_positions_not_index(columnar):
+    info = uc_fam_fp_result.OptionBaseInfo(columnar=columnar)
+    info.tables_extend('名义本金流水', {
+        '合约编号': pd.Series(['a', 'b', 'c'], index=[10, 11, 12]),
+        '起始日': pd.Series(pd.to_datetime(['2024-01-01', '2024-01-02', '2024-01-03']), index=[2, 1, 0]),
+        '到期日': pd.Timestamp('2024-12-31'),
+        '余额': np.array([1.5, 2.5, 3.5])
+    })
+    assert info.result['extractTables'] == append_rows([
+        {'合约编号': 'a', '起始日': pd.Timestamp('2024-01-01'), '到期日': pd.Timestamp('2024-12-31'), '余额': 1.5},
+        {'合约编号': 'b', '起始日': pd.Timestamp('2024-01-02'), '到期日': pd.Timestamp('2024-12-31'), '余额': 2.5},
+        {'合约编号': 'c', '起始日': pd.Timestamp('2024-01-03'), '到期日': pd.Timestamp('2024-12-31'), '余额': 3.5}])
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_tables_extend_scalars_and_lists(columnar):
+    info = uc_fam_fp_result.OptionBaseInfo(columnar=columnar)
+    info.tables_extend('名义本金流水', {'合约编号': 'a', '起始日': None, '到期日': None, '余额': 1})
+    info.tables_extend('名义本金流水', {'合约编号': ['b', 'c'], '起始日': None, '到期日': None, '余额': [2, None]})
+    assert info.result['extractTables'] == append_rows([
+        {'合约编号': 'a', '起始日': None, '到期日': None, '余额': 1},
+        {'合约编号': 'b', '起始日': None, '到期日': None, '余额': 2},
+        {'合约编号': 'c', '起始日': None, '到期日': None, '余额': None}])
+
+
+def test_tables_extend_checks_lengths_and_skips_empty():
+    info = uc_fam_fp_result.OptionBaseInfo(columnar=True)
+    with pytest.raises(Exception, match='长度'):
+        info.tables_extend('名义本金流水', {'合约编号': ['a', 'b'], '起始日': None, '到期日': None, '余额': [1]})
+
+    info.tables_extend('名义本金流水', pd.DataFrame(columns=['合约编号', '起始日', '到期日', '余额']))
+    info.tables_extend('名义本金流水', {'合约编号': [], '起始日': None, '到期日': None, '余额': []})
+    assert '名义本金流水' not in info.result['extractTables']
+
+
+def test_column_keeps_values_of_chunks_with_different_dtypes():
+    table = uc_fam_fp_result.ColumnTable(['a', 'b'])
+    table.extend({'a': np.array([1, 2]), 'b': pd.Series(pd.to_datetime(['2024-01-01', '2024-01-02']))})
+    table.extend({'a': np.array([1.5]), 'b': ['x']})
+    table.append({'a': None, 'b': pd.Timestamp('2024-01-03')})
+
+    a = table.column('a').tolist()
+    assert a == [1, 2, 1.5, None] and [type(v) for v in a[:2]] == [int, int]
+    assert table.to_rows(uc_fam_fp_result._date_format) == [
+        {'a': 1, 'b': '2024-01-01'}, {'a': 2, 'b': '2024-01-02'}, {'a': 1.5, 'b': 'x'}, {'a': None, 'b': '2024-01-03'}]
+
+
+def test_column_does_not_upcast_numeric_chunks():
+    table = uc_fam_fp_result.ColumnTable(['a'])
+    table.extend({'a': np.array([1, 2])})
+    table.extend({'a': np.array([1.5])})
+    assert table[0] == {'a': 1} and table.columns() == {'a': [1, 2, 1.5]}
+    assert [type(v) for v in table.column('a').tolist()] == [int, int, float]
+
+
+def test_column_keeps_dtype_of_chunks_with_same_dtype():
+    table = uc_fam_fp_result.ColumnTable(['a'])
+    table.extend({'a': np.array([1, 2])})
+    table.extend({'a': np.array([3])})
+    assert table.column('a').dtype == np.int64 and table.column('a').tolist() == [1, 2, 3]
@@ -0,0 +1,63 @@
+import os
+import pickle
+
+import pandas as pd
+
+import sc_file_reader
+
+loaded = []
+
+
+class Payload:
+    def __reduce__(self):
+        return loaded.append, ('executed',)
+
+
+def test_roundtrip(tmp_path):
+    cache = sc_file_reader.ParseCache(str(tmp_path), secret=b'k')
+    df = pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']})
+    key = cache.key('md5', 'excel', sheet_name='s')
+    assert cache.put(key, df)
+    assert cache.get(key).equals(df)
+
+
+def test_unsigned_or_foreign_entries_are_not_unpickled(tmp_path):
+    cache = sc_file_reader.ParseCache(str(tmp_path), secret=b'k')
+    key = cache.key('md5', 'excel', sheet_name='s')
+    path = os.path.join(str(tmp_path), key + '.pkl')
+
+    # 共享目录中被他人放入的pickle文件
+    with open(path, 'wb') as f:
+        f.write(b'\0' * 32 + pickle.dumps(Payload()))
+    assert cache.get(key) is None
+
+    # 用其他密钥签名的条目
+    sc_file_reader.ParseCache(str(tmp_path), secret=b'other').put(key, Payload())
+    assert cache.get(key) is None
+
+    # 篡改过的条目
+    cache.put(key, [1, 2, 3])
+    with open(path, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b'\0')
+    assert cache.get(key) is None
+    assert loaded == []
+
+
+def test_default_secret_is_shared_by_processes_of_the_same_user(tmp_path, monkeypatch):
+    monkeypatch.delenv('SC_PARSE_CACHE_KEY', raising=False)
+    monkeypatch.setattr(sc_file_reader, '_cache_key_file', str(tmp_path / 'key'))
+    a = sc_file_reader.ParseCache(str(tmp_path / 'c'))
+    b = sc_file_reader.ParseCache(str(tmp_path / 'c'))
+    assert a.secret == b.secret and len(a.secret) == 32
+    assert os.stat(str(tmp_path / 'key')).st_mode & 0o077 == 0
+    a.put('k', {'x': 1})
+    assert b.get('k') == {'x': 1}
+
+
+def test_words_keep_all_attributes_until_pickled():
+    char = {'x0': 1.0, 'top': 2.0, 'text': 'a', 'graphicstate': {'ncs': object()}}
+    word = sc_file_reader.Word('ab', char)
+    assert word['graphicstate'] is char['graphicstate']
+    restored = pickle.loads(pickle.dumps(word))
+    assert restored['x0'] == 1.0 and 'graphicstate' not in restored
@@ -0,0 +1,55 @@
+import pytest
+
+import sc_file_reader
+
+
+def make_pdf(fn, lines):
+    # 只有文字的单页pdf
+    content = 'BT /F1 12 Tf 72 720 Td 14 TL ' + ' '.join('(%s) Tj T*' % line for line in lines) + ' ET'
+    objects = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        '<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R '
+        '/Resources << /Font << /F1 5 0 R >> >> >>',
+        '<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content),
+        '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>'
+    ]
+    out = b'%PDF-1.4\n'
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += ('%d 0 obj\n%s\nendobj\n' % (i, obj)).encode('latin-1')
+    xref = len(out)
+    out += ('xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)).encode('latin-1')
+    out += ''.join('%010d 00000 n \n' % o for o in offsets).encode('latin-1')
+    out += ('trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)).encode('latin-1')
+    with open(fn, 'wb') as f:
+        f.write(out)
+
+
+@pytest.fixture
+def pdf_file(tmp_path):
+    fn = str(tmp_path / 'a.pdf')
+    make_pdf(fn, ['Account 12345', 'Balance 100.00'])
+    return fn
+
+
+def test_page_layout_is_released_after_extraction(pdf_file):
+    with sc_file_reader.PdfReader(pdf_file) as reader:
+        page = reader.pages[0]
+        assert page.text_lines == ['Account 12345', 'Balance 100.00']
+        assert page.get_value('Account') == '12345'
+        plumber_page = reader.pdf.pages[0]
+        assert [p for p in plumber_page.cached_properties if hasattr(plumber_page, p)] == []
+        assert page.tables == []
+
+
+def test_close_closes_document(pdf_file):
+    reader = sc_file_reader.PdfReader(pdf_file)
+    reader.pages[0].text
+    pdf = reader.pdf
+    closed = []
+    pdf.close = lambda: closed.append(True)
+    with reader:
+        pass
+    assert closed == [True]
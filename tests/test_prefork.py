@@ -0,0 +1,43 @@
+import gc
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import prefork
+
+
+def test_request_counter_signals_once_under_concurrency(monkeypatch):
+    kills = []
+    monkeypatch.setattr(prefork.os, 'kill', lambda pid, sig: kills.append(sig))
+    counter = prefork._RequestCounter(lambda environ, start_response: b'ok', 50)
+
+    # 频繁切换线程，放大计数的竞争
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(8) as exe:
+            results = list(exe.map(lambda _: counter({}, None), range(200)))
+    finally:
+        sys.setswitchinterval(interval)
+    assert results == [b'ok'] * 200
+    assert kills == [prefork.signal.SIGTERM]
+
+
+def test_reload_does_not_freeze_garbage():
+    server = prefork.PreforkServer(None, '127.0.0.1', 0, 0)
+    # 关闭自动回收，垃圾只能靠reload中的显式回收释放
+    gc.disable()
+    try:
+        server._PreforkServer__reload()
+        frozen = gc.get_freeze_count()
+
+        def make_garbage():
+            for _ in range(5000):
+                cycle = []
+                cycle.append(cycle)
+
+        server = prefork.PreforkServer(None, '127.0.0.1', 0, 0, on_reload=make_garbage)
+        server._PreforkServer__reload()
+        assert gc.get_freeze_count() < frozen + 1000
+    finally:
+        gc.unfreeze()
+        gc.enable()
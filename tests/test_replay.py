@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+import replay
+
+
+@pytest.fixture
+def capture(tmp_path):
+    fn = tmp_path / 'capture.jsonl'
+    reqs = [
+        {'time': 3, 'func_name': 'execute', 'kwargs': {'object_id': 'a'}},
+        {'time': 1, 'func_name': 'update', 'kwargs': {'object_id': 'a'}},
+        {'time': 2, 'func_name': 'query', 'kwargs': {}},
+        {'time': 4, 'func_name': 'clear_cache', 'kwargs': {}}
+    ]
+    fn.write_text('\n'.join(json.dumps(r) for r in reqs) + '\n', encoding='utf-8')
+    return str(fn)
+
+
+def test_writes_are_skipped_by_default(capture):
+    requests, skipped = replay.load_capture(capture)
+    assert [r['func_name'] for r in requests] == ['query', 'execute']
+    assert skipped == 2
+
+    requests, skipped = replay.load_capture(capture, allow_writes=True)
+    assert [r['func_name'] for r in requests] == ['update', 'query', 'execute', 'clear_cache']
+    assert skipped == 0
+
+
+def test_replay_refuses_writes_without_flag(capture):
+    requests, _ = replay.load_capture(capture, allow_writes=True)
+    with pytest.raises(ValueError):
+        replay.replay('http://127.0.0.1:1', requests)
+
+
+def test_debug_and_trace_need_allow_writes(tmp_path):
+    fn = tmp_path / 'capture.jsonl'
+    reqs = [{'time': i, 'func_name': name, 'kwargs': {}} for i, name in enumerate(['debug', 'trace', 'execute'])]
+    fn.write_text('\n'.join(json.dumps(r) for r in reqs) + '\n', encoding='utf-8')
+    requests, skipped = replay.load_capture(str(fn))
+    assert [r['func_name'] for r in requests] == ['execute'] and skipped == 2
@@ -0,0 +1,122 @@
+import os
+import socket
+import time
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+
+from mce.db_models import create_tables, MceSchedule, MceScheduleHistory
+from mce.db_operator import DBOperator
+from mce.scheduler import CronRule, Scheduler
+
+
+def test_cron_rule():
+    rule = CronRule('*/15 9-17 * * 1-5')
+    assert rule.match(datetime(2026, 10, 19, 9, 30))
+    assert not rule.match(datetime(2026, 10, 19, 9, 31))
+    assert not rule.match(datetime(2026, 10, 18, 9, 30))
+
+    # 日和周都有限制时满足其一即可，0和7都表示周日
+    rule = CronRule('0 0 1 * 7')
+    assert rule.match(datetime(2026, 10, 1))
+    assert rule.match(datetime(2026, 10, 18))
+    assert not rule.match(datetime(2026, 10, 19))
+
+    assert CronRule('5 * * * *').match(datetime(2026, 10, 19, 3, 5))
+    for expr in ('* * * *', '60 * * * *', '*/0 * * * *', '5-1 * * * *'):
+        with pytest.raises(ValueError):
+            CronRule(expr)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine('sqlite:///' + str(tmp_path / 'mce.db'))
+    create_tables(engine)
+    return engine
+
+
+def wait_idle(*schedulers):
+    deadline = time.time() + 5
+    while any(s.running for s in schedulers) and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_each_fire_runs_once_per_process(engine):
+    DBOperator(engine, MceSchedule).add(schedule_id='s', cron='* * * * *', object_id='a', params='[{"x": 1}]')
+    calls = []
+    # 同一节点上的多个工作进程各自预热自己的缓存
+    schedulers = [Scheduler(engine, lambda co_id, **kw: calls.append(kw), enabled=False) for _ in range(3)]
+
+    now = datetime(2026, 10, 19, 9, 30)
+    started = [s.tick(now) for s in schedulers]
+    wait_idle(*schedulers)
+    assert started == [['s'], ['s'], ['s']]
+    assert calls == [{'x': 1}] * 3
+
+    # 同一进程同一次触发只执行一次
+    assert schedulers[0].tick(now) == []
+    wait_idle(*schedulers)
+    assert len(calls) == 3
+    history = DBOperator(engine, MceScheduleHistory).query()
+    assert len({h.node_id for h in history}) == 3
+
+
+def test_each_fire_runs_once_per_node(engine):
+    DBOperator(engine, MceSchedule).add(schedule_id='s', cron='* * * * *', object_id='a', params='[{"x": 1}]')
+    calls = []
+    # 开启共享结果库时同一节点只需一个进程执行
+    schedulers = [Scheduler(engine, lambda co_id, **kw: calls.append(kw), enabled=False, scope='node')
+                  for _ in range(3)]
+
+    now = datetime(2026, 10, 19, 9, 30)
+    started = [s.tick(now) for s in schedulers]
+    wait_idle(*schedulers)
+    assert sorted(map(len, started)) == [0, 0, 1]
+    assert calls == [{'x': 1}]
+
+    schedulers[1].tick(now + timedelta(minutes=1))
+    wait_idle(*schedulers)
+    assert len(calls) == 2
+    history = DBOperator(engine, MceScheduleHistory).query()
+    assert sorted(h.status for h in history) == ['success', 'success']
+
+
+def test_recover_marks_interrupted_runs_failed(engine):
+    history = DBOperator(engine, MceScheduleHistory)
+    host = socket.gethostname()
+    now = datetime.now()
+    history.add(run_id='alive', schedule_id='s', node_id='%s:%d:x' % (host, os.getpid()), status='running',
+                start_time=now)
+    history.add(run_id='dead', schedule_id='s', node_id='%s:%d:x' % (host, 2 ** 22 + 1), status='running',
+                start_time=now)
+    history.add(run_id='remote', schedule_id='s', node_id='other:1:x', status='running', start_time=now)
+    history.add(run_id='stale', schedule_id='s', node_id='other:1:x', status='running',
+                start_time=now - timedelta(days=1))
+
+    # 启动时标记
+    Scheduler(engine, None, enabled=False)
+    status = {h.run_id: h.status for h in history.query()}
+    assert status == {'alive': 'running', 'dead': 'failed', 'remote': 'running', 'stale': 'failed'}
+
+
+def test_invalid_scope(engine):
+    with pytest.raises(ValueError):
+        Scheduler(engine, None, enabled=False, scope='cluster')
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='需要fork')
+def test_stopped_master_does_not_tick_but_forked_worker_does(engine):
+    scheduler = Scheduler(engine, None)
+    assert scheduler.ticking
+    # prefork主进程派生工作进程前停止
+    scheduler.stop_ticking()
+    assert not scheduler.ticking
+
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if scheduler.ticking else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert not scheduler.ticking
@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+import pytest
+
+from mce.code_parser import CalcObjectManager
+from mce.shared_cache import SharedResultStore, make_shared_key
+
+
+@pytest.fixture
+def store():
+    s = SharedResultStore(1024 * 1024, max_entries=16)
+    yield s
+    s.close()
+
+
+def test_expired_result_is_not_returned(store):
+    key = make_shared_key('a', x=1)
+    assert store.put(key, np.arange(10), 'a', ttl_seconds=0.05)
+    assert store.get(key) is not None
+    time.sleep(0.1)
+    assert store.get(key) is None
+    # 过期后可以重新存放
+    assert store.put(key, np.arange(5), 'a', ttl_seconds=60)
+    assert len(store.get(key)) == 5
+
+
+def test_release_after_clear_does_not_touch_new_entry(store):
+    key = make_shared_key('a', x=1)
+    store.put(key, np.arange(10), 'a')
+    old = store.get(key)
+    store.clear('a')
+    store.put(key, np.arange(3), 'a')
+    new = store.get(key)
+    del old
+    # 旧结果回收后新结果的引用计数不变，不会被当作未引用淘汰
+    store.release(key)
+    store.release(key)
+    assert store.get(key) is not None
+    assert new.tolist() == [0, 1, 2]
+
+
+def test_set_and_delete_clear_shared_results(store):
+    manager = CalcObjectManager(3600)
+    manager.shared_store = store
+    manager.set('a', py_code='import numpy as np', py_expr='np.full(3, x)', lru_maxsize=8, ttl_seconds=60)
+    assert manager.eval('a', x=1).tolist() == [1, 1, 1]
+    assert store.size == 1
+
+    # 修改代码后，其他进程也不能再从共享结果库读到旧结果
+    manager.set('a', py_code='import numpy as np', py_expr='np.full(3, x * 2)', lru_maxsize=8, ttl_seconds=60)
+    assert store.size == 0
+    assert manager.eval('a', x=1).tolist() == [2, 2, 2]
+    assert store.size == 1
+
+    manager.delete('a')
+    assert store.size == 0
+
+
+def test_result_cleared_between_put_and_get_is_still_returned(store, monkeypatch):
+    manager = CalcObjectManager(3600)
+    manager.shared_store = store
+    manager.set('a', py_code='import numpy as np', py_expr='np.full(3, x)', lru_maxsize=8, ttl_seconds=60)
+
+    put = store.put
+
+    def put_then_clear(*args, **kwargs):
+        # 其他进程在本进程存入后、读取前清除了结果
+        ret = put(*args, **kwargs)
+        store.clear('a')
+        return ret
+
+    monkeypatch.setattr(store, 'put', put_then_clear)
+    assert manager.eval('a', x=1).tolist() == [1, 1, 1]
+    assert store.size == 0
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+import sc_file_reader
+
+_text = '基金名称: 私募一号\n估值日期：2024-02-28\r\n单位净值 1.0234\n\n累计单位净值 1.2345\r资产净值: 100,000.00\n估值日期：2024-02-29\n'
+
+
+def outcome(func, *args):
+    # 值后面只有空白时原来的实现会抛出IndexError，同样保留
+    try:
+        return func(*args)
+    except IndexError as e:
+        return type(e)
+
+
+def plain_reader(text):
+    reader = sc_file_reader.TextReader(text)
+    reader.index_enabled = False
+    return reader
+
+
+def test_get_values_matches_get_value():
+    keys = ['单位净值', '累计单位净值', '净值', '估值日期：', '资产净值:', '不存在', '', '1.0', '\n\n', '值 1']
+    expected = {key: plain_reader(_text).get_value(key) for key in keys}
+    reader = sc_file_reader.TextReader(_text)
+    assert reader.get_values(keys) == expected
+    assert reader.get_values(keys, sep='\n') == {key: plain_reader(_text).get_value(key, '\n') for key in keys}
+    assert reader.get_values(reversed(keys)) == expected
+
+
+def test_get_values_overlapping_keys_on_random_text():
+    rnd = random.Random(1)
+    for _ in range(200):
+        text = ''.join(rnd.choice('ab \n') for _ in range(rnd.randint(0, 30)))
+        keys = [''.join(rnd.choice('ab ') for _ in range(rnd.randint(1, 3))) for _ in range(5)]
+        reader, plain = sc_file_reader.TextReader(text), plain_reader(text)
+        if outcome(plain_reader(text).get_values, keys) is IndexError:
+            assert outcome(reader.get_values, keys) is IndexError
+        else:
+            assert reader.get_values(keys) == {k: plain.get_value(k) for k in keys}
+
+
+@pytest.mark.parametrize('bool_func', [all, any])
+def test_index_of_matches_line_scan(bool_func):
+    rnd = random.Random(2)
+    for _ in range(300):
+        text = ''.join(rnd.choice('ab\n\r') for _ in range(rnd.randint(0, 30)))
+        reader = sc_file_reader.TextReader(text)
+        for _ in range(5):
+            args = [''.join(rnd.choice('ab\n') for _ in range(rnd.randint(0, 2))) for _ in range(rnd.randint(1, 3))]
+            assert reader.index_of(*args, bool_func=bool_func) == plain_reader(text).index_of(*args, bool_func=bool_func)
+
+
+def test_index_of_stops_at_first_match(monkeypatch):
+    text = 'x\nkey\n' + 'key\n' * 1000
+    reader = sc_file_reader.TextReader(text)
+    assert reader.index_of('key') == 1
+    found, pos = reader._TextReader__arg_lines['key']
+    assert found == [1] and pos == len('x\nkey\n')
+    assert reader.index_of('key', 'x') == -1
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+from mce.code_parser import CalcObjectManager, CalcTimeoutError
+
+_loop = '''
+def spin(n):
+    while True:
+        check_timeout()
+'''
+
+
+@pytest.fixture
+def manager():
+    m = CalcObjectManager(3600, timeout_workers=2)
+    m.set('add', py_expr='x + 1')
+    m.set('coop', py_code=_loop, py_expr='spin(x)')
+    m.set('sleep', py_code='import time', py_expr='time.sleep(x) or x')
+    m.set('sleep2', py_code='import time', py_expr='time.sleep(x) or x')
+    m.set('forever', py_expr='[i for i in iter(int, 1)]')
+    return m
+
+
+def test_cooperative_timeout_keeps_thread_mode(manager):
+    with pytest.raises(CalcTimeoutError):
+        manager.eval_with_timeout('coop', 0.2, x=1)
+    time.sleep(0.1)
+    assert manager.eval_with_timeout('add', 1, x=1) == 2
+    # 执行线程在截止时间后很快结束，没有被标记为不能协作取消
+    start = time.time()
+    with pytest.raises(CalcTimeoutError):
+        manager.eval_with_timeout('coop', 0.2, x=2)
+    assert time.time() - start < 1
+
+
+def test_non_cooperative_object_moves_to_isolate_mode(manager):
+    with pytest.raises(CalcTimeoutError):
+        manager.eval_with_timeout('sleep', 0.2, x=3)
+    # 之后的调用在子进程中执行，超时直接杀掉
+    assert manager.eval_with_timeout('sleep', 5, x=0.01) == 0.01
+    start = time.time()
+    with pytest.raises(CalcTimeoutError):
+        manager.eval_with_timeout('sleep', 0.5, x=30)
+    assert time.time() - start < 5
+
+
+def test_isolate_kills_infinite_loop(manager):
+    assert manager.eval_with_timeout('add', 10, isolate=True, x=1) == 2
+    start = time.time()
+    with pytest.raises(CalcTimeoutError):
+        manager.eval_with_timeout('forever', 0.5, isolate=True)
+    assert time.time() - start < 5
+
+    # 修改对象后子进程使用新代码
+    manager.set('add', py_expr='x + 2')
+    assert manager.eval_with_timeout('add', 10, isolate=True, x=1) == 3
+
+
+def test_queued_call_is_cancelled_when_pool_is_busy(manager):
+    for co_id in ('sleep', 'sleep2'):
+        with pytest.raises(CalcTimeoutError):
+            manager.eval_with_timeout(co_id, 0.1, x=1)
+    # 两个执行线程都被占用，排队的调用超时后被取消，不会再执行
+    start = time.time()
+    with pytest.raises(CalcTimeoutError):
+        manager.eval_with_timeout('add', 0.1, x=1)
+    assert time.time() - start < 0.5
+
+
+def test_cache_lock_is_released_while_computing():
+    m = CalcObjectManager(3600)
+    m.set('slow', py_code='import time', py_expr='time.sleep(x) or x', lru_maxsize=8, ttl_seconds=60)
+    with pytest.raises(CalcTimeoutError):
+        m.eval_with_timeout('slow', 0.1, x=1)
+    # 超时的执行线程仍在计算，其他参数的调用不被缓存锁阻塞
+    start = time.time()
+    assert m.eval('slow', x=0) == 0
+    assert time.time() - start < 0.5
+
+
+def test_result_past_deadline_is_not_cached():
+    m = CalcObjectManager(3600)
+    m.set('slow', py_code='import time', py_expr='time.sleep(x) or x', lru_maxsize=8, ttl_seconds=60,
+          timeout_seconds=0.2)
+    m.set('outer', py_expr='coe("slow", x=x)')
+    for _ in range(2):
+        # 不能协作取消的对象执行完才发现超时，结果没有进入缓存，下次调用同样超时
+        with pytest.raises(CalcTimeoutError):
+            m.eval('outer', x=0.4)
+    assert m.get('slow').cache.stats['size'] == 0
+    assert m.eval('outer', x=0.01) == 0.01
@@ -0,0 +1,29 @@
+from mce.code_parser import CalcObjectManager
+
+
+def test_slow_call_records_its_own_call_tree():
+    manager = CalcObjectManager(3600)
+    manager.trace_log.configure(sample_rate=0.0, slow_seconds=0.05)
+    manager.set('leaf', py_code='import time', py_expr='time.sleep(0.1) or x', lru_maxsize=8, ttl_seconds=60)
+    manager.set('root', py_expr='coe("leaf", x=x) + 1', lru_maxsize=8, ttl_seconds=60)
+
+    assert manager.eval('root', x=1) == 2
+    records = manager.trace_log.get(slow_only=True)
+    assert len(records) == 1
+    assert not records[0]['is_sampled']
+    frames = {f['co_id']: f for f in records[0]['trace_info']}
+    assert frames['leaf']['spend_time'] >= 0.05
+    assert frames['leaf']['parent_sn'] == frames['root']['sn']
+
+    # 第二次命中缓存，不是慢调用
+    manager.eval('root', x=1)
+    assert len(manager.trace_log.get()) == 1
+
+
+def test_fast_unsampled_calls_are_not_recorded():
+    manager = CalcObjectManager(3600)
+    manager.set('a', py_expr='x + 1')
+    assert manager.eval('a', x=1) == 2
+    manager.trace_log.configure(slow_seconds=10)
+    assert manager.eval('a', x=2) == 3
+    assert manager.trace_log.get() == []
@@ -0,0 +1,56 @@
+import pytest
+
+import sc_file_reader
+
+_text = '账户 12345\r\n余额: 100.00\r\rdate 2024-02-28\nlast line\n'
+
+
+@pytest.mark.parametrize('encoding', ['utf-16-le', 'utf-16-be', 'utf-32-le', 'utf-32-be'])
+def test_detect_bomless_wide_encoding(encoding):
+    data = ('Account 12345\nBalance 100.00\n' * 20).encode(encoding)
+    assert sc_file_reader.detect_encoding(data) == encoding
+    # 样本截断在字符中间
+    assert sc_file_reader.detect_encoding(data, sample_size=101) == encoding
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'gb18030'])
+def test_detect_narrow_encoding(encoding):
+    assert sc_file_reader.detect_encoding(_text.encode(encoding)) == encoding
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'gb18030', 'utf-16-le'])
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 64 * 1024])
+def test_stream_mode_matches_full_text(tmp_path, monkeypatch, encoding, chunk_size):
+    fn = str(tmp_path / 'a.txt')
+    with open(fn, 'wb') as f:
+        f.write((_text * 3).encode(encoding))
+    monkeypatch.setattr(sc_file_reader.TxtReader, '_chunk_size', chunk_size)
+
+    with sc_file_reader.TxtReader(fn) as full, sc_file_reader.TxtReader(fn, stream=True) as stream:
+        assert stream.encoding == full.encoding
+        assert stream.text == full.text
+        assert stream.text_lines == full.text_lines == (_text * 3).splitlines()
+        assert stream.get_value('余额:') == full.get_value('余额:') == '100.00'
+        assert stream.index_of('date') == full.index_of('date')
+
+
+def test_stream_mode_caches_decoded_chunks(tmp_path, monkeypatch):
+    fn = str(tmp_path / 'a.txt')
+    with open(fn, 'wb') as f:
+        f.write((_text * 3).encode('utf-8'))
+
+    opened = []
+    with sc_file_reader.TxtReader(fn, stream=True) as reader:
+        stream = reader.stream
+        monkeypatch.setattr(reader, 'stream', lambda: opened.append(1) or stream())
+        text = reader.text
+        assert reader.text == text and reader.text_lines == text.splitlines()
+        assert reader.get_value('date') == '2024-02-28'
+        assert len(opened) == 1
+
+    opened.clear()
+    with sc_file_reader.TxtReader(fn, stream=True, cache_size=10) as reader:
+        stream = reader.stream
+        monkeypatch.setattr(reader, 'stream', lambda: opened.append(1) or stream())
+        assert reader.text == reader.text
+        assert len(opened) == 2
@@ -0,0 +1,51 @@
+import copy
+import json
+import pickle
+
+import sc_file_reader
+
+
+def make_chars():
+    return [{'text': c, 'x0': 10.0 + i, 'x1': 11.0 + i, 'width': 1.0, 'top': 5.0, 'fontname': 'F1'} for i, c in enumerate('abc')]
+
+
+def test_word_is_compatible_with_word_dict():
+    chars = make_chars()
+    word = sc_file_reader.merge_chars(chars)[0]
+    expected = dict(chars[0], text='abc')
+
+    assert word['text'] == 'abc' and word['x0'] == 10.0 and word.x1 == 11.0
+    assert list(word.keys()) == list(expected.keys())
+    assert dict(word) == expected and word == expected and expected == word
+    assert len(word) == len(expected) and 'fontname' in word and 'missing' not in word
+    assert word.get('missing', 1) == 1
+    assert word.copy() == expected
+    # 不兼容之处：不是dict
+    assert not isinstance(word, dict)
+    assert json.loads(json.dumps(dict(word))) == expected
+
+
+def test_set_item_does_not_change_char():
+    chars = make_chars()
+    word = sc_file_reader.merge_chars(chars)[0]
+    word['x0'] = 0.0
+    word['text'] = 'x'
+    del word['fontname']
+
+    assert word['x0'] == 0.0 and word['text'] == 'x' and 'fontname' not in word
+    assert chars[0] == make_chars()[0]
+
+
+def test_pickle_and_copy():
+    word = sc_file_reader.merge_chars(make_chars())[0]
+    word.char['stream'] = object()
+
+    restored = pickle.loads(pickle.dumps(word))
+    assert restored == {k: v for k, v in word.items() if k != 'stream'}
+    restored['x0'] = 1.0
+    assert word['x0'] == 10.0
+    assert copy.copy(word) == word
+    copied = copy.copy(word)
+    copied['x0'] = 2.0
+    word['top'] = 3.0
+    assert word['x0'] == 10.0 and copied['top'] == 5.0